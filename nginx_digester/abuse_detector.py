@@ -0,0 +1,134 @@
+"""
+Spots abusive IPs as the log streams in, rather than after the fact, so they
+can be denied within seconds of starting.
+
+Each IP gets sliding windows of its recent requests, 4xx failures and unusual
+request lines (as ChronoReqs.is_unusual_meth_path_proto has them, ones with
+more than a method, path and protocol). A window only
+holds as many times as its limit, so memory per IP is bounded, and IPs are
+kept least recently seen first so idle ones can be expired from the front.
+Times come from the log, not the clock, so replaying an old log finds the
+same offenders.
+"""
+
+import datetime
+from collections import OrderedDict, deque
+from typing import Iterable, Iterator, NamedTuple, Optional
+
+from line_parser import format_epoch
+from native_list import ChronoReqs
+
+
+class Limits(NamedTuple):
+    """
+    Counts within a window, not fractions of the IP's requests, so 30
+    failures means 30 4xx responses in any 60 seconds.
+    """
+    window: int = 60  # Seconds.
+    requests: int = 300
+    failures: int = 30
+    unusual: int = 3
+
+
+class BlockCandidate(NamedTuple):
+    ip: str
+    reason: str
+    count: int
+    epoch: int
+    window: int
+
+    def deny_snippet(self) -> str:
+        """
+        :return: line for an nginx deny list, eg. an include in a server block.
+        """
+        return (f"deny {self.ip};  # {self.count} {self.reason} in "
+                f"{self.window}s at {format_epoch(self.epoch)}")
+
+
+class IPWindow:
+    __slots__ = ("requests", "failures", "unusual", "last_seen", "blocked")
+
+    def __init__(self, limits: Limits):
+        self.requests = deque(maxlen=limits.requests)
+        self.failures = deque(maxlen=limits.failures)
+        self.unusual = deque(maxlen=limits.unusual)
+        self.last_seen = 0
+        self.blocked = False
+
+
+def exceeded(times: deque, epoch: int, window: int) -> bool:
+    """
+    Record epoch, then check whether the window's limit has been reached.
+
+    :param times: last limit times, as the deque's maxlen is the limit.
+    """
+    times.append(epoch)
+    return len(times) == times.maxlen and epoch - times[0] < window
+
+
+class AbuseDetector:
+    def __init__(self, limits: Limits = Limits(), max_ips: int = 100_000,
+                 idle: datetime.timedelta = datetime.timedelta(minutes=10)):
+        """
+        :param limits: what counts as abuse.
+        :param max_ips: most IPs to track, the least recently seen are
+            dropped beyond this.
+        :param idle: IPs not seen for this long are dropped.
+        """
+        self.limits = limits
+        self.max_ips = max_ips
+        self.idle = int(idle.total_seconds())
+        self.ips: OrderedDict[str, IPWindow] = OrderedDict()
+
+    def expire(self, now: int):
+        ips = self.ips
+        while ips:
+            oldest = next(iter(ips.values()))
+            if now - oldest.last_seen < self.idle and len(ips) <= self.max_ips:
+                break
+            ips.popitem(last=False)
+
+    def add(self, req: list) -> Optional[BlockCandidate]:
+        """
+        :param req: a request laid out as in ChronoReqs.req_list.
+        :return: a candidate the first time the IP exceeds a limit.
+        """
+        epoch = req[0]
+        ip = req[1].strip()
+        ips = self.ips
+        state = ips.get(ip)
+        if state is None:
+            state = ips[ip] = IPWindow(self.limits)
+            state.last_seen = epoch
+            if len(ips) > self.max_ips or \
+                    epoch - next(iter(ips.values())).last_seen >= self.idle:
+                self.expire(epoch)
+        else:
+            ips.move_to_end(ip)
+            state.last_seen = epoch
+        if state.blocked:
+            return None
+        window = self.limits.window
+        if exceeded(state.requests, epoch, window):
+            reason, count = "requests", len(state.requests)
+        elif len(req) > 4 and 400 <= req[3] < 500 and \
+                exceeded(state.failures, epoch, window):
+            reason, count = "failures", len(state.failures)
+        elif ChronoReqs.is_unusual_meth_path_proto(req) and \
+                exceeded(state.unusual, epoch, window):
+            reason, count = "unusual requests", len(state.unusual)
+        else:
+            return None
+        state.blocked = True
+        return BlockCandidate(ip, reason, count, epoch, window)
+
+    def watch(self, reqs: Iterable[list]) -> Iterator[BlockCandidate]:
+        """
+        :param reqs: eg. ChronoReqs.iter_requests over a followed log.
+        :return: generator of candidates, as soon as each is found.
+        """
+        add = self.add
+        for req in reqs:
+            candidate = add(req)
+            if candidate is not None:
+                yield candidate
@@ -0,0 +1,208 @@
+"""
+Aggregates requests as they stream past, in bounded memory, for when the
+aggregates are all we want and keeping req_list or by_ip would be too big.
+
+Cheap things, like counts by status and bytes per period, are counted exactly.
+Top paths and IPs use Space-Saving, per path estimates a Count-Min sketch and
+distinct IPs HyperLogLog, so memory doesn't grow with the log.
+"""
+
+import datetime
+import hashlib
+import heapq
+import math
+from array import array
+from collections import Counter
+from typing import Hashable, Iterable, Optional
+
+from line_parser import ONE_SECOND, from_epoch, format_epoch
+
+
+def stable_hash(item: str) -> int:
+    """
+    :return: 64 bit hash, unlike hash() the same in every process.
+    """
+    return int.from_bytes(
+        hashlib.blake2b(item.encode(), digest_size=8).digest(), "big")
+
+
+class SpaceSaving:
+    """
+    Approximate top-k (Metwally et al.). Any item occurring more than n/k
+    times is guaranteed to be held; counts may overestimate by at most the
+    smallest count held.
+
+    The smallest count is found with a lazy min-heap, holding each item once
+    with what its count was when pushed. Counts only grow, so an entry whose
+    count is out of date is pushed back with the current one, and each
+    eviction costs O(log k) amortised, rather than a scan of all k.
+    """
+    def __init__(self, k: int = 100):
+        self.k = k
+        self.counts: dict[Hashable, int] = {}
+        self.errors: dict[Hashable, int] = {}
+        # [count when pushed, tie breaker, item], as items needn't be orderable.
+        self.heap: list[tuple[int, int, Hashable]] = []
+        self.pushes = 0
+
+    def add(self, item: Hashable, count: int = 1):
+        counts = self.counts
+        if item in counts:
+            counts[item] += count
+            return
+        if len(counts) < self.k:
+            min_count = 0
+        else:
+            heap = self.heap
+            while True:
+                min_count, _, evicted = heap[0]
+                if counts[evicted] == min_count:
+                    break
+                self.pushes += 1
+                heapq.heapreplace(heap, (counts[evicted], self.pushes, evicted))
+            heapq.heappop(heap)
+            del counts[evicted]
+            del self.errors[evicted]
+        counts[item] = min_count + count
+        self.errors[item] = min_count
+        self.pushes += 1
+        heapq.heappush(self.heap, (counts[item], self.pushes, item))
+
+    def most_common(self, n: Optional[int] = None) -> list[tuple[Hashable, int]]:
+        return Counter(self.counts).most_common(n)
+
+
+class CountMinSketch:
+    """
+    Estimates any item's count, never underestimating, and overestimating by
+    at most 2n/width with probability 1 - 0.5^depth.
+    """
+    def __init__(self, width: int = 2048, depth: int = 5):
+        self.width = width
+        self.depth = depth
+        self.table = array("Q", bytes(8 * width * depth))
+
+    def _cells(self, item: str) -> Iterable[int]:
+        # Double hashing stands in for depth independent hashes.
+        h = stable_hash(item)
+        h1, h2 = h >> 32, (h & 0xFFFFFFFF) | 1
+        return ((row * self.width) + (h1 + row * h2) % self.width
+                for row in range(self.depth))
+
+    def add(self, item: str, count: int = 1):
+        for cell in self._cells(item):
+            self.table[cell] += count
+
+    def estimate(self, item: str) -> int:
+        return min(self.table[cell] for cell in self._cells(item))
+
+
+class HyperLogLog:
+    """
+    Estimates distinct items to within about 1.04 / sqrt(2^precision).
+    """
+    def __init__(self, precision: int = 14):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, item: str):
+        h = stable_hash(item)
+        register = h >> (64 - self.precision)
+        rest_bits = 64 - self.precision
+        rest = h & ((1 << rest_bits) - 1)
+        rank = rest_bits - rest.bit_length() + 1
+        if rank > self.registers[register]:
+            self.registers[register] = rank
+
+    def __len__(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return round(estimate)
+
+
+class StreamingSummary:
+    def __init__(self, period: datetime.timedelta = datetime.timedelta(hours=1),
+                 k: int = 100):
+        """
+        :param period: width of the buckets bytes are totalled in.
+        :param k: how many top paths and IPs to track.
+        """
+        self.step = period // ONE_SECOND
+        if self.step < 1:
+            raise ValueError("period must be at least a second")
+        self.total = 0
+        self.status_counts = Counter()
+        self.bytes_per_period: dict[int, int] = {}
+        self.top_paths = SpaceSaving(k)
+        self.top_ips = SpaceSaving(k)
+        self.top_failing_ips = SpaceSaving(k)
+        self.path_counts = CountMinSketch()
+        self.distinct_ips = HyperLogLog()
+        self.first_epoch: Optional[int] = None
+        self.last_epoch: Optional[int] = None
+
+    def add(self, req: list):
+        """
+        :param req: a request laid out as in ChronoReqs.req_list.
+        """
+        epoch = req[0]
+        ip = req[1].strip()
+        self.total += 1
+        if self.first_epoch is None or epoch < self.first_epoch:
+            self.first_epoch = epoch
+        if self.last_epoch is None or epoch > self.last_epoch:
+            self.last_epoch = epoch
+        self.top_ips.add(ip)
+        self.distinct_ips.add(ip)
+        if len(req) < 5:
+            return
+        code = req[3]
+        self.status_counts[code] += 1
+        if 400 <= code < 500:
+            self.top_failing_ips.add(ip)
+        bucket = epoch - epoch % self.step
+        self.bytes_per_period[bucket] = self.bytes_per_period.get(bucket, 0) + req[4]
+        if len(req[2]) > 2:
+            self.top_paths.add(req[2][1])
+            self.path_counts.add(req[2][1])
+
+    def consume(self, reqs: Iterable[list]) -> "StreamingSummary":
+        """
+        :param reqs: eg. ChronoReqs.iter_requests, so nothing is retained.
+        """
+        for req in reqs:
+            self.add(req)
+        return self
+
+    def top_path_counts(self, n: Optional[int] = None) -> list[tuple[str, int]]:
+        """
+        Space-Saving and the Count-Min sketch both overestimate, so the smaller
+        of the two is the tighter count.
+        """
+        path_counts = self.path_counts
+        return Counter({path: min(count, path_counts.estimate(path))
+                        for path, count in self.top_paths.counts.items()}
+                       ).most_common(n)
+
+    def report(self, n: int = 20) -> dict:
+        """
+        :param n: how many top paths and IPs to include.
+        :return: JSON serialisable summary.
+        """
+        return {
+            "requests": self.total,
+            "first": None if self.first_epoch is None else format_epoch(self.first_epoch),
+            "last": None if self.last_epoch is None else format_epoch(self.last_epoch),
+            "distinct_ips": len(self.distinct_ips),
+            "status_counts": {str(k): v for k, v in sorted(self.status_counts.items())},
+            "failures": sum(v for k, v in self.status_counts.items() if 400 <= k < 500),
+            "top_paths": self.top_path_counts(n),
+            "top_ips": self.top_ips.most_common(n),
+            "top_failing_ips": self.top_failing_ips.most_common(n),
+            "bytes_per_period": {from_epoch(k).isoformat(): v for k, v in
+                                 sorted(self.bytes_per_period.items())},
+        }
@@ -0,0 +1,185 @@
+"""
+Reads several logs at once, eg. one per nginx container, merging them by time
+into a single stream of requests as lines arrive.
+
+A source is either a log file's path, which may be compressed, or a command
+whose output is the log, eg. ["docker", "logs", "-f", "nginx"]. Each source is
+parsed as it's read and put on its own bounded queue, so a source that gets
+ahead waits (and a command blocks on its pipe) rather than growing memory.
+
+The merge emits the earliest request once every source has one waiting. A
+source that's gone quiet, eg. an idle container being followed, only holds
+the others up for lag seconds. Its later requests may then be a little out of
+order, which ChronoReqs.add_request allows for.
+"""
+
+import asyncio
+import heapq
+import itertools
+from typing import AsyncIterator, Callable, Iterable, Optional, Sequence, \
+    Union
+
+from compressed import open_log
+from native_list import ChronoReqs
+from regex_parser import RegexLineParser
+
+# Path of a log, or the argv of a command printing one.
+Source = Union[str, Sequence[str]]
+QUEUE_SIZE = 1000
+READ_BYTES = 1 << 16
+DEFAULT_LAG = 1.0
+END = None
+
+
+async def read_file(path: str, parse: Callable[[str], Optional[list]],
+                    queue: asyncio.Queue):
+    with open_log(path) as log_file:
+        while True:
+            lines = await asyncio.to_thread(log_file.readlines, READ_BYTES)
+            if not lines:
+                break
+            for line in lines:
+                req = parse(line.rstrip("\r\n"))
+                if req is not None:
+                    await queue.put(req)
+
+
+async def read_command(args: Sequence[str],
+                       parse: Callable[[str], Optional[list]],
+                       queue: asyncio.Queue):
+    process = await asyncio.create_subprocess_exec(
+        *args, stdout=asyncio.subprocess.PIPE)
+    try:
+        async for line in process.stdout:
+            req = parse(line.decode(errors="replace").rstrip("\r\n"))
+            if req is not None:
+                await queue.put(req)
+        await process.wait()
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+
+
+async def read_source(source: Source, parse: Callable[[str], Optional[list]],
+                      queue: asyncio.Queue):
+    try:
+        if isinstance(source, str):
+            await read_file(source, parse, queue)
+        else:
+            await read_command(source, parse, queue)
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        # Let the merge finish, then iter_sources raises this.
+        await queue.put(END)
+        raise
+    await queue.put(END)
+
+
+async def merge_by_time(queues: Sequence[asyncio.Queue],
+                        lag: Optional[float] = DEFAULT_LAG) \
+        -> AsyncIterator[list]:
+    """
+    :param queues: of requests, each in time order and ending with END.
+    :param lag: seconds to wait for a quiet queue before going on without
+        it, or None to always wait.
+    :return: async generator of requests in time order.
+    """
+    loop = asyncio.get_running_loop()
+    heads = []  # Heap of each queue's next request.
+    getters: dict[asyncio.Task, tuple[int, float]] = {}
+    order = itertools.count()
+
+    def add_head(i: int, req: Optional[list]):
+        if req is not END:
+            heapq.heappush(heads, (req[0], next(order), i, req))
+
+    def want(i: int):
+        try:
+            add_head(i, queues[i].get_nowait())
+        except asyncio.QueueEmpty:
+            getters[asyncio.ensure_future(queues[i].get())] = (i, loop.time())
+
+    for i in range(len(queues)):
+        want(i)
+    try:
+        while getters or heads:
+            for task in [x for x in getters if x.done()]:
+                add_head(getters.pop(task)[0], task.result())
+            now = loop.time()
+            waiting_for = [(started, task) for task, (_, started) in
+                           getters.items()
+                           if lag is None or now - started < lag]
+            if not heads:
+                if getters:
+                    await asyncio.wait(list(getters),
+                                       return_when=asyncio.FIRST_COMPLETED)
+            elif waiting_for:
+                await asyncio.wait(
+                    [task for _, task in waiting_for],
+                    timeout=None if lag is None else
+                    min(waiting_for, key=lambda x: x[0])[0] + lag - now)
+            else:
+                i, req = heapq.heappop(heads)[2:]
+                yield req
+                want(i)
+    finally:
+        for task in getters:
+            task.cancel()
+
+
+async def iter_sources(sources: Iterable[Source], ignored_ips: set[str],
+                       line_parser: Optional[RegexLineParser] = None,
+                       queue_size: int = QUEUE_SIZE,
+                       lag: Optional[float] = DEFAULT_LAG) -> AsyncIterator[list]:
+    """
+    :param sources: paths of logs and commands printing them.
+    :param ignored_ips: as for ChronoReqs.
+    :param line_parser: as for ChronoReqs.
+    :param queue_size: most requests to hold per source.
+    :param lag: see merge_by_time.
+    :return: async generator of requests, laid out as in ChronoReqs.req_list.
+    """
+    parse = ChronoReqs((), ignored_ips, line_parser).parse_line
+    queues = []
+    readers = []
+    for source in sources:
+        queues.append(asyncio.Queue(queue_size))
+        readers.append(asyncio.ensure_future(
+            read_source(source, parse, queues[-1])))
+    try:
+        async for req in merge_by_time(queues, lag):
+            yield req
+        await asyncio.gather(*readers)
+    finally:
+        for reader in readers:
+            reader.cancel()
+
+
+def for_each_request(sources: Iterable[Source], callback: Callable[[list], None],
+                     ignored_ips: set[str],
+                     line_parser: Optional[RegexLineParser] = None, **kwargs):
+    """
+    Runs iter_sources to completion, passing each request to callback.
+
+    :param kwargs: see iter_sources.
+    """
+    async def consume():
+        async for req in iter_sources(sources, ignored_ips, line_parser,
+                                      **kwargs):
+            callback(req)
+    asyncio.run(consume())
+
+
+def ingest_sources(sources: Iterable[Source], ignored_ips: set[str],
+                   line_parser: Optional[RegexLineParser] = None,
+                   **kwargs) -> ChronoReqs:
+    """
+    :param kwargs: see iter_sources.
+    :return: requests from every source.
+    """
+    reqs = ChronoReqs((), ignored_ips, line_parser)
+    for_each_request(sources, reqs.add_request, ignored_ips, line_parser,
+                     **kwargs)
+    return reqs
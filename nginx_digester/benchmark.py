@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Benchmarks parsing and querying a synthetic log, writing the results as JSON
+so they can be compared between versions.
+
+Each of ChronoReqs, lazy ChronoReqs and ReqByIP parses the log in a fresh
+process, so peak RSS is its own. We record lines/sec, peak RSS and the best
+of several runs of each query helper.
+
+    benchmark.py --lines 1e6 --output after.json --compare before.json
+
+exits 1 if anything got slower than --tolerance allows.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Optional
+
+from classifier import RequestClassifier
+from ingest_stats import peak_rss_kb
+from line_parser import from_epoch
+from native_list import ChronoReqs
+from reqs_by_ip import ReqByIP
+from synthetic_log import write_log
+
+HOUR = datetime.timedelta(hours=1)
+PREFIXES = ("/wp", "/.well-known/", "/static/", "/api/", "/")
+
+
+def time_range(reqs) -> tuple[datetime.datetime, datetime.datetime]:
+    """
+    :return: the middle half of the log's times.
+    """
+    if isinstance(reqs, ReqByIP):
+        times = sorted(req[0] for ip_reqs in reqs.by_ip.values()
+                       for req in ip_reqs)
+    else:
+        times = reqs.times
+    n = len(times)
+    return from_epoch(times[n // 4]), from_epoch(times[3 * n // 4])
+
+
+CHRONO_QUERIES: dict[str, Callable[[ChronoReqs], object]] = {
+    "between": lambda reqs: reqs.between(*time_range(reqs)),
+    "get_failures": lambda reqs: ChronoReqs.get_failures(reqs.req_list),
+    "filter_by_status": lambda reqs: ChronoReqs.filter_by_status(
+        reqs.req_list, 200, 299),
+    "get_paths": lambda reqs: ChronoReqs.get_paths(reqs.req_list),
+    "get_reqs_matching": lambda reqs: ChronoReqs.get_reqs_matching(
+        r"/wp-", reqs.req_list),
+    "divide_reqs_by_path_prefixes":
+        lambda reqs: ChronoReqs.divide_reqs_by_path_prefixes(
+            {x: [] for x in PREFIXES}, reqs.req_list),
+    "find_unusual_meth_path_protos":
+        lambda reqs: ChronoReqs.find_unusual_meth_path_protos(reqs.req_list),
+    # A new classifier each run, so its memos start empty.
+    "classify_all":
+        lambda reqs: RequestClassifier().classify_all(reqs.req_list),
+    "requests_per_period": lambda reqs: ChronoReqs.requests_per_period(
+        reqs.req_list, HOUR),
+    "status_classes_per_period":
+        lambda reqs: ChronoReqs.status_classes_per_period(reqs.req_list, HOUR),
+    "failures_per_period": lambda reqs: ChronoReqs.failures_per_period(
+        reqs.req_list, HOUR),
+}
+BY_IP_QUERIES: dict[str, Callable[[ReqByIP], object]] = {
+    "filter_between_times": lambda reqs: ReqByIP.filter_between_times(
+        reqs.by_ip, *time_range(reqs)),
+    "most_requests": lambda reqs: ReqByIP.most_requests(reqs.by_ip),
+    "count_failures_from_dict":
+        lambda reqs: ReqByIP.count_failures_from_dict(reqs.by_ip),
+    "filter_dict_between_status_code":
+        lambda reqs: ReqByIP.filter_dict_between_status_code(
+            reqs.by_ip, 400, 499),
+}
+VARIANTS = {
+    "ChronoReqs": (ChronoReqs, {}, CHRONO_QUERIES),
+    "ChronoReqs(lazy)": (ChronoReqs, {"lazy": True}, CHRONO_QUERIES),
+    "ReqByIP": (ReqByIP, {}, BY_IP_QUERIES),
+}
+
+
+def run_variant(variant: str, log_path: str, repeat: int) -> dict:
+    """
+    Run in its own process, so peak RSS is this variant's.
+
+    :return: parse and query timings.
+    """
+    cls, kwargs, queries = VARIANTS[variant]
+    rss_before = peak_rss_kb()
+    with open(log_path) as log_file:
+        t0 = time.perf_counter()
+        reqs = cls(log_file, set(), **kwargs)
+        seconds = time.perf_counter() - t0
+    with open(log_path) as log_file:
+        n_lines = sum(1 for _ in log_file)
+    results = {
+        "parse_seconds": seconds,
+        "lines_per_sec": n_lines / seconds,
+        "peak_rss_kb": peak_rss_kb(),
+        "rss_growth_kb": peak_rss_kb() - rss_before,
+        "queries": {},
+    }
+    for name, query in queries.items():
+        best = float("inf")
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            query(reqs)
+            best = min(best, time.perf_counter() - t0)
+        results["queries"][name] = best
+    return results
+
+
+def run(log_path: str, repeat: int = 3) -> dict:
+    """
+    :param log_path: log to benchmark with, eg. from synthetic_log.
+    :param repeat: runs of each query, the fastest counting.
+    :return: JSON serialisable results.
+    """
+    with open(log_path) as log_file:
+        n_lines = sum(1 for _ in log_file)
+    results = {
+        "lines": n_lines,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "variants": {},
+    }
+    for variant in VARIANTS:
+        with ProcessPoolExecutor(1) as executor:
+            results["variants"][variant] = executor.submit(
+                run_variant, variant, log_path, repeat).result()
+    return results
+
+
+def compare(old: dict, new: dict, tolerance: float = 0.2) -> list[str]:
+    """
+    :param old: results from before, eg. the last release.
+    :param new: results from now.
+    :param tolerance: fraction worse a measure may get before it's reported.
+    :return: descriptions of the measures that regressed.
+    """
+    regressions = []
+    for variant, new_results in new["variants"].items():
+        old_results = old["variants"].get(variant)
+        if old_results is None:
+            continue
+        measures = [("lines_per_sec", old_results["lines_per_sec"],
+                     new_results["lines_per_sec"], False),
+                    ("peak_rss_kb", old_results["peak_rss_kb"],
+                     new_results["peak_rss_kb"], True)]
+        measures.extend(
+            (name, old_results["queries"][name], seconds, True)
+            for name, seconds in new_results["queries"].items()
+            if name in old_results["queries"])
+        for name, before, after, lower_is_better in measures:
+            worse = after > before * (1 + tolerance) if lower_is_better \
+                else after < before * (1 - tolerance)
+            if worse:
+                regressions.append(
+                    f"{variant} {name}: {before:.6g} -> {after:.6g}")
+    return regressions
+
+
+def main(arg_list: list) -> Optional[int]:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lines', type=float, default=1e5,
+                        help="synthetic log length, eg. 1e6")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--log', help="benchmark with this log instead")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="runs of each query, the fastest counting")
+    parser.add_argument('--output', help="write results JSON here")
+    parser.add_argument('--compare', metavar='OLD_RESULTS',
+                        help="report regressions since these results")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="fraction worse before it's a regression")
+    args = parser.parse_args(arg_list)
+    if args.log:
+        results = run(args.log, args.repeat)
+    else:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            log_path = os.path.join(tmp_dir, "synthetic.log")
+            write_log(log_path, int(args.lines), seed=args.seed)
+            results = run(log_path, args.repeat)
+        results["seed"] = args.seed
+    if args.output:
+        with open(args.output, "w") as results_file:
+            json.dump(results, results_file, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+    if args.compare:
+        with open(args.compare) as old_file:
+            regressions = compare(json.load(old_file), results, args.tolerance)
+        for regression in regressions:
+            print(regression, file=sys.stderr)
+        return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
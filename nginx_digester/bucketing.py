@@ -0,0 +1,103 @@
+"""
+Buckets time ordered requests by period in a single pass, working out each
+request's bucket from its time rather than walking cursors. Empty periods get
+empty buckets, so the results graph without gaps.
+
+Buckets can be split by a key, eg. status class, path prefix or IP, and can
+hold counts rather than the requests themselves.
+"""
+
+import datetime
+from array import array
+from typing import Callable, Hashable, Iterable, Optional, Sequence, Union
+
+from line_parser import ONE_SECOND, from_epoch
+from path_router import prefix_router
+
+Buckets = Union[list[list], array]
+
+
+def bucket_bounds(first_epoch: int, last_epoch: int,
+                  period: datetime.timedelta) -> tuple[int, int]:
+    """
+    :return: the step in seconds and how many buckets are needed to go from
+        first_epoch up to and including last_epoch.
+    """
+    step = period // ONE_SECOND
+    if step < 1:
+        raise ValueError("period must be at least a second")
+    return step, (last_epoch - first_epoch) // step + 1
+
+
+def bucket_starts(first_epoch: int, step: int, n_buckets: int) \
+        -> list[datetime.datetime]:
+    return [from_epoch(first_epoch + i * step) for i in range(n_buckets)]
+
+
+def by_status_class(req: list) -> str:
+    return f"{req[3] // 100}xx"
+
+
+def by_ip(req: list) -> str:
+    return req[1].strip()
+
+
+def by_path_prefix(prefixes: Iterable[str], other: str = "other") \
+        -> Callable[[list], str]:
+    """
+    :param prefixes: the first matching prefix is a request's key.
+    :param other: key of requests matching no prefix, or having no path.
+    :return: key function.
+    """
+    router = prefix_router(tuple(prefixes))
+
+    def path_prefix(req: list) -> str:
+        if len(req[2]) > 2:
+            prefix = router.match(req[2][1])
+            if prefix is not None:
+                return prefix
+        return other
+    return path_prefix
+
+
+def bucketize(req_list: Sequence[list], period: datetime.timedelta,
+              key: Optional[Callable[[list], Hashable]] = None,
+              counts_only: bool = False) \
+        -> tuple[list[datetime.datetime], Union[Buckets, dict[Hashable, Buckets]]]:
+    """
+    :param req_list: requests in time order, as in ChronoReqs.req_list.
+    :param period: width of each bucket, the first starting at the first
+        request.
+    :param key: if given, requests are bucketed separately per key.
+    :param counts_only: make buckets integer counts instead of lists of
+        requests.
+    :return: bucket start times, and buckets, or a dict of buckets by key.
+    """
+    if not req_list:
+        return [], {} if key else (array("I") if counts_only else [])
+    first_epoch = req_list[0][0]
+    step, n_buckets = bucket_bounds(first_epoch, req_list[-1][0], period)
+
+    def new_buckets():
+        if counts_only:
+            return array("I", bytes(4 * n_buckets))
+        return [[] for _ in range(n_buckets)]
+    if key is None:
+        buckets = new_buckets()
+        for req in req_list:
+            if counts_only:
+                buckets[(req[0] - first_epoch) // step] += 1
+            else:
+                buckets[(req[0] - first_epoch) // step].append(req)
+    else:
+        buckets = {}
+        for req in req_list:
+            req_key = key(req)
+            key_buckets = buckets.get(req_key)
+            if key_buckets is None:
+                key_buckets = buckets[req_key] = new_buckets()
+            if counts_only:
+                key_buckets[(req[0] - first_epoch) // step] += 1
+            else:
+                key_buckets[(req[0] - first_epoch) // step].append(req)
+    return bucket_starts(first_epoch, step, n_buckets), buckets
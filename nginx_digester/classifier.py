@@ -0,0 +1,137 @@
+"""
+Labels requests as from a browser, a bot, a search engine's crawler or a
+vulnerability scanner, by their user agent, method and path.
+
+A log has far fewer distinct user agents and paths than requests, so each is
+only classified once, then remembered. Labelling a req_list of millions costs
+about what classifying its few thousand distinct user agents does, plus a
+couple of dict lookups a request.
+
+What a request asks for says more than what it claims to be, so a probe for
+/.env is a scanner's whatever its user agent.
+"""
+
+import re
+from typing import Iterable, Sequence
+
+SCANNER = "scanner"
+CRAWLER = "crawler"
+BOT = "bot"
+BROWSER = "browser"
+LABELS = (SCANNER, CRAWLER, BOT, BROWSER)
+
+METHODS = frozenset(("GET", "HEAD", "POST", "PUT", "DELETE", "OPTIONS",
+                     "PATCH"))
+# Paths only probed for weaknesses, never linked to.
+SCANNER_PATHS = (
+    r"xmlrpc\.php", r"wp-login\.php", r"/wp-admin/", r"wlwmanifest\.xml",
+    r"/\.env", r"/\.git/", r"/\.aws/", r"phpunit", r"phpmyadmin",
+    r"eval-stdin", r"/cgi-bin/", r"/owa/", r"/ecp/", r"/remote/fgt_",
+    r"/boaform/", r"/HNAP1", r"/actuator/", r"/solr/", r"\.\./",
+)
+# Tools which do nothing but probe.
+SCANNER_AGENTS = re.compile(
+    r"zgrab|masscan|nmap|nikto|sqlmap|nuclei|censys|expanse|l9explore|zmeu|"
+    r"gobuster|dirbuster|wpscan", re.I)
+# Indexers announce themselves, eg. "Googlebot/2.1; +http://www.google.com/bot".
+CRAWLER_AGENTS = re.compile(
+    r"bot\b|crawl|rowler|spider|slurp|archiver|facebookexternalhit", re.I)
+# Every browser's user agent starts with Mozilla/ or Opera/, but so do some
+# automated clients'.
+BOT_AGENTS = re.compile(
+    r"lighthouse|headless|phantomjs|selenium|python|curl|wget|go-http-client|"
+    r"java/|okhttp|libwww|httpclient|axios|scrapy", re.I)
+BROWSER_PREFIXES = ("Mozilla/", "Opera/")
+
+
+def classify_agent(user_agent: str) -> str:
+    """
+    :param user_agent: as logged, "-" when none was sent.
+    :return: one of LABELS.
+    """
+    if SCANNER_AGENTS.search(user_agent):
+        return SCANNER
+    if CRAWLER_AGENTS.search(user_agent):
+        return CRAWLER
+    if not user_agent.startswith(BROWSER_PREFIXES) or \
+            BOT_AGENTS.search(user_agent):
+        return BOT
+    return BROWSER
+
+
+class RequestClassifier:
+    def __init__(self, scanner_paths: Iterable[str] = SCANNER_PATHS):
+        """
+        :param scanner_paths: regexes searched for in paths, any matching
+            makes the request a scanner's.
+        """
+        self.scanner_path = re.compile(
+            "|".join(f"(?:{x})" for x in scanner_paths), re.I).search
+        # Memos of each distinct value seen.
+        self.agent_labels: dict[str, str] = {}
+        self.scanner_paths: dict[str, bool] = {}
+
+    def is_scanner_path(self, path: str) -> bool:
+        scanner_path = self.scanner_paths.get(path)
+        if scanner_path is None:
+            scanner_path = self.scanner_paths[path] = \
+                self.scanner_path(path) is not None
+        return scanner_path
+
+    def label_agent(self, user_agent: str) -> str:
+        label = self.agent_labels.get(user_agent)
+        if label is None:
+            label = self.agent_labels[user_agent] = classify_agent(user_agent)
+        return label
+
+    def classify(self, req: list) -> str:
+        """
+        :param req: as held in ChronoReqs.req_list.
+        :return: one of LABELS.
+        """
+        return self.classify_all((req,))[0]
+
+    def classify_all(self, req_list: Iterable[list]) -> list[str]:
+        """
+        Only the memos are consulted for values seen before, the checks being
+        inlined as this runs once per request.
+
+        :param req_list: may be member, or already filtered.
+        :return: the label of each request, in the same order.
+        """
+        labels = []
+        append = labels.append
+        scanner_paths = self.scanner_paths
+        agent_labels = self.agent_labels
+        for req in req_list:
+            if len(req) < 5:
+                # The request was never closed.
+                append(SCANNER)
+                continue
+            method_path_proto = req[2]
+            if len(method_path_proto) != 3 or \
+                    method_path_proto[0] not in METHODS:
+                # Malformed or binary requests, CONNECT etc.
+                append(SCANNER)
+                continue
+            scanner_path = scanner_paths.get(method_path_proto[1])
+            if scanner_path is None:
+                scanner_path = self.is_scanner_path(method_path_proto[1])
+            if scanner_path:
+                append(SCANNER)
+                continue
+            user_agent = req[6] if len(req) > 6 else "-"
+            label = agent_labels.get(user_agent)
+            append(label if label is not None else self.label_agent(user_agent))
+        return labels
+
+    def divide_reqs_by_label(self, req_list: Sequence[list]) \
+            -> dict[str, list[list]]:
+        """
+        :param req_list: may be member, or already filtered.
+        :return: requests by label, every label present.
+        """
+        label_dict = {label: [] for label in LABELS}
+        for req, label in zip(req_list, self.classify_all(req_list)):
+            label_dict[label].append(req)
+        return label_dict
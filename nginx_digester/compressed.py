@@ -0,0 +1,108 @@
+"""
+Opens logs however they were compressed by logrotate, decompressing as they're
+read rather than to disk first. The compression is told by the file's first
+bytes, so a misnamed file still opens. Decompressors are only imported once a
+log needs one.
+
+Also orders rotated logs oldest first, eg. access.log.3.gz, access.log.2.gz,
+access.log.1, access.log, so their requests can be merged in time order.
+"""
+
+import glob
+import importlib
+import os
+import re
+from typing import Callable, Iterable, Iterator, Optional, TextIO
+
+
+def open_zstd(filename: str) -> TextIO:
+    try:
+        from compression import zstd  # Python 3.14+
+    except ImportError:
+        try:
+            import zstandard as zstd
+        except ImportError:
+            raise ImportError(
+                f"zstandard must be installed to read {filename}") from None
+    return zstd.open(filename, "rt")
+
+
+def opener_from(module: str) -> Callable[[str], TextIO]:
+    """
+    :return: opener importing module only once it's needed.
+    """
+    return lambda filename: importlib.import_module(module).open(
+        filename, "rt")
+
+
+MAGIC: dict[bytes, Callable[[str], TextIO]] = {
+    b"\x1f\x8b": opener_from("gzip"),
+    b"BZh": opener_from("bz2"),
+    b"\xfd7zXZ\x00": opener_from("lzma"),
+    b"\x28\xb5\x2f\xfd": open_zstd,
+}
+MAGIC_BYTES = max(map(len, MAGIC))
+COMPRESSED_SUFFIX = re.compile(r"\.(gz|bz2|xz|zst)$")
+# Numbered rotations count up with age, dated ones (logrotate's dateext) down.
+ROTATION_SUFFIX = re.compile(r"[.-](\d+)$")
+
+
+def compression_of(filename: str) -> Optional[Callable[[str], TextIO]]:
+    """
+    :return: how to open filename, or None if it isn't compressed.
+    """
+    with open(filename, "rb") as log_file:
+        head = log_file.read(MAGIC_BYTES)
+    for magic, opener in MAGIC.items():
+        if head.startswith(magic):
+            return opener
+
+
+def open_log(filename: str) -> TextIO:
+    """
+    :param filename: plain or compressed log.
+    :return: text file, decompressing as it's read.
+    """
+    opener = compression_of(filename)
+    return opener(filename) if opener else open(filename)
+
+
+def iter_log_lines(filenames: Iterable[str]) -> Iterator[str]:
+    """
+    :param filenames: logs to read one after another.
+    :return: generator of their lines.
+    """
+    for filename in filenames:
+        with open_log(filename) as log_file:
+            yield from log_file
+
+
+def rotation_key(filename: str) -> tuple[str, int, int]:
+    """
+    :return: key ordering a log's rotations oldest first, the live log last.
+    """
+    name = COMPRESSED_SUFFIX.sub("", filename)
+    rotation = ROTATION_SUFFIX.search(name)
+    if rotation is None:
+        return name, 1, 0
+    number = int(rotation.group(1))
+    return (name[:rotation.start()], 0,
+            -number if rotation.group(0)[0] == "." else number)
+
+
+def expand_logs(patterns: Iterable[str]) -> list[str]:
+    """
+    :param patterns: log filenames, or globs such as "access.log*" for when
+        the shell hasn't expanded them.
+    :return: existing logs, without duplicates, rotations oldest first.
+    """
+    filenames = {}
+    for pattern in patterns:
+        if os.path.exists(pattern):
+            filenames[pattern] = None
+        else:
+            matches = glob.glob(pattern)
+            if not matches:
+                raise FileNotFoundError(f"No logs match {pattern}")
+            filenames.update(dict.fromkeys(matches))
+    return sorted(filenames, key=rotation_key)
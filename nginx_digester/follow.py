@@ -0,0 +1,91 @@
+"""
+Incremental reading of a live log, for running from cron. A small JSON state
+file remembers the inode and offset we'd read up to, so each run only parses
+what was appended since the last. Nothing parsed is kept between runs, so
+each run's results only cover the newly appended lines.
+
+Rotation is noticed by the inode changing, in which case we finish the rotated
+file if it's still at FILENAME.1, then start the new one from the beginning.
+Truncation (eg. logrotate's copytruncate) is noticed by the file shrinking or
+its first bytes changing.
+"""
+
+import hashlib
+import json
+import os
+from typing import Iterator, Optional
+
+# Bytes at the head of the file whose hash tells us it's the same log.
+FINGERPRINT_BYTES = 256
+
+
+def fingerprint(filename: str, length: int) -> str:
+    with open(filename, "rb") as log_file:
+        return hashlib.sha1(log_file.read(length)).hexdigest()
+
+
+class LogFollower:
+    def __init__(self, filename: str, state_path: str):
+        """
+        :param filename: log being appended to.
+        :param state_path: where to keep our place between runs.
+        """
+        self.filename = filename
+        self.state_path = state_path
+        self.inode: Optional[int] = None
+        self.offset = 0
+        self.head = ""
+        if os.path.exists(state_path):
+            with open(state_path) as state_file:
+                state = json.load(state_file)
+            self.inode = state["inode"]
+            self.offset = state["offset"]
+            self.head = state["head"]
+
+    def update_head(self):
+        self.head = fingerprint(
+            self.filename, min(self.offset, FINGERPRINT_BYTES))
+
+    def save(self):
+        """
+        Records our place. Call once the lines read have been dealt with.
+        """
+        self.update_head()
+        # Replaced atomically, so being killed midway can't lose our place.
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w") as state_file:
+            json.dump({"inode": self.inode, "offset": self.offset,
+                       "head": self.head}, state_file)
+        os.replace(tmp_path, self.state_path)
+
+    def is_same_log(self, filename: str) -> bool:
+        stat = os.stat(filename)
+        return stat.st_ino == self.inode and stat.st_size >= self.offset and \
+            fingerprint(filename, min(self.offset, FINGERPRINT_BYTES)) == self.head
+
+    def read_from(self, filename: str, offset: int) -> Iterator[str]:
+        """
+        :return: generator of complete lines. A partial last line is left for
+            the next run, since nginx may be midway through writing it.
+        """
+        self.offset = offset
+        with open(filename, "rb") as log_file:
+            log_file.seek(offset)
+            for line in log_file:
+                if not line.endswith(b"\n"):
+                    break
+                self.offset += len(line)
+                yield line.decode()
+
+    def iter_new_lines(self) -> Iterator[str]:
+        """
+        :return: generator of lines appended since we last saved.
+        """
+        if self.inode is not None and not self.is_same_log(self.filename):
+            rotated = f"{self.filename}.1"
+            if os.path.exists(rotated) and self.is_same_log(rotated):
+                yield from self.read_from(rotated, self.offset)
+            self.offset = 0
+        self.inode = os.stat(self.filename).st_ino
+        yield from self.read_from(self.filename, self.offset)
+        self.update_head()
@@ -0,0 +1,144 @@
+"""
+Opt-in instrumentation of parsing, to see whether time goes into reading, the
+ip_matcher regex, timestamps, append_rest_of_line, the filters or storing.
+
+Pass an IngestStats to ChronoReqs or ReqByIP and they parse through
+timed_requests, handing it to parse_line, which laps perf_counter between
+stages. Without one, perf_counter is never called, so timing costs nothing
+unless it's asked for:
+
+    stats = IngestStats(callback=print_progress, every=1_000_000)
+    reqs = ChronoReqs(log_file, ignored_ips, stats=stats)
+    stats.report()
+"""
+
+import sys
+from time import perf_counter
+from typing import Callable, Iterable, Iterator, Optional, Union
+
+from line_parser import iter_lines
+
+DEFAULT_EVERY = 100_000
+
+
+def peak_rss_kb() -> Optional[int]:
+    """
+    :return: this process's peak resident memory, None where unavailable,
+        ie. Windows.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux KiB.
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+class IngestStats:
+    def __init__(self, callback: Optional[Callable[["IngestStats"], None]] = None,
+                 every: int = DEFAULT_EVERY):
+        """
+        :param callback: called with these stats every `every` lines, and once
+            parsing finishes.
+        :param every: lines between calls of callback.
+        """
+        self.callback = callback
+        self.every = every
+        self.lines = 0
+        self.requests = 0
+        # Lines without an IP and time, eg. docker's debug output.
+        self.rejected = 0
+        # Requests from ignored_ips.
+        self.ignored = 0
+        # Seconds by stage, in the order stages were first seen.
+        self.stages: dict[str, float] = {}
+        self.seconds = 0.0
+        self.peak_rss_kb: Optional[int] = None
+        self.last = 0.0
+        # Whether every line was counted. Lines loaded from a cache, or read
+        # by --source, aren't.
+        self.lines_counted = True
+
+    def lap(self, stage: str):
+        """
+        Adds the time since the last lap to stage.
+        """
+        now = perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0.0) + now - self.last
+        self.last = now
+
+    def timed_requests(self, instr: Union[str, Iterable[str]],
+                       parse: Callable[[str, "IngestStats"], Optional[object]],
+                       consumer: str = "store") -> Iterator:
+        """
+        :param instr: log dump, or any iterable of lines.
+        :param parse: eg. ChronoReqs.parse_line, lapping its own stages.
+        :param consumer: stage the time spent by our caller on each request
+            counts towards.
+        :return: generator of the requests parse returns.
+        """
+        start = self.last = perf_counter()
+        try:
+            for line in iter_lines(instr):
+                self.lap("read")
+                self.lines += 1
+                req = parse(line, self)
+                if req is not None:
+                    self.requests += 1
+                    yield req
+                    self.lap(consumer)
+                if self.callback is not None and self.lines % self.every == 0:
+                    self.seconds += perf_counter() - start
+                    self.callback(self)
+                    start = self.last = perf_counter()
+        finally:
+            self.record_totals(perf_counter() - start)
+
+    def merge(self, other: "IngestStats"):
+        """
+        Adds the counts and stages of parsing done elsewhere, eg. in a worker
+        process. Parsing in parallel, stages then sum to more than seconds,
+        which the caller times as a whole so aren't added.
+        """
+        self.lines += other.lines
+        self.requests += other.requests
+        self.rejected += other.rejected
+        self.ignored += other.ignored
+        for stage, seconds in other.stages.items():
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        self.lines_counted = self.lines_counted and other.lines_counted
+
+    def record_totals(self, seconds: float, requests: int = 0):
+        """
+        Also for parsing we can't time by stage, eg. in other processes.
+
+        :param seconds: taken to parse.
+        :param requests: parsed, beyond those counted already.
+        """
+        self.seconds += seconds
+        self.requests += requests
+        if requests:
+            # Parsed without being counted line by line.
+            self.lines_counted = False
+        self.peak_rss_kb = peak_rss_kb()
+        if self.callback is not None:
+            self.callback(self)
+
+    @property
+    def lines_per_sec(self) -> float:
+        return self.lines / self.seconds if self.seconds else 0.0
+
+    def report(self) -> dict:
+        """
+        :return: JSON serialisable stats, leaving out line counts if not all
+            lines were counted, and stages if none were timed.
+        """
+        report = {"requests": self.requests, "seconds": self.seconds,
+                  "peak_rss_kb": self.peak_rss_kb}
+        if self.lines_counted:
+            report.update(lines=self.lines, rejected=self.rejected,
+                          ignored=self.ignored, lines_per_sec=self.lines_per_sec)
+        if self.stages:
+            report["stages"] = dict(self.stages)
+        return report
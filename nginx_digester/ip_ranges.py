@@ -0,0 +1,109 @@
+"""
+Answers "is this IP in any of these CIDRs?" with a bisect over sorted, merged
+integer intervals, rather than testing every ipaddress.ip_network in turn.
+Handles IPv4 and IPv6, and behaves enough like a set of IPs to be passed as
+ignored_ips.
+"""
+
+import bisect
+import ipaddress
+import json
+import socket
+from typing import Iterable, Iterator
+
+
+def ip_to_key(ip: str) -> tuple[int, int]:
+    """
+    :param ip: IPv4 or IPv6 address.
+    :return: IP version and the address as an int.
+    """
+    if ":" in ip:
+        return 6, int.from_bytes(socket.inet_pton(socket.AF_INET6, ip), "big")
+    return 4, int.from_bytes(socket.inet_aton(ip), "big")
+
+
+class IPRangeIndex:
+    def __init__(self, cidrs: Iterable[str] = ()):
+        """
+        :param cidrs: networks such as "66.249.64.0/27" or "2001:4860::/64".
+            Plain addresses are single address networks.
+        """
+        # Per IP version, merged intervals as sorted starts and their ends.
+        self.starts: dict[int, list[int]] = {4: [], 6: []}
+        self.ends: dict[int, list[int]] = {4: [], 6: []}
+        intervals = {4: [], 6: []}
+        for cidr in cidrs:
+            network = ipaddress.ip_network(cidr.strip(), strict=False)
+            intervals[network.version].append(
+                (int(network.network_address), int(network.broadcast_address)))
+        for version, ranges in intervals.items():
+            for start, end in sorted(ranges):
+                if self.ends[version] and start <= self.ends[version][-1] + 1:
+                    self.ends[version][-1] = max(self.ends[version][-1], end)
+                else:
+                    self.starts[version].append(start)
+                    self.ends[version].append(end)
+
+    @classmethod
+    def from_prefixes(cls, prefixes_json: dict) -> "IPRangeIndex":
+        """
+        :param prefixes_json: as published for googlebot and others, eg.
+            {"prefixes": [{"ipv4Prefix": "66.249.64.0/27"}, ...]}
+        """
+        return cls(prefix[k] for prefix in prefixes_json["prefixes"]
+                   for k in ("ipv4Prefix", "ipv6Prefix") if k in prefix)
+
+    @classmethod
+    def from_file(cls, path: str) -> "IPRangeIndex":
+        """
+        :param path: either prefixes JSON, or text with a CIDR per line.
+            Blank lines and those starting with # are skipped.
+        """
+        with open(path) as ranges_file:
+            content = ranges_file.read()
+        if content.lstrip().startswith("{"):
+            return cls.from_prefixes(json.loads(content))
+        return cls(line for line in content.splitlines()
+                   if line.strip() and not line.lstrip().startswith("#"))
+
+    def __contains__(self, ip: str) -> bool:
+        try:
+            version, ip_int = ip_to_key(ip.strip())
+        except (OSError, ValueError):
+            return False
+        i = bisect.bisect_right(self.starts[version], ip_int) - 1
+        return i >= 0 and ip_int <= self.ends[version][i]
+
+    def __iter__(self) -> Iterator[str]:
+        """
+        :return: generator of CIDRs covering the merged ranges.
+        """
+        for version, cls in ((4, ipaddress.IPv4Address),
+                             (6, ipaddress.IPv6Address)):
+            for start, end in zip(self.starts[version], self.ends[version]):
+                for network in ipaddress.summarize_address_range(
+                        cls(start), cls(end)):
+                    yield str(network)
+
+    def __or__(self, other: Iterable[str]) -> "IPRangeIndex":
+        return IPRangeIndex([*self, *other])
+
+    def filter_out(self, req_list: Iterable[list], ip_field: int = 1) \
+            -> list[list]:
+        """
+        Tests each distinct IP only once, however many requests it made.
+
+        :param req_list: requests, eg. ChronoReqs.req_list.
+        :param ip_field: index of the IP in each request.
+        :return: the requests whose IP isn't in our ranges.
+        """
+        seen: dict[str, bool] = {}
+        kept = []
+        for req in req_list:
+            ip = req[ip_field]
+            excluded = seen.get(ip)
+            if excluded is None:
+                excluded = seen[ip] = ip in self
+            if not excluded:
+                kept.append(req)
+        return kept
@@ -0,0 +1,108 @@
+"""
+A request that keeps its raw line, only parsing fields when they're asked for.
+
+Ingest only finds the IP, time, status and the request's closing quote. Size
+is read from the line on each access, while the method/path/proto split and
+the quoted referrer, user agent and x_forwarded_for are parsed on first access
+and kept. So queries on time, IP and status never pay for the rest of the
+line.
+
+Indexing matches the lists of ChronoReqs.req_list, eg. req[2][1] is the path
+and req[3] the status, so the ChronoReqs helpers work on either.
+"""
+
+from collections.abc import Sequence
+from typing import Iterator, Optional
+
+from line_parser import LogLineParser
+
+# Quoted fields which may follow the size.
+OPTIONAL_FIELDS = 3
+
+
+class LazyRequest(Sequence):
+    __slots__ = ("line", "epoch", "ip", "curs", "quote", "status", "_mpp",
+                 "_optional")
+
+    def __init__(self, line: str, epoch: int, ip: str, curs: int):
+        """
+        :param line: the whole log line.
+        :param epoch: its time.
+        :param ip: as it's held in req_list, ie. right justified.
+        :param curs: just after the request's opening quote, as returned by
+            find_ip_and_timestamp.
+        """
+        self.line = line
+        self.epoch = epoch
+        self.ip = ip
+        self.curs = curs
+        self.quote = quote = line.find('"', curs)
+        # nginx's $status is always 3 digits.
+        self.status = None if quote == -1 else int(line[quote + 2:quote + 5])
+        self._mpp: Optional[list[str]] = None
+        self._optional: Optional[list[str]] = None
+
+    def __len__(self):
+        if self.quote == -1:
+            return 2
+        if self._optional is not None:
+            return 5 + len(self._optional)
+        return 5 + min(OPTIONAL_FIELDS,
+                       (self.line.count('"', self.quote + 1) + 1) // 2)
+
+    def __getitem__(self, i):
+        # Fast paths for the fields most queries use.
+        if i == 0:
+            return self.epoch
+        if i == 1:
+            return self.ip
+        if i == 3 and self.status is not None:
+            return self.status
+        if i == 2 and self._mpp is not None:
+            return self._mpp
+        return self._get(i)
+
+    def _get(self, i):
+        if isinstance(i, slice):
+            return [self[x] for x in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if i == 0:
+            return self.epoch
+        if i == 1:
+            return self.ip
+        if 2 <= i < len(self):
+            if i == 2:
+                if self._mpp is None:
+                    self._mpp = self.line[self.curs:self.quote].split()
+                return self._mpp
+            if i == 3:
+                return self.status
+            if i == 4:
+                start = self.quote + 6
+                end = self.line.find(" ", start)
+                return int(self.line[start:end] if end != -1 else
+                           self.line[start:])
+            if self._optional is None:
+                # Rare enough to parse just as the eager parser would.
+                rest = []
+                LogLineParser.append_rest_of_line(rest, self.line, self.curs)
+                self._optional = rest[3:]
+            return self._optional[i - 5]
+        raise IndexError("LazyRequest index out of range")
+
+    def __iter__(self) -> Iterator:
+        return map(self.__getitem__, range(len(self)))
+
+    def __eq__(self, other):
+        if isinstance(other, (list, LazyRequest)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def __reduce__(self):
+        return LazyRequest, (self.line, self.epoch, self.ip, self.curs)
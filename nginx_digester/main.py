@@ -4,7 +4,8 @@ Ingests nginx logs for querying/graphing.
 
 Originally this would use ReqByIP to store them by IP. That's fine for DOS
 protection but very inefficient for time series analysis which is why ChronoReqs
-was created.
+was created. ChronoReqs's secondary indexes now give the per IP views too, so
+logs are only parsed into ChronoReqs.
 
 ----
 
@@ -23,27 +24,254 @@ https://iplocation.io/ip/107.175.245.18 and https://www.iplocation.net/ip-lookup
 
 import argparse
 import sys
-import json
+import time
 
-from reqs_by_ip import ReqByIP
+from queries import QUERIES, add_query_args, write_rows
 
 KNOWN_FRIENDLY_TESTERS = {"172.18.0.1", "46.64.34.27"}
 
 
+def add_input_args(parser: argparse.ArgumentParser):
+    parser.add_argument('filenames', nargs='*', metavar='filename',
+                        help="logs, plain or compressed. Globs such as "
+                             "'access.log*' are read oldest rotation first")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="processes to parse a file, or several files, "
+                             "with")
+    parser.add_argument('--mmap', action='store_true',
+                        help="read the file through mmap")
+    parser.add_argument('--log-format',
+                        help="parse with a regex compiled from this nginx "
+                             "log_format, or 'combined'")
+    parser.add_argument('--follow', metavar='STATE_FILE',
+                        help="only parse, and report on, lines added since "
+                             "the last run, keeping our place in STATE_FILE")
+    parser.add_argument('--cache-dir',
+                        help="save parsed logs here, and reuse them while "
+                             "the log is unchanged")
+    parser.add_argument('--ignore-ranges', metavar='RANGES_FILE',
+                        help="also ignore IPs in these CIDRs, given one per "
+                             "line or as googlebot.json style prefixes")
+    parser.add_argument('--source', action='append', default=[],
+                        metavar='FILE',
+                        help="also read this log, merging by time. Repeatable")
+    parser.add_argument('--command', action='append', default=[],
+                        help="also read the log this command prints, eg. "
+                             "'docker logs -f nginx'. Repeatable")
+    parser.add_argument('--stats', action='store_true',
+                        help="print JSON to stderr of lines/sec, rejected "
+                             "lines, peak memory and the time each stage of "
+                             "parsing took")
 
-def main(arg_list: list):
-    parser = argparse.ArgumentParser()
-    parser.add_argument('filename', nargs='?')
+
+def parse_options(args: argparse.Namespace):
+    """
+    Modules are only imported once the arguments show they're needed, so a
+    run starts quickly.
+
+    :return: ignored_ips, line_parser, filenames and async sources.
+    """
+    ignored_ips = KNOWN_FRIENDLY_TESTERS
+    if args.ignore_ranges:
+        from ip_ranges import IPRangeIndex
+        ignored_ips = IPRangeIndex.from_file(args.ignore_ranges) | ignored_ips
+    line_parser = None
+    if args.log_format:
+        from regex_parser import COMBINED_PARSER, RegexLineParser
+        line_parser = COMBINED_PARSER if args.log_format == "combined" else \
+            RegexLineParser.from_log_format(args.log_format)
+    filenames = args.filenames
+    if filenames:
+        from compressed import expand_logs
+        filenames = expand_logs(filenames)
+    sources = []
+    if args.source or args.command:
+        import shlex
+        sources = [*filenames, *args.source, *map(shlex.split, args.command)]
+    return ignored_ips, line_parser, filenames, sources
+
+
+def new_stats(args: argparse.Namespace):
+    """
+    :return: IngestStats for --stats, else None.
+    """
+    if args.stats:
+        from ingest_stats import IngestStats
+        return IngestStats()
+
+
+def print_stats(stats, start: float, requests: int = 0):
+    """
+    :param stats: IngestStats.
+    :param start: perf_counter when parsing began, for if it was parsed where
+        stats couldn't time it, eg. with --workers, --cache-dir or --source.
+    :param requests: parsed, for if stats couldn't count them all.
+    """
+    import json
+    if not stats.seconds:
+        stats.record_totals(time.perf_counter() - start,
+                            max(requests - stats.requests, 0))
+    print(json.dumps(stats.report()), file=sys.stderr)
+
+
+def load_reqs(args: argparse.Namespace, parser: argparse.ArgumentParser):
+    """
+    :return: ChronoReqs of the logs args name, or None if there are none, and
+        the LogFollower of --follow, else None. Its place is only to be saved
+        once the requests have been dealt with, so a failed run is redone.
+    """
+    stats = new_stats(args)
+    start = time.perf_counter()
+    reqs, follower = read_reqs(args, parser, stats)
+    if stats is not None and reqs is not None:
+        print_stats(stats, start, len(reqs.req_list))
+    return reqs, follower
+
+
+def read_reqs(args: argparse.Namespace, parser: argparse.ArgumentParser,
+              stats=None):
+    """
+    :param stats: IngestStats, counting and timing parsing in whichever
+        process it's done, or the counts saved with a cache.
+    :return: as load_reqs.
+    """
+    ignored_ips, line_parser, filenames, sources = parse_options(args)
+    if sources:
+        from async_ingest import ingest_sources
+        return ingest_sources(sources, ignored_ips, line_parser), None
+    if filenames and args.follow:
+        if len(filenames) > 1:
+            parser.error("--follow takes a single log")
+        from compressed import compression_of
+        if compression_of(filenames[0]):
+            # Offsets into a compressed file can't be resumed from.
+            parser.error("--follow can't follow a compressed log")
+        from follow import LogFollower
+        from native_list import ChronoReqs
+        follower = LogFollower(filenames[0], args.follow)
+        return ChronoReqs(follower.iter_new_lines(), ignored_ips,
+                          line_parser, stats=stats), follower
+    if filenames and args.cache_dir:
+        from native_list import ChronoReqs
+        from parse_cache import cached_parse
+        reqs = ChronoReqs((), ignored_ips, line_parser)
+        for filename in filenames:
+            reqs.merge(cached_parse(
+                ChronoReqs, filename, ignored_ips, args.cache_dir,
+                args.workers, args.mmap, line_parser, stats))
+        return reqs, None
+    if filenames:
+        from native_list import ChronoReqs
+        if len(filenames) == 1 and args.workers == 1 and not args.mmap:
+            from compressed import open_log
+            with open_log(filenames[0]) as log_file:
+                return ChronoReqs(log_file, ignored_ips, line_parser,
+                                  stats=stats), None
+        from parallel import parse_files
+        return parse_files(
+            ChronoReqs, filenames, ignored_ips, args.workers,
+            args.mmap, line_parser, stats), None
+    if not sys.stdin.isatty():
+        from native_list import ChronoReqs
+        return ChronoReqs(sys.stdin, ignored_ips, line_parser,
+                          stats=stats), None
+    return None, None
+
+
+def query(name: str, arg_list: list):
+    """
+    :param name: of the query, a key of QUERIES.
+    :param arg_list: the rest of the command line.
+    """
+    parser = argparse.ArgumentParser(prog=f"main.py {name}",
+                                     description=QUERIES[name].help)
+    add_input_args(parser)
+    add_query_args(parser)
     args = parser.parse_args(arg_list)
-    if args.filename:
-        reqs = ReqByIP(open(args.filename).read(), KNOWN_FRIENDLY_TESTERS)
-    elif not sys.stdin.isatty():
-        reqs = ReqByIP(sys.stdin.read(), KNOWN_FRIENDLY_TESTERS)
+    reqs, follower = load_reqs(args, parser)
+    if reqs is None:
+        parser.print_help()
+        return
+    write_rows(QUERIES[name], QUERIES[name].run(reqs, args), args.format,
+               sys.stdout)
+    if follower is not None:
+        follower.save()
+
+
+def stream(args: argparse.Namespace):
+    """
+    --summary and --detect, which aggregate requests as they stream in,
+    rather than retaining them.
+    """
+    from abuse_detector import AbuseDetector
+    from aggregators import StreamingSummary
+    ignored_ips, line_parser, filenames, sources = parse_options(args)
+    stats = new_stats(args)
+    start = time.perf_counter()
+    if args.detect:
+        detector = AbuseDetector()
+
+        def on_request(req: list):
+            candidate = detector.add(req)
+            if candidate is not None:
+                print(candidate.deny_snippet(), flush=True)
+    else:
+        summary = StreamingSummary()
+        on_request = summary.add
+    if sources:
+        from async_ingest import for_each_request
+        if stats is not None:
+            # Their lines aren't counted, just the requests they give.
+            stats.lines_counted = False
+            handle_request = on_request
+
+            def on_request(req: list):
+                stats.requests += 1
+                handle_request(req)
+        for_each_request(sources, on_request, ignored_ips, line_parser)
     else:
+        from native_list import ChronoReqs
+        if filenames:
+            from compressed import iter_log_lines
+            lines = iter_log_lines(filenames)
+        else:
+            lines = sys.stdin
+        for req in ChronoReqs((), ignored_ips, line_parser,
+                              stats=stats).iter_requests(lines):
+            on_request(req)
+    if stats is not None:
+        print_stats(stats, start)
+    if not args.detect:
+        import json
+        print(json.dumps(summary.report()))
+
+
+def main(arg_list: list):
+    if arg_list and arg_list[0] in QUERIES:
+        return query(arg_list[0], arg_list[1:])
+    parser = argparse.ArgumentParser(
+        epilog=f"queries: main.py {{{','.join(QUERIES)}}} [filename ...] "
+               f"[--format {{json,csv}}], see main.py QUERY --help")
+    add_input_args(parser)
+    parser.add_argument('--summary', action='store_true',
+                        help="print a JSON summary, aggregated as the log "
+                             "streams in, rather than retaining requests")
+    parser.add_argument('--detect', action='store_true',
+                        help="print nginx deny lines for abusive IPs as soon "
+                             "as they're seen, eg. tail -F access.log | "
+                             "main.py --detect")
+    args = parser.parse_args(arg_list)
+    if (args.summary or args.detect) and (
+            args.filenames or args.source or args.command or
+            not sys.stdin.isatty()):
+        stream(args)
+        return
+    reqs, follower = load_reqs(args, parser)
+    if reqs is None:
         parser.print_help()
+    elif follower is not None:
+        follower.save()
 
 
 if __name__ == '__main__':
     main(sys.argv[1:])
-
-
@@ -0,0 +1,39 @@
+"""
+Reads a log through mmap rather than decoding the whole file to a str. Newlines
+are found in the mapped bytes and only lines that could be requests, ie. those
+starting with an IP, are decoded. They're decoded whole, since a request keeps
+every field of its line, and the parsers all work on str. Works on byte ranges
+so it suits the chunks of parallel.py.
+"""
+
+import mmap
+from typing import Iterator, Optional
+
+DIGITS = frozenset(b"0123456789")
+
+
+def iter_mmap_lines(filename: str, start: int = 0,
+                    end: Optional[int] = None) -> Iterator[str]:
+    """
+    :param filename: log file to read, must be a regular file.
+    :param start: byte offset of the first line.
+    :param end: byte offset after the last line, None for the end of file.
+    :return: generator of decoded lines that begin with a digit.
+    """
+    with open(filename, "rb") as log_file:
+        try:
+            mapped = mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return  # Empty files can't be mapped.
+        with mapped:
+            if end is None:
+                end = len(mapped)
+            pos = start
+            while pos < end:
+                newline = mapped.find(b"\n", pos, end)
+                if newline == -1:
+                    newline = end
+                # docker logs mixes in debug lines, which can't have an IP.
+                if mapped[pos] in DIGITS:
+                    yield mapped[pos:newline].decode()
+                pos = newline + 1
@@ -3,43 +3,326 @@ This form of log storage was **much** faster for time slicing than reqs_by_ip,
 ie. having requests indexed by IP.
 """
 
+import bisect
 import datetime
-import ipaddress
+import heapq
 import re
+from array import array
 from collections import Counter
+from collections.abc import Sequence
+from operator import itemgetter
+from typing import Callable, Hashable, Iterable, Iterator, Optional, Union
 
-import requests
+from bucketing import bucketize, by_status_class
+from ingest_stats import IngestStats
+from lazy_record import LazyRequest
+from line_parser import LogLineParser, iter_lines, to_epoch
+from path_router import PatternRouter, PrefixRouter, pattern_router, \
+    prefix_router
+from regex_parser import RegexLineParser
 
-from line_parser import LogLineParser, INTERNAL_DT_FORMAT
+
+class ReqView(Sequence):
+    """
+    A contiguous run of a req_list, without copying it. Like any view, it's
+    only valid until the list it views is modified.
+    """
+    __slots__ = ("req_list", "start", "stop")
+
+    def __init__(self, req_list: list[list], start: int, stop: int):
+        self.req_list = req_list
+        self.start = start
+        self.stop = max(start, stop)
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            if step == 1:
+                return ReqView(self.req_list, self.start + start, self.start + stop)
+            return [self.req_list[self.start + x] for x in range(start, stop, step)]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("ReqView index out of range")
+        return self.req_list[self.start + i]
+
+    def __iter__(self) -> Iterator[list]:
+        return map(self.req_list.__getitem__, range(self.start, self.stop))
+
+
+def ip_key(req: list) -> str:
+    return req[1].strip()
+
+
+def status_key(req: list) -> Optional[int]:
+    return req[3] if len(req) > 4 else None
+
+
+def path_key(req: list) -> Optional[str]:
+    return req[2][1] if len(req) > 2 and len(req[2]) > 2 else None
+
+
+# Secondary indexes, built on first use, map these keys to row ids in req_list.
+INDEX_KEYS: dict[str, Callable[[list], Optional[Hashable]]] = {
+    "ip": ip_key,
+    "status": status_key,
+    "path": path_key,
+}
 
 
 class ChronoReqs(LogLineParser):
     def __init__(
             self,
-            instr: str,
+            instr: Union[str, Iterable[str]],
             ignored_ips: set[str],
+            line_parser: Optional[RegexLineParser] = None,
+            lazy: bool = False,
+            stats: Optional[IngestStats] = None,
     ):
         """
-        :param instr: log dump to process
+        :param instr: log dump to process, or any iterable of lines, such as an
+            open file or sys.stdin, which is consumed a line at a time.
         :param ignored_ips: ignore IPs we know and trust are only executing tests.
+        :param line_parser: parses lines in one pass, eg. COMBINED_PARSER, rather
+            than with our own find_ip_and_timestamp and append_rest_of_line.
+        :param lazy: hold LazyRequests, which parse fields beyond the IP and
+            time only when they're accessed. Ignored if line_parser is given.
+        :param stats: time each stage of parsing into these.
         :return:
         """
-        lines = instr.split("\n")
+        # Kept in time order, with times holding each request's epoch for
+        # bisecting.
         self.req_list: list[list] = []
+        self.times: list[int] = []
         self.ignored_ips: set[str] = ignored_ips
-        for line in lines:
+        self.line_parser: Optional[RegexLineParser] = line_parser
+        self.lazy = lazy
+        # Secondary indexes by name, see INDEX_KEYS.
+        self.indexes: dict[str, dict[Hashable, array]] = {}
+        self.stats: Optional[IngestStats] = stats
+        self.ingest(instr)
+
+    def ingest(self, instr: Union[str, Iterable[str]]):
+        """
+        Parses more lines, adding their requests to those we already hold.
+
+        :param instr: log dump, or any iterable of lines.
+        :return:
+        """
+        if self.stats is not None:
+            for req in self.stats.timed_requests(instr, self.parse_line):
+                self.add_request(req)
+            return
+        for line in iter_lines(instr):
             self.tokenise_line(line)
 
+    @classmethod
+    def from_req_list(cls, req_list: Iterable[list], ignored_ips: set[str]):
+        """
+        :param req_list: already parsed requests, eg. from a cache.
+        :param ignored_ips: ignore IPs we know and trust are only executing tests.
+        :return: ChronoReqs holding those requests.
+        """
+        chrono_reqs = cls((), ignored_ips)
+        for req in req_list:
+            chrono_reqs.add_request(req)
+        return chrono_reqs
+
+    def parse_line(self, line: str, stats: Optional[IngestStats] = None) \
+            -> Optional[list]:
+        """
+        :param line: what gets processed.
+        :param stats: to lap each stage in, and count rejected and ignored
+            lines. None when not timing.
+        :return: the request, or None if the line wasn't wanted.
+        """
+        if self.line_parser is not None:
+            ip_req = self.line_parser.parse(line)
+            if stats is not None:
+                stats.lap("regex")
+            if ip_req is None:
+                if stats is not None:
+                    stats.rejected += 1
+                return
+            ignored = ip_req[0] in self.ignored_ips
+            if stats is not None:
+                stats.lap("filter")
+                stats.ignored += ignored
+            if ignored:
+                return
+            ip_req[1].insert(1, ip_req[0].rjust(16))
+            return ip_req[1]
+        finds = self.find_ip_and_timestamp(line, stats)
+        if finds is None:
+            return
+        ignored = finds[0] in self.ignored_ips
+        if stats is not None:
+            stats.lap("filter")
+            stats.ignored += ignored
+        if ignored:
+            return
+        if self.lazy:
+            req = LazyRequest(line, finds[1], finds[0].rjust(16), finds[2])
+            if stats is not None:
+                stats.lap("lazy_record")
+            return req
+        req = [finds[1], finds[0].rjust(16)]
+        self.append_rest_of_line(req, line, finds[2])
+        if stats is not None:
+            stats.lap("rest_of_line")
+        return req
+
     def tokenise_line(self, line: str):
         """
         :param line: what gets processed.
         :return:
         """
-        finds = self.find_ip_and_timestamp(line)
-        if finds is None or finds[0] in self.ignored_ips:
+        req = self.parse_line(line)
+        if req is not None:
+            self.add_request(req)
+
+    def add_request(self, req: list):
+        """
+        Keeps req_list in time order. Lines merged from docker logs can be a
+        little out of order, so those are inserted close to the end.
+
+        :param req: parsed request.
+        :return:
+        """
+        if not self.times or req[0] >= self.times[-1]:
+            for name, index in self.indexes.items():
+                key = INDEX_KEYS[name](req)
+                if key is not None:
+                    index.setdefault(key, array("I")).append(len(self.req_list))
+            self.req_list.append(req)
+            self.times.append(req[0])
+        else:
+            # Later row ids all shift, so indexes must be rebuilt.
+            self.indexes.clear()
+            i = bisect.bisect_right(self.times, req[0])
+            self.req_list.insert(i, req)
+            self.times.insert(i, req[0])
+
+    def iter_requests(self, instr: Union[str, Iterable[str]]) -> Iterator[list]:
+        """
+        Parses requests one at a time, without retaining them in req_list.
+
+        :param instr: log dump, or any iterable of lines.
+        :return: generator of requests, in the same form as req_list entries.
+        """
+        if self.stats is not None:
+            yield from self.stats.timed_requests(
+                instr, self.parse_line, "consume")
             return
-        self.req_list.append([finds[1], finds[0].rjust(16)])
-        self.append_rest_of_line(self.req_list[-1], line, finds[2])
+        for line in iter_lines(instr):
+            req = self.parse_line(line)
+            if req is not None:
+                yield req
+
+    def merge(self, other: "ChronoReqs"):
+        """
+        :param other: requests from later in the log, eg. the next chunk.
+        :return:
+        """
+        self.indexes.clear()
+        if self.times and other.times and other.times[0] < self.times[-1]:
+            self.req_list = list(heapq.merge(
+                self.req_list, other.req_list, key=itemgetter(0)))
+            self.times = [req[0] for req in self.req_list]
+        else:
+            self.req_list.extend(other.req_list)
+            self.times.extend(other.times)
+
+    def between(self, lower_dt: datetime.datetime,
+                upper_dt: datetime.datetime) -> ReqView:
+        """
+        Bisects, rather than scanning, for requests in a time range.
+
+        :param lower_dt: inclusive, naive datetimes are UTC.
+        :param upper_dt: inclusive.
+        :return: view of the requests from req_list.
+        """
+        return ReqView(
+            self.req_list,
+            bisect.bisect_left(self.times, to_epoch(lower_dt)),
+            bisect.bisect_right(self.times, to_epoch(upper_dt)))
+
+    def index(self, name: str) -> dict[Hashable, array]:
+        """
+        :param name: of the index, ie. a key of INDEX_KEYS.
+        :return: row ids in req_list, in time order, by key. Built on first
+            use, then kept up to date as requests are appended.
+        """
+        index = self.indexes.get(name)
+        if index is None:
+            key_func = INDEX_KEYS[name]
+            index = {}
+            for row, req in enumerate(self.req_list):
+                key = key_func(req)
+                if key is not None:
+                    rows = index.get(key)
+                    if rows is None:
+                        rows = index[key] = array("I")
+                    rows.append(row)
+            self.indexes[name] = index
+        return index
+
+    def reqs_at(self, rows: Iterable[int]) -> list[list]:
+        return list(map(self.req_list.__getitem__, rows))
+
+    def reqs_from(self, ip: str) -> list[list]:
+        return self.reqs_at(self.index("ip").get(ip, ()))
+
+    def reqs_with_status(self, code: int) -> list[list]:
+        return self.reqs_at(self.index("status").get(code, ()))
+
+    def reqs_for_path(self, path: str) -> list[list]:
+        return self.reqs_at(self.index("path").get(path, ()))
+
+    def most_requests(self, k: Optional[int] = None) -> list[str]:
+        """
+        As ReqByIP.most_requests, from the IP index.
+
+        :param k: only the k IPs with the most requests.
+        :return: IPs in ascending order of requests made.
+        """
+        index = self.index("ip")
+        if k is None:
+            return sorted(index, key=lambda ip: len(index[ip]))
+        return heapq.nlargest(k, index, key=lambda ip: len(index[ip]))[::-1]
+
+    def count_failures_by_ip(self) -> dict[str, int]:
+        """
+        As ReqByIP.count_failures_from_dict, only visiting failed requests.
+
+        :return: 4xx responses by IP, including IPs with none.
+        """
+        counts = dict.fromkeys(self.index("ip"), 0)
+        for code, rows in self.index("status").items():
+            if 400 <= code < 500:
+                for req in self.reqs_at(rows):
+                    counts[req[1].strip()] += 1
+        return counts
+
+    def filter_by_status_by_ip(self, min_code: int, max_code: int) \
+            -> dict[str, list[list]]:
+        """
+        As ReqByIP.filter_dict_between_status_code, from the status index.
+
+        :param min_code: inclusive.
+        :param max_code: inclusive.
+        :return: requests by IP, in time order, including IPs with none.
+            Requests are laid out as in req_list.
+        """
+        by_ip = {ip: [] for ip in self.index("ip")}
+        for req in self.reqs_at(heapq.merge(*[
+                rows for code, rows in self.index("status").items()
+                if min_code <= code <= max_code])):
+            by_ip[req[1].strip()].append(req)
+        return by_ip
 
     @staticmethod
     def get_failures(req_list):
@@ -50,41 +333,47 @@ class ChronoReqs(LogLineParser):
         return {x[1] : [x[0], *x[2:]] for x in req_list}
 
     @staticmethod
-    def requests_per_period(req_list: list[list], period: datetime.timedelta) \
+    def requests_per_period(req_list: Sequence[list], period: datetime.timedelta) \
             -> tuple[list[datetime], list[list]]:
-        date_cursor = datetime.datetime.strptime(
-            req_list[0][0], INTERNAL_DT_FORMAT)
-        upper_dt = datetime.datetime.strptime(
-            req_list[-1][0], INTERNAL_DT_FORMAT)
-        list_curs = 0
-        bucketed_reqs = []
-        bucket_starts = []
-        while date_cursor < upper_dt:
-            cursor_limit = date_cursor + period
-            bucket = []
-            while datetime.datetime.strptime(
-                    req_list[list_curs][0], INTERNAL_DT_FORMAT
-            ) < cursor_limit:
-                bucket.append(req_list[list_curs])
-                list_curs += 1
-                if list_curs == len(req_list):
-                    break
-            bucketed_reqs.append(bucket)
-            bucket_starts.append(date_cursor)
-            date_cursor = cursor_limit
-        return bucket_starts, bucketed_reqs
+        """
+        :param req_list: may be member, or already filtered.
+        :param period: width of each bucket, the first starting at the first
+            request.
+        :return: bucket start times, and the requests in each bucket.
+        """
+        return bucketize(req_list, period)
+
+    @staticmethod
+    def counts_per_period(req_list: Sequence[list], period: datetime.timedelta,
+                          key: Optional[Callable[[list], Hashable]] = None) \
+            -> tuple[list[datetime], Union[array, dict[Hashable, array]]]:
+        """
+        For graphing, eg. with key=bucketing.by_path_prefix(["/wp", "/static"]).
+
+        :param key: if given, counts are made separately per key.
+        :return: bucket start times, and the count of requests in each.
+        """
+        return bucketize(req_list, period, key, counts_only=True)
+
+    @staticmethod
+    def status_classes_per_period(req_list: Sequence[list],
+                                  period: datetime.timedelta) \
+            -> tuple[list[datetime], dict[str, array]]:
+        """
+        :return: bucket start times, and counts by "2xx", "4xx" etc.
+        """
+        return bucketize(req_list, period, by_status_class, counts_only=True)
 
     @staticmethod
     def filter_by_status(req_list, min_code: int, max_code: int):
         return [req for req in req_list if min_code <= req[3] <= max_code]
 
     @staticmethod
-    def failures_per_period(req_list, period: datetime.timedelta)\
-            -> tuple[list[datetime], list[list]]:
+    def failures_per_period(req_list, period: datetime.timedelta,
+                            counts_only: bool = False)\
+            -> tuple[list[datetime], Union[list[list], array]]:
         fail_list = ChronoReqs.filter_by_status(req_list, 400, 499)
-        bucket_starts, bucketed_fails = ChronoReqs.requests_per_period(
-            fail_list, period)
-        return bucket_starts, bucketed_fails
+        return bucketize(fail_list, period, counts_only=counts_only)
 
     @staticmethod
     def get_paths(req_list: list[list]) -> Counter:
@@ -96,8 +385,9 @@ class ChronoReqs(LogLineParser):
 
     @staticmethod
     def get_reqs_matching(path_match: str, req_list: list[list]) -> list[list]:
+        matcher = re.compile(path_match).match
         return [req for req in req_list if
-                len(req[2]) > 2 and re.match(path_match, req[2][1])]
+                len(req[2]) > 2 and matcher(req[2][1])]
 
     @staticmethod
     def divide_reqs_by_path_prefixes(prefix_dict: dict[str, list], req_list: list[list]):
@@ -111,33 +401,66 @@ class ChronoReqs(LogLineParser):
         :param req_list: list of requests.
         :return: any requests that weren't matched.
         """
+        return ChronoReqs.divide_reqs_by_router(
+            prefix_router(tuple(prefix_dict)), prefix_dict, req_list)
+
+    @staticmethod
+    def divide_reqs_by_patterns(pattern_dict: dict[str, list], req_list: list[list]):
+        """
+        As divide_reqs_by_path_prefixes, but for regexes, eg. a block list.
+
+        :param pattern_dict: indexed by regexes, matched as re.match would.
+        :param req_list: list of requests.
+        :return: any requests that weren't matched.
+        """
+        return ChronoReqs.divide_reqs_by_router(
+            pattern_router(tuple(pattern_dict)), pattern_dict, req_list)
+
+    @staticmethod
+    def divide_reqs_by_router(router: Union[PrefixRouter, PatternRouter],
+                              key_dict: dict[str, list], req_list: list[list]):
         unmatched = []
+        # Far fewer paths than requests, so only route each path once.
+        routes = {}
         for req in req_list:
             if len(req[2]) > 2:
-                for k in prefix_dict.keys():
-                    if req[2][1].startswith(k):
-                        prefix_dict[k].append(req)
-                        break
+                path = req[2][1]
+                if path in routes:
+                    k = routes[path]
                 else:
+                    k = routes[path] = router.match(path)
+                if k is None:
                     unmatched.append(req)
+                else:
+                    key_dict[k].append(req)
         return unmatched
 
+    @staticmethod
+    def is_unusual_meth_path_proto(req: list) -> bool:
+        """
+        :return: whether the request line had more than a method, path and
+            protocol. Unclosed request lines had nothing, so aren't.
+        """
+        return len(req) > 2 and len(req[2]) > 3
+
     @staticmethod
     def find_unusual_meth_path_protos(req_list: list[list]) -> list[list]:
         # These appear very suspicious. Logins, miners, rpc... Sus.
         # Block if enough volume.
-        return [req for req in req_list if len(req[2]) > 3]
+        is_unusual = ChronoReqs.is_unusual_meth_path_proto
+        return [req for req in req_list if is_unusual(req)]
 
     @staticmethod
-    def remove_googlebot(req_list: list[list]) -> list[list]:
-        res = requests.get("https://developers.google.com/static/search/apis/ipranges/googlebot.json")
-        prefixes = res.json()["prefixes"]
-        cidrs = [ipaddress.ip_network(d["ipv4Prefix"]) for d in prefixes if "ipv4Prefix" in d]
-        return [x for x in req_list if not any(
-            ipaddress.ip_address(x[1].strip()) in cidr
-            for cidr in cidrs)]
+    def remove_googlebot(req_list: list[list],
+                         cache_dir: Optional[str] = None) -> list[list]:
+        """
+        :param req_list: may be member, or already filtered.
+        :param cache_dir: where to keep googlebot's ranges, see range_providers.
+        :return: requests that weren't from googlebot.
+        """
+        from range_providers import PROVIDERS
+        return PROVIDERS["googlebot"].get(cache_dir).filter_out(req_list)
 
 
 
-# todo add graphing by period, by status code, all bucketed, probably.
 # todo check, and graph, paths now that nginx is denying the main offenders.
\ No newline at end of file
@@ -0,0 +1,152 @@
+"""
+Parses a log file across several processes. The file is cut into chunks at
+line boundaries, each chunk is parsed by ChronoReqs or ReqByIP in a worker and
+the results are merged back in file order, so they're identical to having
+parsed the file in one go.
+
+Compressed logs can't be cut into chunks, so several logs, eg. rotations, are
+instead parsed a log per worker.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Type, TypeVar
+
+from compressed import compression_of, open_log
+from ingest_stats import IngestStats
+from mmap_reader import iter_mmap_lines
+from native_list import ChronoReqs
+from regex_parser import RegexLineParser
+from reqs_by_ip import ReqByIP
+
+# Bounds how much of the file each worker holds at once.
+CHUNK_BYTES = 32 * 1024 * 1024
+Reqs = TypeVar("Reqs", ChronoReqs, ReqByIP)
+
+
+def chunk_offsets(filename: str, n_chunks: int) -> list[tuple[int, int]]:
+    """
+    :param filename: log file to divide.
+    :param n_chunks: how many roughly equal chunks we'd like. We may return
+        fewer if lines are long compared to the chunks.
+    :return: start and end byte offsets, each range ending after a newline
+        (or at the end of the file).
+    """
+    size = os.path.getsize(filename)
+    offsets = []
+    start = 0
+    with open(filename, "rb") as log_file:
+        for i in range(1, n_chunks):
+            if start >= size:
+                break
+            log_file.seek(max(start, size * i // n_chunks))
+            log_file.readline()
+            end = log_file.tell()
+            if end > start:
+                offsets.append((start, end))
+                start = end
+    if start < size or not offsets:
+        offsets.append((start, size))
+    return offsets
+
+
+def parse_chunk(cls: Type[Reqs], filename: str, start: int, end: int,
+                ignored_ips: set[str],
+                line_parser: Optional[RegexLineParser] = None,
+                stats: Optional[IngestStats] = None) -> Reqs:
+    """
+    :param stats: a new IngestStats, returned filled in as the result's stats.
+    """
+    return cls(iter_mmap_lines(filename, start, end), ignored_ips, line_parser,
+               stats=stats)
+
+
+def merge_from_workers(merged: Reqs, reqs: Reqs,
+                       stats: Optional[IngestStats]):
+    """
+    :param reqs: parsed in a worker, whose stats are its own copy.
+    :param stats: to add reqs' stats to.
+    """
+    merged.merge(reqs)
+    if stats is not None:
+        stats.merge(reqs.stats)
+
+
+def parse_file(cls: Type[Reqs], filename: str, ignored_ips: set[str],
+               workers: int,
+               line_parser: Optional[RegexLineParser] = None,
+               stats: Optional[IngestStats] = None) -> Reqs:
+    """
+    :param cls: ChronoReqs or ReqByIP.
+    :param filename: log file to parse.
+    :param ignored_ips: ignore IPs we know and trust are only executing tests.
+    :param workers: number of processes to parse with.
+    :param line_parser: passed on to cls.
+    :param stats: to add each worker's line counts and stage times to.
+    :return: instance of cls, as if the whole file had been passed to it.
+    """
+    n_chunks = max(workers, -(-os.path.getsize(filename) // CHUNK_BYTES))
+    offsets = chunk_offsets(filename, n_chunks)
+    merged = cls((), ignored_ips, line_parser)
+    with ProcessPoolExecutor(workers) as executor:
+        for reqs in executor.map(parse_chunk, *zip(*[
+                (cls, filename, start, end, ignored_ips, line_parser,
+                 None if stats is None else IngestStats())
+                for start, end in offsets])):
+            merge_from_workers(merged, reqs, stats)
+    return merged
+
+
+def parse_file_with(cls: Type[Reqs], filename: str, ignored_ips: set[str],
+                    workers: int = 1, use_mmap: bool = False,
+                    line_parser: Optional[RegexLineParser] = None,
+                    stats: Optional[IngestStats] = None) -> Reqs:
+    """
+    Avoids starting a process pool when only one worker is wanted.
+
+    :param use_mmap: read through mmap_reader. Chunks parsed by workers always
+        are, since they need a regular file to seek in anyway.
+    :param line_parser: passed on to cls.
+    :param stats: passed on to cls, or given each worker's counts.
+    """
+    if compression_of(filename):
+        with open_log(filename) as log_file:
+            return cls(log_file, ignored_ips, line_parser, stats=stats)
+    if workers > 1:
+        return parse_file(cls, filename, ignored_ips, workers, line_parser,
+                          stats)
+    if use_mmap:
+        return cls(iter_mmap_lines(filename), ignored_ips, line_parser,
+                   stats=stats)
+    with open(filename) as log_file:
+        return cls(log_file, ignored_ips, line_parser, stats=stats)
+
+
+def parse_files(cls: Type[Reqs], filenames: list[str], ignored_ips: set[str],
+                workers: int = 1, use_mmap: bool = False,
+                line_parser: Optional[RegexLineParser] = None,
+                stats: Optional[IngestStats] = None) -> Reqs:
+    """
+    :param filenames: logs, in the order their requests were made, eg. from
+        compressed.expand_logs.
+    :param workers: number of processes, each parsing a whole log. A single
+        plain log is parsed in chunks instead.
+    :param stats: to count lines and time stages in, in whichever process.
+    :return: instance of cls, as if the logs had been passed to it in turn.
+    """
+    if len(filenames) == 1:
+        return parse_file_with(cls, filenames[0], ignored_ips, workers,
+                               use_mmap, line_parser, stats)
+    merged = cls((), ignored_ips, line_parser)
+    if workers > 1:
+        with ProcessPoolExecutor(workers) as executor:
+            for reqs in executor.map(parse_file_with, *zip(*[
+                    (cls, filename, ignored_ips, 1, use_mmap, line_parser,
+                     None if stats is None else IngestStats())
+                    for filename in filenames])):
+                merge_from_workers(merged, reqs, stats)
+    else:
+        for filename in filenames:
+            merged.merge(parse_file_with(cls, filename, ignored_ips, 1,
+                                         use_mmap, line_parser, stats))
+    return merged
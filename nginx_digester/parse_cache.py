@@ -0,0 +1,206 @@
+"""
+Saves parsed logs to disk so repeat analyses of the same log skip parsing.
+
+Requests are stored in ColumnarReqs' layout: a JSON header, then each typed
+array's raw bytes, then the string tables as JSON. Loading is little more than
+reading the file. A cache is only used if the source log's size, mtime and the
+hash of its head and tail are those it was made from.
+"""
+
+import hashlib
+import json
+import os
+import sys
+from array import array
+from typing import Optional, Type
+
+from columnar import ColumnarReqs, StringTable
+from ingest_stats import IngestStats
+from native_list import ChronoReqs
+from parallel import Reqs, parse_file_with
+from regex_parser import RegexLineParser
+
+MAGIC = b"NGXCACHE"
+# Bump when the parsed layout or key changes, to invalidate existing caches.
+CACHE_VERSION = 3
+# How much of each end of the log to hash.
+HASH_BYTES = 1024 * 1024
+
+
+def source_key(filename: str, ignored_ips: set[str],
+               line_parser: Optional[RegexLineParser] = None) -> dict:
+    """
+    :param filename: log the cache is made from.
+    :param ignored_ips: part of the key since they change what was parsed.
+    :param line_parser: likewise, its pattern is part of the key.
+    :return: what must match for a cache to be used.
+    """
+    stat = os.stat(filename)
+    sha1 = hashlib.sha1()
+    with open(filename, "rb") as log_file:
+        sha1.update(log_file.read(HASH_BYTES))
+        if stat.st_size > HASH_BYTES:
+            log_file.seek(max(HASH_BYTES, stat.st_size - HASH_BYTES))
+            sha1.update(log_file.read())
+    return {"version": CACHE_VERSION, "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns, "sha1": sha1.hexdigest(),
+            "ignored_ips": sorted(ignored_ips),
+            "line_parser": line_parser and line_parser.matcher.pattern}
+
+
+def cache_path(cache_dir: str, filename: str) -> str:
+    name = hashlib.sha1(os.path.abspath(filename).encode()).hexdigest()
+    return os.path.join(cache_dir, name + ".ngxc")
+
+
+def save(col_reqs: ColumnarReqs, path: str, key: dict,
+         meta: Optional[dict] = None):
+    """
+    :param col_reqs: requests to save.
+    :param path: file to write, replaced atomically.
+    :param key: from source_key, stored to validate the cache on loading.
+    :param meta: anything else to keep in the header, see load_header.
+    """
+    columns = [getattr(col_reqs, name) for name in ColumnarReqs.COLUMNS]
+    header = {
+        "key": key, "byteorder": sys.byteorder,
+        "columns": [[col.typecode, len(col)] for col in columns],
+    }
+    if meta is not None:
+        header["meta"] = meta
+    header = json.dumps(header).encode()
+    tables = json.dumps([getattr(col_reqs, name).strings
+                         for name in ColumnarReqs.TABLES]).encode()
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as cache_file:
+        cache_file.write(MAGIC)
+        cache_file.write(len(header).to_bytes(8, "little"))
+        cache_file.write(header)
+        for col in columns:
+            col.tofile(cache_file)
+        cache_file.write(tables)
+    os.replace(tmp_path, path)
+
+
+def load_header(path: str) -> Optional[dict]:
+    """
+    Reads only the header, not the requests.
+
+    :param path: file written by save.
+    :return: the header, or None if path isn't a cache, or is corrupt.
+    """
+    try:
+        with open(path, "rb") as cache_file:
+            prefix = cache_file.read(len(MAGIC) + 8)
+            if prefix[:len(MAGIC)] != MAGIC:
+                return
+            return json.loads(cache_file.read(
+                int.from_bytes(prefix[len(MAGIC):], "little")))
+    except (FileNotFoundError, ValueError):
+        return
+
+
+def load(path: str, key: Optional[dict] = None) -> Optional[ColumnarReqs]:
+    """
+    :param path: file written by save.
+    :param key: if given, the key the cache must have been saved with.
+    :return: the requests, or None if there's no valid cache.
+    """
+    try:
+        with open(path, "rb") as cache_file:
+            content = cache_file.read()
+    except FileNotFoundError:
+        return
+    if content[:len(MAGIC)] != MAGIC:
+        return
+    try:
+        return from_content(content, key)
+    except (ValueError, KeyError, TypeError):
+        # Truncated or corrupt, so as good as missing.
+        return
+
+
+def from_content(content: bytes, key: Optional[dict]) -> Optional[ColumnarReqs]:
+    """
+    :raise ValueError: if content is truncated or corrupt.
+    """
+    curs = len(MAGIC) + 8
+    header_end = curs + int.from_bytes(content[len(MAGIC):curs], "little")
+    header = json.loads(content[curs:header_end])
+    if key is not None and header["key"] != key:
+        return
+    ignored_ips = set(header["key"]["ignored_ips"])
+    col_reqs = ColumnarReqs((), ignored_ips)
+    curs = header_end
+    view = memoryview(content)
+    for name, (typecode, length) in zip(ColumnarReqs.COLUMNS, header["columns"]):
+        col = array(typecode)
+        end = curs + col.itemsize * length
+        if end > len(content):
+            raise ValueError("Cache is truncated")
+        col.frombytes(view[curs:end])
+        if header["byteorder"] != sys.byteorder:
+            col.byteswap()
+        setattr(col_reqs, name, col)
+        curs = end
+    for name, strings in zip(ColumnarReqs.TABLES, json.loads(content[curs:])):
+        table = StringTable()
+        table.strings = strings
+        table.ids = {x: i for i, x in enumerate(strings)}
+        setattr(col_reqs, name, table)
+    return col_reqs
+
+
+def cached_stats(path: str, requests: int) -> IngestStats:
+    """
+    :param path: of a cache just loaded.
+    :param requests: it held.
+    :return: the line counts of parsing the log the cache was made from, if
+        it was saved with them.
+    """
+    stats = IngestStats()
+    counts = ((load_header(path) or {}).get("meta") or {}).get("counts")
+    if counts is None:
+        stats.requests = requests
+        stats.lines_counted = False
+    else:
+        stats.lines, stats.requests, stats.rejected, stats.ignored = counts
+    return stats
+
+
+def cached_parse(cls: Type[Reqs], filename: str, ignored_ips: set[str],
+                 cache_dir: str, workers: int = 1, use_mmap: bool = False,
+                 line_parser: Optional[RegexLineParser] = None,
+                 stats: Optional[IngestStats] = None) -> Reqs:
+    """
+    Loads filename's requests from the cache if it's still valid, otherwise
+    parses it and saves the cache for next time.
+
+    :param cls: ChronoReqs or ReqByIP.
+    :param cache_dir: where caches are kept, created if needed.
+    :param stats: to add the line counts of parsing to, kept in the cache so
+        loading it adds them too. Not timed, the caller timing the whole.
+    :return: instance of cls, as if the whole file had been passed to it.
+    """
+    key = source_key(filename, ignored_ips, line_parser)
+    path = cache_path(cache_dir, filename)
+    col_reqs = load(path, key)
+    if col_reqs is None:
+        parse_stats = None if stats is None else IngestStats()
+        chrono_reqs = parse_file_with(ChronoReqs, filename, ignored_ips,
+                                      workers, use_mmap, line_parser,
+                                      parse_stats)
+        os.makedirs(cache_dir, exist_ok=True)
+        meta = None
+        if parse_stats is not None:
+            stats.merge(parse_stats)
+            meta = {"counts": [parse_stats.lines, parse_stats.requests,
+                               parse_stats.rejected, parse_stats.ignored]}
+        save(ColumnarReqs.from_req_list(chrono_reqs.req_list, ignored_ips),
+             path, key, meta)
+        if cls is ChronoReqs:
+            return chrono_reqs
+        return cls.from_req_list(chrono_reqs.req_list, ignored_ips)
+    if stats is not None:
+        stats.merge(cached_stats(path, len(col_reqs)))
+    return cls.from_req_list(col_reqs.rows(), ignored_ips)
@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+"""
+Keeps parsed requests on disk in hourly or daily partitions, for weeks of logs
+that wouldn't fit in memory as one ChronoReqs.
+
+Each partition is one or more segments, parse_cache files in ColumnarReqs'
+layout, whose headers also hold the segment's min and max time, a histogram
+of its statuses, its IPs and a Bloom filter of its paths. Queries read just
+those headers to skip segments which can't match, then only turn the rows
+they want into requests.
+
+Partitions are named by their start in UTC, eg. 220919-08, so they sort in
+time order as INTERNAL_DT_FORMAT does. Adding to a partition writes a new
+segment, eg. 220919-08.1, rather than rewriting it, and compact merges each
+partition's segments back into one.
+
+    partitioned_store.py store_dir 'access.log*' --granularity day --compact
+"""
+
+import argparse
+import base64
+import bisect
+import datetime
+import heapq
+import json
+import os
+import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, repeat
+from operator import itemgetter
+from typing import Callable, Iterable, NamedTuple, Optional, Sequence, TypeVar
+
+from aggregators import stable_hash
+from bucketing import bucketize
+from columnar import ABSENT, ColumnarReqs, ip_to_int
+from line_parser import from_epoch, to_epoch
+from native_list import ChronoReqs
+from parse_cache import load, load_header, save
+from regex_parser import RegexLineParser
+
+# Seconds in, and name format of, each partition.
+GRANULARITIES = {"hour": (60 * 60, "%y%m%d-%H"),
+                 "day": (24 * 60 * 60, "%y%m%d")}
+SUFFIX = ".ngxc"
+SETTINGS_FILE = "store.json"
+# Bump when the partition layout changes.
+STORE_VERSION = 2
+# Requests held in memory before they're written to their partitions.
+FLUSH_ROWS = 1_000_000
+# About a 1% false positive rate.
+BLOOM_BITS_PER_PATH = 10
+BLOOM_HASHES = 7
+
+T = TypeVar("T")
+
+
+def bloom_bits(item: str, n_bits: int) -> Iterable[int]:
+    # Double hashing stands in for BLOOM_HASHES independent hashes.
+    h = stable_hash(item)
+    h1, h2 = h >> 32, (h & 0xFFFFFFFF) | 1
+    return ((h1 + i * h2) % n_bits for i in range(BLOOM_HASHES))
+
+
+def make_bloom(items: Sequence[str]) -> str:
+    """
+    :return: Bloom filter of items, base64 encoded to keep in a header.
+    """
+    bits = bytearray(max(8, len(items) * BLOOM_BITS_PER_PATH // 8))
+    n_bits = len(bits) * 8
+    for item in items:
+        for bit in bloom_bits(item, n_bits):
+            bits[bit >> 3] |= 1 << (bit & 7)
+    return base64.b64encode(bits).decode()
+
+
+def in_bloom(item: str, bloom: str) -> bool:
+    """
+    :param bloom: from make_bloom.
+    :return: False if item certainly isn't in it.
+    """
+    bits = base64.b64decode(bloom)
+    return all(bits[bit >> 3] & 1 << (bit & 7)
+               for bit in bloom_bits(item, len(bits) * 8))
+
+
+def partition_meta(col_reqs: ColumnarReqs, start: int) -> dict:
+    """
+    :param col_reqs: the segment's requests, in time order.
+    :param start: epoch the partition starts at.
+    :return: what queries need to decide whether to load the segment.
+    """
+    statuses = Counter(code for code, request_id in zip(
+        col_reqs.statuses, col_reqs.request_ids) if request_id != ABSENT)
+    return {
+        "start": start,
+        "min_epoch": col_reqs.epochs[0],
+        "max_epoch": col_reqs.epochs[-1],
+        "rows": len(col_reqs),
+        "statuses": {str(code): count for code, count in sorted(statuses.items())},
+        # As ip_to_int gives them, sorted for bisect.
+        "ips": sorted(set(col_reqs.ips)),
+        # The paths themselves are in the string table after the rows.
+        "path_bloom": make_bloom(col_reqs.paths.strings),
+    }
+
+
+class PartitionQuery(NamedTuple):
+    """
+    Which requests to load, each field restricting them unless it's None.
+    """
+    # Inclusive epochs.
+    lower: Optional[int] = None
+    upper: Optional[int] = None
+    # Inclusive range of status codes.
+    statuses: Optional[tuple[int, int]] = None
+    ip: Optional[str] = None
+    path: Optional[str] = None
+
+    def could_match(self, meta: dict) -> bool:
+        """
+        :param meta: from partition_meta.
+        :return: False if none of the segment's requests can match.
+        """
+        if self.lower is not None and meta["max_epoch"] < self.lower:
+            return False
+        if self.upper is not None and meta["min_epoch"] > self.upper:
+            return False
+        if self.statuses is not None and not any(
+                self.statuses[0] <= int(code) <= self.statuses[1]
+                for code in meta["statuses"]):
+            return False
+        if self.ip is not None:
+            ip_int = ip_to_int(self.ip)
+            ips = meta["ips"]
+            i = bisect.bisect_left(ips, ip_int)
+            if i == len(ips) or ips[i] != ip_int:
+                return False
+        return self.path is None or in_bloom(self.path, meta["path_bloom"])
+
+    def row_ids(self, col_reqs: ColumnarReqs) -> Sequence[int]:
+        """
+        :param col_reqs: a segment's requests.
+        :return: ids of the rows which match.
+        """
+        row_ids = range(
+            0 if self.lower is None else
+            bisect.bisect_left(col_reqs.epochs, self.lower),
+            len(col_reqs) if self.upper is None else
+            bisect.bisect_right(col_reqs.epochs, self.upper))
+        if self.statuses is not None:
+            row_ids = col_reqs.filter_by_status(*self.statuses, row_ids)
+        if self.ip is not None:
+            row_ids = col_reqs.filter_by_ip(self.ip, row_ids)
+        if self.path is not None:
+            row_ids = col_reqs.filter_by_path(self.path, row_ids)
+        return row_ids
+
+
+def time_query(lower_dt: Optional[datetime.datetime] = None,
+               upper_dt: Optional[datetime.datetime] = None,
+               **kwargs) -> PartitionQuery:
+    """
+    :param lower_dt: inclusive, naive datetimes are UTC.
+    :param upper_dt: inclusive.
+    :param kwargs: other PartitionQuery fields.
+    """
+    return PartitionQuery(
+        None if lower_dt is None else to_epoch(lower_dt),
+        None if upper_dt is None else to_epoch(upper_dt), **kwargs)
+
+
+def load_rows(paths: Sequence[str], query: PartitionQuery) -> list[list]:
+    """
+    :param paths: a partition's segments.
+    :return: their matching requests, as ChronoReqs holds them, in time order.
+    """
+    segments = []
+    for path in paths:
+        col_reqs = load(path)
+        segments.append(col_reqs.rows(query.row_ids(col_reqs)))
+    if len(segments) == 1:
+        return list(segments[0])
+    return list(heapq.merge(*segments, key=itemgetter(0)))
+
+
+def count_paths(paths: Sequence[str], query: PartitionQuery) -> Counter:
+    """
+    :param paths: a partition's segments.
+    :return: their matching requests counted by path, without making them
+        into requests.
+    """
+    path_counts = Counter()
+    for path in paths:
+        col_reqs = load(path)
+        path_counts.update(col_reqs.get_paths(query.row_ids(col_reqs)))
+    return path_counts
+
+
+def partition_of(segment: str) -> str:
+    """
+    :param segment: eg. 220919-08.1.
+    :return: name of the partition it's part of, eg. 220919-08.
+    """
+    return segment.split(".", 1)[0]
+
+
+class PartitionedStore:
+    def __init__(self, directory: str, granularity: Optional[str] = None):
+        """
+        :param directory: where partitions are kept, created if needed.
+        :param granularity: "hour" or "day". Fixed once the store is made,
+            "hour" if not given then.
+        """
+        self.directory = directory
+        settings_path = os.path.join(directory, SETTINGS_FILE)
+        try:
+            with open(settings_path) as settings_file:
+                settings = json.load(settings_file)
+        except FileNotFoundError:
+            settings = {"version": STORE_VERSION,
+                        "granularity": granularity or "hour"}
+            os.makedirs(directory, exist_ok=True)
+            with open(settings_path + ".tmp", "w") as settings_file:
+                json.dump(settings, settings_file)
+            os.replace(settings_path + ".tmp", settings_path)
+        if settings["version"] != STORE_VERSION:
+            raise ValueError(f"{directory} holds a version {settings['version']} "
+                             f"store, not {STORE_VERSION}")
+        if granularity is not None and granularity != settings["granularity"]:
+            raise ValueError(f"{directory} holds {settings['granularity']} "
+                             f"partitions, not {granularity}")
+        self.granularity: str = settings["granularity"]
+        self.step, self.name_format = GRANULARITIES[self.granularity]
+        # Segment headers' meta by name, read on first use.
+        self.metas: dict[str, dict] = {}
+
+    def partition_path(self, name: str) -> str:
+        """
+        :param name: of a partition, meaning its first segment, or of any
+            segment.
+        """
+        return os.path.join(self.directory, name + SUFFIX)
+
+    def segments(self) -> dict[str, dict]:
+        """
+        :return: meta of each segment by name, in time order of their
+            partitions, then the order they were added in.
+        """
+        names = sorted(
+            (x[:-len(SUFFIX)] for x in os.listdir(self.directory)
+             if x.endswith(SUFFIX)),
+            key=lambda x: (partition_of(x), int(x.partition(".")[2] or 0)))
+        for name in names:
+            if name not in self.metas:
+                self.metas[name] = load_header(self.partition_path(name))["meta"]
+        return {name: self.metas[name] for name in names}
+
+    def partitions(self) -> dict[str, list[str]]:
+        """
+        :return: names of each partition's segments, by partition in time order.
+        """
+        partitions = {}
+        for name in self.segments():
+            partitions.setdefault(partition_of(name), []).append(name)
+        return partitions
+
+    def add(self, reqs: Iterable[list]):
+        """
+        Writes requests to their partitions, as new segments of those already
+        there, see compact. Adding the same log twice stores it twice.
+
+        :param reqs: as ChronoReqs holds them, ideally in about time order.
+        :return:
+        """
+        pending: dict[int, list[list]] = {}
+        n_pending = 0
+        step = self.step
+        for req in reqs:
+            pending.setdefault(req[0] - req[0] % step, []).append(req)
+            n_pending += 1
+            if n_pending >= FLUSH_ROWS:
+                self.flush(pending)
+                pending = {}
+                n_pending = 0
+        self.flush(pending)
+
+    def flush(self, pending: dict[int, list[list]]):
+        """
+        Only writes new segments, leaving existing ones untouched.
+
+        :param pending: requests by the start of their partition.
+        """
+        partitions = self.partitions()
+        for start, req_list in pending.items():
+            req_list.sort(key=itemgetter(0))
+            name = from_epoch(start).strftime(self.name_format)
+            segments = partitions.get(name, ())
+            if segments:
+                name += "." + str(
+                    max(int(x.partition(".")[2] or 0) for x in segments) + 1)
+            self.write_segment(name, req_list, start)
+
+    def write_segment(self, name: str, req_list: Sequence[list], start: int):
+        """
+        :param req_list: in time order.
+        :param start: epoch the segment's partition starts at.
+        """
+        col_reqs = ColumnarReqs.from_req_list(req_list, set())
+        # Partitions can hold logs parsed with any ignored_ips.
+        key = {"version": STORE_VERSION, "ignored_ips": []}
+        save(col_reqs, self.partition_path(name), key,
+             partition_meta(col_reqs, start))
+        self.metas.pop(name, None)
+
+    def compact(self):
+        """
+        Merges each partition's segments into one, so queries open a file per
+        partition again.
+        """
+        segments = self.segments()
+        for name, names in self.partitions().items():
+            if len(names) == 1:
+                continue
+            paths = [self.partition_path(x) for x in names]
+            self.write_segment(name, load_rows(paths, PartitionQuery()),
+                               segments[names[0]]["start"])
+            for segment in names:
+                if segment != name:
+                    os.remove(self.partition_path(segment))
+                    self.metas.pop(segment, None)
+
+    def ingest(self, filenames: Iterable[str], ignored_ips: set[str],
+               line_parser: Optional[RegexLineParser] = None):
+        """
+        Parses logs straight into partitions, holding no more than FLUSH_ROWS
+        requests at a time.
+
+        :param filenames: plain or compressed logs, ideally oldest first.
+        """
+        from compressed import iter_log_lines
+        self.add(ChronoReqs((), ignored_ips, line_parser).iter_requests(
+            iter_log_lines(filenames)))
+
+    def map_partitions(self, func: Callable[[str, PartitionQuery], T],
+                       query: PartitionQuery, workers: int = 1) -> Iterable[T]:
+        """
+        :param func: called with the paths of each partition's segments which
+            could match, and query.
+        :param workers: processes to run func in, if more than 1.
+        :return: func's results, in time order.
+        """
+        partitions = {}
+        for name, meta in self.segments().items():
+            if query.could_match(meta):
+                partitions.setdefault(partition_of(name), []).append(
+                    self.partition_path(name))
+        paths = list(partitions.values())
+        if workers > 1 and len(paths) > 1:
+            with ProcessPoolExecutor(min(workers, len(paths))) as executor:
+                return list(executor.map(func, paths, repeat(query)))
+        return map(func, paths, repeat(query))
+
+    def load(self, query: PartitionQuery = PartitionQuery(),
+             workers: int = 1) -> ChronoReqs:
+        """
+        :param query: which requests to load.
+        :param workers: processes to load partitions with.
+        :return: just the matching requests.
+        """
+        return ChronoReqs.from_req_list(chain.from_iterable(
+            self.map_partitions(load_rows, query, workers)), set())
+
+    def between(self, lower_dt: datetime.datetime,
+                upper_dt: datetime.datetime, workers: int = 1) -> ChronoReqs:
+        """
+        :param lower_dt: inclusive, naive datetimes are UTC.
+        :param upper_dt: inclusive.
+        """
+        return self.load(time_query(lower_dt, upper_dt), workers)
+
+    def failures_per_period(
+            self, period: datetime.timedelta,
+            lower_dt: Optional[datetime.datetime] = None,
+            upper_dt: Optional[datetime.datetime] = None,
+            counts_only: bool = False, workers: int = 1):
+        """
+        As ChronoReqs.failures_per_period, skipping partitions without 4xx
+        responses.
+        """
+        reqs = self.load(time_query(lower_dt, upper_dt, statuses=(400, 499)),
+                         workers)
+        return bucketize(reqs.req_list, period, counts_only=counts_only)
+
+    def get_paths(self, lower_dt: Optional[datetime.datetime] = None,
+                  upper_dt: Optional[datetime.datetime] = None,
+                  workers: int = 1) -> Counter:
+        """
+        As ChronoReqs.get_paths, counting within each partition rather than
+        loading requests.
+        """
+        path_counts = Counter()
+        for counts in self.map_partitions(
+                count_paths, time_query(lower_dt, upper_dt), workers):
+            path_counts.update(counts)
+        return path_counts
+
+
+def main(arg_list: list):
+    from compressed import expand_logs
+    from main import KNOWN_FRIENDLY_TESTERS
+    parser = argparse.ArgumentParser(
+        description="Parse logs into a partitioned store")
+    parser.add_argument('directory')
+    parser.add_argument('filenames', nargs='*', metavar='filename',
+                        help="logs, plain or compressed, or globs of them")
+    parser.add_argument('--granularity', choices=tuple(GRANULARITIES),
+                        help="of new stores, hour by default")
+    parser.add_argument('--compact', action='store_true',
+                        help="then merge each partition's segments into one")
+    args = parser.parse_args(arg_list)
+    store = PartitionedStore(args.directory, args.granularity)
+    if args.filenames:
+        store.ingest(expand_logs(args.filenames), KNOWN_FRIENDLY_TESTERS)
+    if args.compact:
+        store.compact()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
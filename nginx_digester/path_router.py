@@ -0,0 +1,88 @@
+"""
+Classifies paths against many prefixes or patterns at once, keeping the first
+match wins semantics of trying each in turn.
+
+PrefixRouter walks a trie, so the cost is proportional to the path's length
+rather than the number of prefixes. PatternRouter joins the patterns into one
+alternation, which the regex engine tries in order. Routers are cached by
+their prefixes/patterns, so repeated calls don't rebuild them.
+"""
+
+import functools
+import re
+from typing import Iterable, Optional
+
+# Trie nodes are dicts of character to child node, with this key holding the
+# position of the prefix ending at that node.
+END = ""
+
+
+class PrefixRouter:
+    def __init__(self, prefixes: Iterable[str]):
+        """
+        :param prefixes: in priority order.
+        """
+        self.prefixes = list(prefixes)
+        self.root: dict = {}
+        for position, prefix in enumerate(self.prefixes):
+            node = self.root
+            for char in prefix:
+                node = node.setdefault(char, {})
+            node.setdefault(END, position)
+
+    def match(self, path: str) -> Optional[str]:
+        """
+        :return: the earliest of our prefixes that path starts with, if any.
+        """
+        node = self.root
+        best = node.get(END)
+        for char in path:
+            node = node.get(char)
+            if node is None:
+                break
+            position = node.get(END)
+            if position is not None and (best is None or position < best):
+                best = position
+        return None if best is None else self.prefixes[best]
+
+
+class PatternRouter:
+    def __init__(self, patterns: Iterable[str]):
+        """
+        :param patterns: regexes, in priority order, matched at the start of
+            the path as re.match does.
+        """
+        self.patterns = list(patterns)
+        try:
+            # Each pattern gets a named group so we can tell which matched.
+            # Numbered back references would be thrown off by the extra groups.
+            if any(re.search(r"\\\d|\(\?P=", x) for x in self.patterns):
+                raise re.error("back reference")
+            self.combined = re.compile("|".join(
+                f"(?P<_{i}>{x})" for i, x in enumerate(self.patterns)))
+            self.matchers = None
+        except re.error:
+            self.combined = None
+            self.matchers = [re.compile(x).match for x in self.patterns]
+
+    def match(self, path: str) -> Optional[str]:
+        """
+        :return: the earliest of our patterns matching path, if any.
+        """
+        if self.combined is not None:
+            matches = self.combined.match(path)
+            return None if matches is None else \
+                self.patterns[int(matches.lastgroup[1:])]
+        for pattern, matcher in zip(self.patterns, self.matchers):
+            if matcher(path):
+                return pattern
+
+
+@functools.lru_cache(maxsize=64)
+def prefix_router(prefixes: tuple[str, ...]) -> PrefixRouter:
+    return PrefixRouter(prefixes)
+
+
+@functools.lru_cache(maxsize=64)
+def pattern_router(patterns: tuple[str, ...]) -> PatternRouter:
+    return PatternRouter(patterns)
@@ -0,0 +1,133 @@
+"""
+Queries main.py can run on a parsed log, each giving rows for JSON or CSV
+output. They lean on ChronoReqs's indexes, so only the requests they're
+about are visited.
+
+Only the standard library is imported here, ChronoReqs arrives as an argument,
+so that main.py can import this cheaply.
+"""
+
+import argparse
+import csv
+import datetime
+import heapq
+import json
+import re
+from typing import Callable, Iterable, NamedTuple, TextIO
+
+PERIOD_UNITS = {"s": 1, "m": 60, "h": 60 * 60, "d": 24 * 60 * 60}
+period_matcher = re.compile(r"(\d+)([smhd]?)")
+
+
+def parse_period(period: str) -> datetime.timedelta:
+    """
+    :param period: eg. "90" or "90s", "15m", "1h" or "1d".
+    """
+    matches = period_matcher.fullmatch(period)
+    if not matches or not int(matches.group(1)):
+        raise argparse.ArgumentTypeError(f"bad period {period}")
+    return datetime.timedelta(seconds=int(matches.group(1)) *
+                              PERIOD_UNITS[matches.group(2) or "s"])
+
+
+def count_failures(reqs, rows: Iterable[int]) -> int:
+    req_list = reqs.req_list
+    return sum(1 for row in rows
+               if len(req_list[row]) > 4 and 400 <= req_list[row][3] < 500)
+
+
+def top_ips(reqs, args: argparse.Namespace) -> Iterable[tuple]:
+    ip_index = reqs.index("ip")
+    for ip in reversed(reqs.most_requests(args.top)):
+        yield ip, len(ip_index[ip]), count_failures(reqs, ip_index[ip])
+
+
+def top_paths(reqs, args: argparse.Namespace) -> Iterable[tuple]:
+    path_index = reqs.index("path")
+    for path in heapq.nlargest(args.top, path_index,
+                               key=lambda x: len(path_index[x])):
+        yield path, len(path_index[path]), count_failures(reqs, path_index[path])
+
+
+def failures_per_period(reqs, args: argparse.Namespace) -> Iterable[tuple]:
+    starts, counts = reqs.failures_per_period(
+        reqs.req_list, args.period, counts_only=True)
+    return ((start.isoformat(), count) for start, count in zip(starts, counts))
+
+
+def suspicious(reqs, args: argparse.Namespace) -> Iterable[tuple]:
+    """
+    IPs the AbuseDetector would've blocked, or that made unusual requests
+    (see ChronoReqs.find_unusual_meth_path_protos), most unusual requests
+    first.
+    """
+    from abuse_detector import AbuseDetector
+    flagged = {x.ip: x for x in AbuseDetector().watch(reqs.req_list)}
+    unusual = {}
+    for req in reqs.find_unusual_meth_path_protos(reqs.req_list):
+        ip = req[1].strip()
+        unusual[ip] = unusual.get(ip, 0) + 1
+    ip_index = reqs.index("ip")
+    rows = []
+    for ip in flagged.keys() | unusual.keys():
+        candidate = flagged.get(ip)
+        rows.append((ip, len(ip_index[ip]), count_failures(reqs, ip_index[ip]),
+                     unusual.get(ip, 0), candidate and candidate.reason or "",
+                     candidate and candidate.deny_snippet() or ""))
+    return heapq.nlargest(args.top, rows, key=lambda x: (x[3], x[2], x[1]))
+
+
+def labels(reqs, args: argparse.Namespace) -> Iterable[tuple]:
+    from classifier import LABELS, RequestClassifier
+    counts = {label: [0, set(), 0] for label in LABELS}
+    for req, label in zip(reqs.req_list,
+                          RequestClassifier().classify_all(reqs.req_list)):
+        label_counts = counts[label]
+        label_counts[0] += 1
+        label_counts[1].add(req[1])
+        if len(req) > 4 and 400 <= req[3] < 500:
+            label_counts[2] += 1
+    return ((label, n_reqs, len(ips), failures)
+            for label, (n_reqs, ips, failures) in counts.items())
+
+
+class Query(NamedTuple):
+    run: Callable[..., Iterable[tuple]]
+    fields: tuple[str, ...]
+    help: str
+
+
+QUERIES = {
+    "top-ips": Query(top_ips, ("ip", "requests", "failures"),
+                     "IPs making the most requests"),
+    "top-paths": Query(top_paths, ("path", "requests", "failures"),
+                       "most requested paths"),
+    "failures-per-period": Query(failures_per_period, ("start", "failures"),
+                                 "4xx responses per period"),
+    "suspicious": Query(suspicious, ("ip", "requests", "failures", "unusual",
+                                     "reason", "deny"),
+                        "IPs with unusual requests, or which hit the abuse "
+                        "detector's limits"),
+    "labels": Query(labels, ("label", "requests", "ips", "failures"),
+                    "requests from scanners, crawlers, bots and browsers"),
+}
+
+
+def add_query_args(parser: argparse.ArgumentParser):
+    parser.add_argument('--format', choices=("json", "csv"), default="json")
+    parser.add_argument('--top', type=int, default=20,
+                        help="rows for top-ips, top-paths and suspicious")
+    parser.add_argument('--period', type=parse_period,
+                        default=datetime.timedelta(hours=1),
+                        help="for failures-per-period, eg. 15m, 1h or 1d")
+
+
+def write_rows(query: Query, rows: Iterable[tuple], output_format: str,
+               out: TextIO):
+    if output_format == "csv":
+        writer = csv.writer(out)
+        writer.writerow(query.fields)
+        writer.writerows(rows)
+    else:
+        json.dump([dict(zip(query.fields, row)) for row in rows], out)
+        out.write("\n")
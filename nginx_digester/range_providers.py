@@ -0,0 +1,128 @@
+"""
+IP ranges published by crawlers and clouds, fetched at most once per TTL and
+kept on disk. Refreshes are conditional on the ETag, and if we can't fetch
+(air-gapped, or the site is down) we fall back to the last copy we had, then
+to a snapshot bundled in data/, not trying again for an hour.
+
+`requests` is only imported when a fetch is actually needed.
+"""
+
+import json
+import os
+import time
+from typing import Callable, Optional
+
+from ip_ranges import IPRangeIndex
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+DEFAULT_CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+    "nginx_digester")
+DEFAULT_TTL = 24 * 60 * 60
+# Seconds before a failed fetch is tried again.
+DEFAULT_RETRY_AFTER = 60 * 60
+FETCH_TIMEOUT = 10
+
+
+def aws_ranges(ranges_json: dict) -> IPRangeIndex:
+    return IPRangeIndex(
+        [x["ip_prefix"] for x in ranges_json["prefixes"]] +
+        [x["ipv6_prefix"] for x in ranges_json["ipv6_prefixes"]])
+
+
+class RangeProvider:
+    def __init__(
+            self,
+            name: str,
+            url: str,
+            to_index: Callable[[dict], IPRangeIndex] = IPRangeIndex.from_prefixes,
+            snapshot: Optional[str] = None,
+            ttl: float = DEFAULT_TTL,
+            retry_after: float = DEFAULT_RETRY_AFTER,
+    ):
+        """
+        :param name: names the cached files.
+        :param url: where the JSON ranges are published.
+        :param to_index: makes an index from the published JSON.
+        :param snapshot: bundled copy of the JSON, for when all else fails.
+        :param ttl: seconds before we check for a newer copy.
+        :param retry_after: seconds before we try again after a fetch fails,
+            meanwhile using a stale copy or the snapshot.
+        """
+        self.name = name
+        self.url = url
+        self.to_index = to_index
+        self.snapshot = snapshot
+        self.ttl = ttl
+        self.retry_after = retry_after
+
+    def fetch(self, cache_path: str, meta: dict) -> dict:
+        """
+        :return: meta, updated if the fetch succeeded. Raises if it didn't.
+        """
+        import requests
+        headers = {"If-None-Match": meta["etag"]} if meta.get("etag") else {}
+        res = requests.get(self.url, headers=headers, timeout=FETCH_TIMEOUT)
+        res.raise_for_status()
+        if res.status_code != 304:
+            res.json()  # Don't cache anything we can't read.
+            with open(cache_path + ".tmp", "wb") as cache_file:
+                cache_file.write(res.content)
+            os.replace(cache_path + ".tmp", cache_path)
+        return {"etag": res.headers.get("ETag", meta.get("etag")),
+                "fetched_at": time.time()}
+
+    def get(self, cache_dir: Optional[str] = None) -> IPRangeIndex:
+        """
+        :param cache_dir: where our copy is kept, DEFAULT_CACHE_DIR if None.
+        :return: index of the provider's ranges.
+        """
+        cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        cache_path = os.path.join(cache_dir, self.name + ".json")
+        meta_path = os.path.join(cache_dir, self.name + ".meta.json")
+        meta = {}
+        if os.path.exists(meta_path):
+            with open(meta_path) as meta_file:
+                meta = json.load(meta_file)
+        if not os.path.exists(cache_path):
+            # Only failed attempts are worth remembering without a copy.
+            meta = {"failed_at": meta["failed_at"]} if "failed_at" in meta else {}
+        now = time.time()
+        if now - meta.get("fetched_at", 0) >= self.ttl and \
+                now - meta.get("failed_at", 0) >= self.retry_after:
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                meta = self.fetch(cache_path, meta)
+            except Exception:
+                if not os.path.exists(cache_path) and not self.snapshot:
+                    raise
+                # Don't try again on every call while the site is down.
+                meta["failed_at"] = time.time()
+            try:
+                with open(meta_path + ".tmp", "w") as meta_file:
+                    json.dump(meta, meta_file)
+                os.replace(meta_path + ".tmp", meta_path)
+            except OSError:
+                # The cache dir can't be written, so nothing is remembered
+                # and we fetch again next time.
+                pass
+        if not os.path.exists(cache_path):
+            # Fall back to the bundled snapshot, a stale copy being used as is.
+            if not self.snapshot:
+                raise FileNotFoundError(
+                    f"No copy of {self.name}'s ranges, and fetching them failed")
+            cache_path = self.snapshot
+        with open(cache_path) as ranges_file:
+            return self.to_index(json.load(ranges_file))
+
+
+PROVIDERS = {provider.name: provider for provider in (
+    RangeProvider(
+        "googlebot",
+        "https://developers.google.com/static/search/apis/ipranges/googlebot.json",
+        snapshot=os.path.join(DATA_DIR, "googlebot.json")),
+    RangeProvider("bingbot", "https://www.bing.com/toolbox/bingbot.json"),
+    RangeProvider("google_cloud", "https://www.gstatic.com/ipranges/cloud.json"),
+    RangeProvider("aws", "https://ip-ranges.amazonaws.com/ip-ranges.json",
+                  aws_ranges),
+)}
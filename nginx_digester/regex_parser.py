@@ -0,0 +1,98 @@
+"""
+Pulls every field out of a line with a single compiled regex, instead of the
+find()/split() cursor walking of LogLineParser. Either use COMBINED_PARSER,
+which makes the same requests as LogLineParser from the same lines, unclosed
+requests included, or compile an nginx log_format string with
+RegexLineParser.from_log_format.
+
+Pass one as line_parser to ChronoReqs or ReqByIP to use it.
+"""
+
+import re
+from typing import Optional
+
+from line_parser import convert_timestamp
+
+COMBINED_PATTERN = (
+    r'(?P<remote_addr>(?:(?:25[0-5]|(?:2[0-4]|1\d|[1-9]|)\d)\.){3}'
+    r'(?:25[0-5]|(?:2[0-4]|1\d|[1-9]|)\d)).{5}'
+    r'\[(?P<time_local>[^\]]{26})\]'
+    # An unclosed request, eg. a scanner's, leaves just the IP and time.
+    r'(?: "(?P<request>[^"]*)" (?P<status>\d+) (?P<body_bytes_sent>\d+)'
+    # Optional: referrer, user_agent, x_forwarded_for:
+    r'(?:[^"]*"(?P<http_referer>[^"]*)")?'
+    r'(?:[^"]*"(?P<http_user_agent>[^"]*)")?'
+    r'(?:[^"]*"(?P<http_x_forwarded_for>[^"]*)")?)?'
+)
+# Fields we can make requests from, the rest of a log_format is matched but
+# not captured.
+REQUIRED_VARS = ("remote_addr", "time_local", "request", "status",
+                 "body_bytes_sent")
+OPTIONAL_VARS = ("http_referer", "http_user_agent", "http_x_forwarded_for")
+log_format_var = re.compile(r"\$(\w+)|\$\{(\w+)\}")
+
+
+class RegexLineParser:
+    def __init__(self, pattern: str):
+        """
+        :param pattern: regex with named groups for at least REQUIRED_VARS.
+        """
+        self.matcher = re.compile(pattern)
+        missing = set(REQUIRED_VARS) - set(self.matcher.groupindex)
+        if missing:
+            raise ValueError(f"log format lacks {', '.join(sorted(missing))}")
+        self.optional_vars = tuple(
+            x for x in OPTIONAL_VARS if x in self.matcher.groupindex)
+
+    @classmethod
+    def from_log_format(cls, log_format: str) -> "RegexLineParser":
+        """
+        :param log_format: as given to nginx's log_format directive, eg.
+            '$remote_addr - $remote_user [$time_local] "$request" ...'
+        :return: parser for lines in that format.
+        """
+        pattern = []
+        seen = set()
+        prev_end = 0
+        for var in log_format_var.finditer(log_format):
+            pattern.append(re.escape(log_format[prev_end:var.start()]))
+            name = var.group(1) or var.group(2)
+            before = log_format[var.start() - 1:var.start()]
+            if before == '"':
+                value = r'[^"]*'
+            elif before == "[":
+                value = r"[^\]]*"
+            else:
+                value = r"\S*"
+            if name in seen or name not in REQUIRED_VARS + OPTIONAL_VARS:
+                pattern.append(f"(?:{value})")
+            else:
+                pattern.append(f"(?P<{name}>{value})")
+                seen.add(name)
+            prev_end = var.end()
+        pattern.append(re.escape(log_format[prev_end:]))
+        return cls("".join(pattern) + "$")
+
+    def parse(self, line: str) -> Optional[tuple[str, list]]:
+        """
+        :param line: what gets processed.
+        :return: the IP and a request laid out as in ReqByIP, just its time if
+            the request wasn't closed, or None if the line didn't match.
+        """
+        matches = self.matcher.match(line)
+        if matches is None:
+            return
+        fields = matches.groupdict()
+        req = [convert_timestamp(f"[{fields['time_local']}]")]
+        if fields["request"] is None:
+            return fields["remote_addr"], req
+        req.extend([fields["request"].split(), int(fields["status"]),
+                    int(fields["body_bytes_sent"])])
+        for var in self.optional_vars:
+            if fields[var] is None:
+                break
+            req.append(fields[var])
+        return fields["remote_addr"], req
+
+
+COMBINED_PARSER = RegexLineParser(COMBINED_PATTERN)
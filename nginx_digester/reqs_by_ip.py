@@ -1,41 +1,150 @@
 import datetime
+import heapq
+from typing import Iterable, Iterator, Optional, Union
 
-from line_parser import LogLineParser, INTERNAL_DT_FORMAT
+from ingest_stats import IngestStats
+from line_parser import LogLineParser, iter_lines, to_epoch
+from regex_parser import RegexLineParser
 
 
 class ReqByIP(LogLineParser):
     def __init__(
             self,
-            instr: str,
+            instr: Union[str, Iterable[str]],
             ignored_ips: set[str],
+            line_parser: Optional[RegexLineParser] = None,
+            stats: Optional[IngestStats] = None,
     ):
         """
-        :param instr: log dump to process
+        :param instr: log dump to process, or any iterable of lines, such as an
+            open file or sys.stdin, which is consumed a line at a time.
         :param ignored_ips: ignore IPs we know and trust are only executing tests.
+        :param line_parser: parses lines in one pass, eg. COMBINED_PARSER, rather
+            than with our own find_ip_and_timestamp and append_rest_of_line.
+        :param stats: time each stage of parsing into these.
         :return:
         """
-        lines = instr.split("\n")
         self.by_ip: dict[str, list] = {}
         self.ignored_ips: set[str] = ignored_ips
-        for line in lines:
+        self.line_parser: Optional[RegexLineParser] = line_parser
+        self.stats: Optional[IngestStats] = stats
+        self.ingest(instr)
+
+    def ingest(self, instr: Union[str, Iterable[str]]):
+        """
+        Parses more lines, adding their requests to those we already hold.
+
+        :param instr: log dump, or any iterable of lines.
+        :return:
+        """
+        if self.stats is not None:
+            for ip_req in self.stats.timed_requests(instr, self.parse_line):
+                self.add_request(ip_req)
+            return
+        for line in iter_lines(instr):
             self.index_line_by_ip(line)
 
+    @classmethod
+    def from_req_list(cls, req_list: Iterable[list], ignored_ips: set[str]):
+        """
+        :param req_list: already parsed requests, laid out as in
+            ChronoReqs.req_list, eg. from a cache.
+        :param ignored_ips: ignore IPs we know and trust are only executing tests.
+        :return: ReqByIP holding those requests.
+        """
+        req_dict = cls((), ignored_ips)
+        for req in req_list:
+            req_dict.by_ip.setdefault(req[1].strip(), []).append(
+                [req[0], *req[2:]])
+        return req_dict
+
+    def parse_line(self, line: str, stats: Optional[IngestStats] = None) \
+            -> Optional[tuple[str, list]]:
+        """
+        :param line: what gets processed.
+        :param stats: to lap each stage in, and count rejected and ignored
+            lines. None when not timing.
+        :return: the IP and its request, or None if the line wasn't wanted.
+        """
+        if self.line_parser is not None:
+            ip_req = self.line_parser.parse(line)
+            if stats is not None:
+                stats.lap("regex")
+            if ip_req is None:
+                if stats is not None:
+                    stats.rejected += 1
+                return
+            finds = None
+        else:
+            finds = self.find_ip_and_timestamp(line, stats)
+            if finds is None:
+                return
+            ip_req = finds[0], [finds[1]]
+        ignored = ip_req[0] in self.ignored_ips
+        if stats is not None:
+            stats.lap("filter")
+            stats.ignored += ignored
+        if ignored:
+            return
+        if finds is not None:
+            self.append_rest_of_line(ip_req[1], line, finds[2])
+            if stats is not None:
+                stats.lap("rest_of_line")
+        return ip_req
+
+    def add_request(self, ip_req: tuple[str, list]):
+        """
+        :param ip_req: IP and its request, as parse_line returns them.
+        :return:
+        """
+        self.by_ip.setdefault(ip_req[0], []).append(ip_req[1])
+
     def index_line_by_ip(
             self,
             line: str):
         """
         :param line: what gets processed.
-        :param ignored_ips: ignore IPs we know and trust are only executing tests.
         :return:
         """
-        finds = self.find_ip_and_timestamp(line)
-        if finds is None or finds[0] in self.ignored_ips:
+        ip_req = self.parse_line(line)
+        if ip_req is not None:
+            self.by_ip.setdefault(ip_req[0], []).append(ip_req[1])
+
+    def iter_requests(self, instr: Union[str, Iterable[str]]) \
+            -> Iterator[tuple[str, list]]:
+        """
+        Parses requests one at a time, without retaining them in by_ip.
+
+        :param instr: log dump, or any iterable of lines.
+        :return: generator of IP, request tuples.
+        """
+        if self.stats is not None:
+            yield from self.stats.timed_requests(
+                instr, self.parse_line, "consume")
             return
-        self.by_ip.setdefault(finds[0], []).append([finds[1]])
-        self.append_rest_of_line(self.by_ip[finds[0]][-1], line, finds[2])
+        for line in iter_lines(instr):
+            ip_req = self.parse_line(line)
+            if ip_req is not None:
+                yield ip_req
+
+    def merge(self, other: "ReqByIP"):
+        """
+        :param other: requests from later in the log, eg. the next chunk.
+        :return:
+        """
+        for ip, reqs in other.by_ip.items():
+            self.by_ip.setdefault(ip, []).extend(reqs)
 
     @staticmethod
-    def most_requests(req_dict):
+    def most_requests(req_dict, k: Optional[int] = None):
+        """
+        :param k: only the k IPs with the most requests, found without
+            sorting them all.
+        :return: IPs in ascending order of requests made.
+        """
+        if k is not None:
+            return heapq.nlargest(
+                k, req_dict, key=lambda x: len(req_dict[x]))[::-1]
         sorted_keys = sorted(req_dict.keys(), key=lambda x: len(req_dict[x]))
         return sorted_keys
 
@@ -49,9 +158,10 @@ class ReqByIP(LogLineParser):
     def filter_between_times(req_dict: dict[str, list],
                              lower_dt: datetime,
                              upper_dt: datetime):
+        lower_epoch = to_epoch(lower_dt)
+        upper_epoch = to_epoch(upper_dt)
         filter_reqs = {ip: [
-            req for req in reqs if lower_dt <= datetime.datetime.strptime(
-                req[0], INTERNAL_DT_FORMAT) <= upper_dt]
+            req for req in reqs if lower_epoch <= req[0] <= upper_epoch]
             for ip, reqs in req_dict.items()}
         return filter_reqs
 
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Generates combined format logs of any length for benchmarking, resembling a
+real log, by default tests/access.log.
+
+Each line copies a line of the sample, so the mix of paths, statuses, user
+agents and bots, and which IPs make which requests, all follow the sample.
+Some lines get a new random IP instead, at the rate new IPs appeared in the
+sample, so distinct IPs grow with the log as they would. Non-request lines,
+eg. docker's debug output, are copied too. Times advance as a Poisson process.
+
+The same seed always gives the same log. Lines are generated one at a time, so
+1e8 lines need no more memory than 1e4.
+"""
+
+import argparse
+import datetime
+import os
+import random
+import sys
+from typing import Iterator, Optional
+
+from line_parser import LogLineParser, to_epoch
+
+SAMPLE_LOG = os.path.normpath(os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "tests", "access.log"))
+DEFAULT_START = datetime.datetime(2022, 9, 1)
+# Requests per second.
+DEFAULT_RATE = 50.0
+NGINX_TIME_FORMAT = "[%d/%b/%Y:%H:%M:%S +0000]"
+
+
+class LogProfile:
+    def __init__(self, rows: list[tuple[Optional[str], str]], new_ip_rate: float):
+        """
+        :param rows: IP and the rest of the line after the time, or None and
+            the whole line for lines that aren't requests.
+        :param new_ip_rate: chance of a line coming from a new IP.
+        """
+        self.rows = rows
+        self.new_ip_rate = new_ip_rate
+
+    @classmethod
+    def from_log(cls, filename: str = SAMPLE_LOG) -> "LogProfile":
+        rows = []
+        with open(filename) as log_file:
+            for line in log_file:
+                line = line.rstrip("\r\n")
+                finds = LogLineParser.find_ip_and_timestamp(line)
+                if finds is None:
+                    rows.append((None, line))
+                else:
+                    rows.append((finds[0], line[finds[2] - 1:]))
+        ips = {ip for ip, _ in rows if ip is not None}
+        return cls(rows, len(ips) / max(1, len(rows)))
+
+
+def generate_lines(n_lines: int, profile: Optional[LogProfile] = None,
+                   seed: int = 0, rate: float = DEFAULT_RATE,
+                   start: datetime.datetime = DEFAULT_START) -> Iterator[str]:
+    """
+    :param n_lines: how many lines to generate.
+    :param profile: what to imitate, LogProfile.from_log() if None.
+    :param seed: for the same lines every time.
+    :param rate: mean requests per second.
+    :param start: time of the first line.
+    :return: generator of lines, with line endings.
+    """
+    profile = profile or LogProfile.from_log()
+    rng = random.Random(seed)
+    rows = profile.rows
+    new_ip_rate = profile.new_ip_rate
+    epoch = float(to_epoch(start))
+    second = None
+    time_str = ""
+    for _ in range(n_lines):
+        ip, rest = rows[rng.randrange(len(rows))]
+        if ip is None:
+            yield rest + "\n"
+            continue
+        if rng.random() < new_ip_rate:
+            ip = ".".join(str(rng.randrange(1, 255)) for _ in range(4))
+        epoch += rng.expovariate(rate)
+        if int(epoch) != second:
+            second = int(epoch)
+            time_str = datetime.datetime.fromtimestamp(
+                second, datetime.timezone.utc).strftime(NGINX_TIME_FORMAT)
+        yield f"{ip} - - {time_str} {rest}\n"
+
+
+def write_log(filename: str, n_lines: int, **kwargs):
+    """
+    :param kwargs: see generate_lines.
+    """
+    with open(filename, "w") as log_file:
+        log_file.writelines(generate_lines(n_lines, **kwargs))
+
+
+def main(arg_list: list):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('output')
+    parser.add_argument('--lines', type=float, default=1e4,
+                        help="how many, eg. 1e6")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE,
+                        help="mean requests per second")
+    parser.add_argument('--sample', default=SAMPLE_LOG,
+                        help="log to imitate")
+    args = parser.parse_args(arg_list)
+    write_log(args.output, int(args.lines), seed=args.seed, rate=args.rate,
+              profile=LogProfile.from_log(args.sample))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,18 @@
+import pytest
+
+from main import KNOWN_FRIENDLY_TESTERS
+from native_list import ChronoReqs
+
+
+@pytest.fixture(scope="session")
+def log_text():
+    with open("access.log") as log_file:
+        return log_file.read()
+
+
+@pytest.fixture(scope="session")
+def chrono_reqs(log_text):
+    """
+    Parsed once for the whole session, so tests mustn't modify it.
+    """
+    return ChronoReqs(log_text, KNOWN_FRIENDLY_TESTERS)
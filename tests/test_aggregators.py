@@ -0,0 +1,104 @@
+import datetime
+import json
+import random
+import tracemalloc
+
+import pytest
+
+from aggregators import CountMinSketch, HyperLogLog, SpaceSaving, StreamingSummary, stable_hash
+from main import KNOWN_FRIENDLY_TESTERS, main
+from native_list import ChronoReqs
+from reqs_by_ip import ReqByIP
+
+
+def test_stable_hash():
+    assert stable_hash("/") == stable_hash("/")
+    assert stable_hash("/") != stable_hash("/feed/")
+    assert 0 <= stable_hash("x") < 2 ** 64
+
+
+def test_space_saving():
+    rng = random.Random(1)
+    top = SpaceSaving(10)
+    items = ["hot"] * 500 + ["warm"] * 200 + [str(rng.random()) for _ in range(2000)]
+    rng.shuffle(items)
+    for item in items:
+        top.add(item)
+    assert len(top.counts) == 10
+    (first, first_count), (second, second_count) = top.most_common(2)
+    assert (first, second) == ("hot", "warm")
+    assert 500 <= first_count <= 500 + top.errors["hot"]
+    assert sorted(x[2] for x in top.heap) == sorted(top.counts)
+
+
+def test_space_saving_evicts_smallest():
+    rng = random.Random(2)
+    top = SpaceSaving(20)
+    for _ in range(5000):
+        item = rng.randrange(100)
+        if item not in top.counts and len(top.counts) == top.k:
+            smallest = min(top.counts.values())
+            top.add(item, rng.randint(1, 3))
+            assert top.errors[item] == smallest
+        else:
+            top.add(item, rng.randint(1, 3))
+    assert len(top.heap) == len(top.counts) == 20
+
+
+def test_count_min_sketch():
+    sketch = CountMinSketch(width=256, depth=4)
+    for i in range(1000):
+        sketch.add(f"/path/{i % 50}")
+    estimates = [sketch.estimate(f"/path/{i}") for i in range(50)]
+    assert all(20 <= x <= 20 + 2 * 1000 / 256 for x in estimates)
+    assert sketch.estimate("/never") <= 2 * 1000 / 256
+
+
+@pytest.mark.parametrize("n", [0, 100, 50000])
+def test_hyper_log_log(n):
+    hll = HyperLogLog()
+    for i in range(n):
+        hll.add(f"10.0.{i // 256}.{i % 256}")
+        hll.add(f"10.0.{i // 256}.{i % 256}")
+    assert abs(len(hll) - n) <= 0.03 * n
+
+
+def test_summary_matches_exact(log_text, chrono_reqs):
+    summary = StreamingSummary(k=200).consume(chrono_reqs.req_list)
+    report = summary.report(10)
+    assert report["requests"] == len(chrono_reqs.req_list)
+    assert report["top_paths"] == ChronoReqs.get_paths(chrono_reqs.req_list).most_common(10)
+    req_dict = ReqByIP(log_text, KNOWN_FRIENDLY_TESTERS)
+    assert abs(report["distinct_ips"] - len(req_dict.by_ip)) <= 0.03 * len(req_dict.by_ip)
+    assert report["top_ips"][0][0] == ReqByIP.most_requests(req_dict.by_ip)[-1]
+    fails = ReqByIP.count_failures_from_dict(req_dict.by_ip)
+    assert report["failures"] == sum(fails.values())
+    failing = summary.top_failing_ips
+    for ip, count in failing.most_common(10):
+        assert count - failing.errors[ip] <= fails[ip] <= count
+    assert sum(report["bytes_per_period"].values()) == sum(
+        req[4] for req in chrono_reqs.req_list)
+    assert summary.path_counts.estimate("/xmlrpc.php") >= 4550
+    small = StreamingSummary(k=10).consume(chrono_reqs.req_list)
+    assert all(count <= small.top_paths.counts[path]
+               for path, count in small.top_path_counts())
+    assert json.loads(json.dumps(report)) is not None
+    with pytest.raises(ValueError):
+        StreamingSummary(period=datetime.timedelta(0))
+
+
+def test_summary_memory_is_bounded():
+    line = '10.{}.{}.{} - - [19/Sep/2022:08:01:21 +0000] "GET /p{} HTTP/1.1" 404 153 "-" "-"'
+    lines = (line.format(i >> 16 & 255, i >> 8 & 255, i & 255, i) for i in range(20000))
+    tracemalloc.start()
+    summary = StreamingSummary(k=50).consume(ChronoReqs((), set()).iter_requests(lines))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert summary.total == 20000
+    assert peak < 2 * 1024 * 1024
+
+
+def test_main_summary(capsys):
+    main(["access.log", "--summary"])
+    report = json.loads(capsys.readouterr().out)
+    assert report["requests"] == 16908
@@ -0,0 +1,99 @@
+import asyncio
+import json
+
+import pytest
+
+from async_ingest import END, for_each_request, ingest_sources, merge_by_time
+from main import KNOWN_FRIENDLY_TESTERS, main
+
+
+@pytest.fixture
+def split_logs(log_text, tmp_path):
+    """
+    access.log dealt round robin between three logs, as if from three containers.
+    """
+    lines = log_text.splitlines(keepends=True)
+    paths = [str(tmp_path / f"access{i}.log") for i in range(3)]
+    for i, path in enumerate(paths):
+        with open(path, "w") as log_file:
+            log_file.writelines(lines[i::3])
+    return paths
+
+
+def test_files_and_commands_merged(split_logs, chrono_reqs):
+    seen = []
+    for_each_request([split_logs[0], ["cat", split_logs[1]], split_logs[2]],
+                     seen.append, KNOWN_FRIENDLY_TESTERS, queue_size=50, lag=None)
+    assert [x[0] for x in seen] == chrono_reqs.times
+    assert sorted(map(repr, seen)) == sorted(map(repr, chrono_reqs.req_list))
+
+
+def test_ingest_sources(split_logs, chrono_reqs):
+    reqs = ingest_sources([*split_logs, ["cat", "access.log"]], KNOWN_FRIENDLY_TESTERS)
+    assert len(reqs.req_list) == 2 * len(chrono_reqs.req_list)
+    assert reqs.times == sorted(chrono_reqs.times * 2)
+
+
+def test_missing_source_raises(split_logs):
+    with pytest.raises(FileNotFoundError):
+        ingest_sources([split_logs[0], "no_such.log"], set())
+    with pytest.raises(FileNotFoundError):
+        ingest_sources([["no_such_command_here"]], set())
+
+
+def test_backpressure():
+    produced = []
+
+    async def fast(queue):
+        for i in range(1000):
+            await queue.put([i])
+            produced.append(i)
+        await queue.put(END)
+
+    async def slow(queue):
+        await asyncio.sleep(0.2)
+        await queue.put([0])
+        await queue.put(END)
+
+    async def run():
+        queues = [asyncio.Queue(10), asyncio.Queue(10)]
+        producers = [asyncio.ensure_future(fast(queues[0])),
+                     asyncio.ensure_future(slow(queues[1]))]
+        merged = merge_by_time(queues, lag=None)
+        first = await merged.__anext__()
+        # The fast producer was held up by its full queue while we waited.
+        assert len(produced) <= 12
+        rest = [x async for x in merged]
+        await asyncio.gather(*producers)
+        return [first] + rest
+    merged = asyncio.run(run())
+    assert [x[0] for x in merged] == [0, 0] + list(range(1, 1000))
+
+
+def test_quiet_source_only_holds_up_for_lag():
+    async def run():
+        queues = [asyncio.Queue(), asyncio.Queue()]
+        for i in range(5):
+            queues[0].put_nowait([i])
+        queues[0].put_nowait(END)
+        merged = []
+
+        async def quiet():
+            await asyncio.sleep(0.3)
+            queues[1].put_nowait([2])
+            queues[1].put_nowait(END)
+        producer = asyncio.ensure_future(quiet())
+        async for req in merge_by_time(queues, lag=0.05):
+            merged.append(req[0])
+        await producer
+        return merged
+    assert asyncio.run(run()) == [0, 1, 2, 3, 4, 2]
+
+
+def test_main_sources(split_logs, chrono_reqs, capsys):
+    main([split_logs[0], "--source", split_logs[1], "--command", f"cat {split_logs[2]}",
+          "--summary"])
+    assert json.loads(capsys.readouterr().out)["requests"] == len(chrono_reqs.req_list)
+    main(["--source", split_logs[0], "--command", f"cat {split_logs[1]}"])
+    main(["--source", "access.log", "--detect"])
+    assert capsys.readouterr().out.startswith("deny ")
@@ -0,0 +1,85 @@
+import json
+import runpy
+import sys
+
+import pytest
+
+import benchmark
+from benchmark import BY_IP_QUERIES, CHRONO_QUERIES, VARIANTS, compare, main, run, \
+    run_variant
+from synthetic_log import write_log
+
+
+def test_run(tmp_path):
+    log_path = str(tmp_path / "synthetic.log")
+    write_log(log_path, 3000)
+    results = run(log_path, repeat=1)
+    assert results["lines"] == 3000
+    assert set(results["variants"]) == set(VARIANTS)
+    for variant, variant_results in results["variants"].items():
+        assert variant_results["lines_per_sec"] > 0
+        assert variant_results["peak_rss_kb"] > 0
+        assert set(variant_results["queries"]) == set(
+            BY_IP_QUERIES if variant == "ReqByIP" else CHRONO_QUERIES)
+    json.dumps(results)
+
+
+@pytest.mark.parametrize("variant", VARIANTS)
+def test_run_variant(variant):
+    # In this process, unlike run's, so its queries are seen to work.
+    results = run_variant(variant, "access.log", repeat=2)
+    assert results["lines_per_sec"] > 0
+    assert list(results["queries"]) == list(VARIANTS[variant][2])
+
+
+def test_compare():
+    old = {"variants": {
+        "ChronoReqs": {"lines_per_sec": 100000, "peak_rss_kb": 1000,
+                       "queries": {"get_paths": 0.1, "between": 0.01}},
+        "Gone": {"lines_per_sec": 1, "peak_rss_kb": 1, "queries": {}},
+    }}
+    new = {"variants": {
+        "ChronoReqs": {"lines_per_sec": 70000, "peak_rss_kb": 1100,
+                       "queries": {"get_paths": 0.2, "between": 0.005, "new": 1}},
+        "ReqByIP": {"lines_per_sec": 1, "peak_rss_kb": 1, "queries": {}},
+    }}
+    assert compare(old, new) == ["ChronoReqs lines_per_sec: 100000 -> 70000",
+                                 "ChronoReqs get_paths: 0.1 -> 0.2"]
+    assert compare(old, new, tolerance=1.5) == []
+    assert compare(old, old) == []
+
+
+def test_main(tmp_path, capsys):
+    output = str(tmp_path / "results.json")
+    assert main(["--lines", "2000", "--repeat", "1", "--output", output]) is None
+    results = json.load(open(output))
+    assert results["seed"] == 0
+    for variant_results in results["variants"].values():
+        variant_results["lines_per_sec"] *= 10
+    json.dump(results, open(output, "w"))
+    assert main(["--log", "access.log", "--repeat", "1", "--compare", output]) == 1
+    out, err = capsys.readouterr()
+    assert json.loads(out)["lines"] == 16912
+    assert "lines_per_sec" in err
+
+
+def test_main_prints(tmp_path, capsys, monkeypatch):
+    # The sample log is found wherever we're run from.
+    monkeypatch.chdir(tmp_path)
+    old = str(tmp_path / "old.json")
+    main(["--lines", "500", "--repeat", "1", "--seed", "3", "--output", old])
+    assert main(["--lines", "500", "--repeat", "1", "--seed", "3", "--compare", old,
+                 "--tolerance", "1e9"]) == 0
+    out, err = capsys.readouterr()
+    assert json.loads(out)["seed"] == 3
+    assert err == ""
+
+
+def test_script(tmp_path, monkeypatch):
+    output = str(tmp_path / "results.json")
+    monkeypatch.setattr(sys, "argv", ["benchmark.py", "--lines", "500", "--repeat", "1",
+                                      "--output", output, "--compare", output])
+    with pytest.raises(SystemExit) as exit_info:
+        runpy.run_path(benchmark.__file__, run_name="__main__")
+    assert exit_info.value.code == 0
+    assert json.load(open(output))["lines"] == 500
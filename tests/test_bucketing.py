@@ -0,0 +1,68 @@
+import datetime
+import time
+
+import pytest
+
+from bucketing import bucketize, by_ip, by_path_prefix, by_status_class
+from native_list import ChronoReqs
+
+T0 = 1663574400  # 220919 080000
+
+
+def req(offset, code=200, path="/", ip="1.2.3.4"):
+    return [T0 + offset, ip.rjust(16), ["GET", path, "HTTP/1.1"], code, 1]
+
+
+def test_empty_buckets_and_boundaries():
+    reqs = [req(0), req(5), req(25), req(30)]
+    starts, buckets = bucketize(reqs, datetime.timedelta(seconds=10))
+    assert starts == [datetime.datetime(2022, 9, 19, 8, 0, s) for s in (0, 10, 20, 30)]
+    assert buckets == [reqs[:2], [], [reqs[2]], [reqs[3]]]
+    starts, counts = bucketize(reqs, datetime.timedelta(seconds=10), counts_only=True)
+    assert list(counts) == [2, 0, 1, 1]
+
+
+def test_single_time_and_empty():
+    starts, buckets = bucketize([req(0), req(0)], datetime.timedelta(minutes=5))
+    assert len(starts) == 1 and len(buckets[0]) == 2
+    assert bucketize([], datetime.timedelta(minutes=5)) == ([], [])
+    assert bucketize([], datetime.timedelta(minutes=5), by_ip) == ([], {})
+    with pytest.raises(ValueError):
+        bucketize([req(0)], datetime.timedelta(0))
+
+
+def test_group_by_keys():
+    reqs = [req(0, 200, "/static/a.js"), req(1, 404, "/wp/login"),
+            req(12, 403, "/wp/xmlrpc.php", "5.6.7.8"), req(15, 301, "")]
+    period = datetime.timedelta(seconds=10)
+    _, counts = bucketize(reqs, period, by_status_class, counts_only=True)
+    assert {k: list(v) for k, v in counts.items()} == {
+        "2xx": [1, 0], "4xx": [1, 1], "3xx": [0, 1]}
+    _, buckets = bucketize(reqs, period, by_ip)
+    assert buckets["5.6.7.8"] == [[], [reqs[2]]]
+    _, counts = bucketize(reqs, period, by_path_prefix(["/wp/", "/"], "none"),
+                          counts_only=True)
+    assert {k: list(v) for k, v in counts.items()} == {
+        "/": [1, 0], "/wp/": [1, 1], "none": [0, 1]}
+    reqs[3][2] = []
+    _, counts = bucketize(reqs, period, by_path_prefix(["/wp/"]), counts_only=True)
+    assert list(counts["other"]) == [1, 1]
+
+
+def test_chrono_reqs_helpers(chrono_reqs):
+    period = datetime.timedelta(minutes=5)
+    t0 = time.perf_counter()
+    starts, counts = ChronoReqs.counts_per_period(chrono_reqs.req_list, period)
+    t1 = time.perf_counter()
+    print("counts_per_period took {:.04f}".format(t1 - t0))
+    assert sum(counts) == len(chrono_reqs.req_list)
+    _, buckets = ChronoReqs.requests_per_period(chrono_reqs.req_list, period)
+    assert [len(x) for x in buckets] == list(counts)
+    _, by_class = ChronoReqs.status_classes_per_period(chrono_reqs.req_list, period)
+    _, fail_counts = ChronoReqs.failures_per_period(
+        chrono_reqs.req_list, period, counts_only=True)
+    assert sum(by_class["4xx"]) == sum(fail_counts) == len(
+        ChronoReqs.get_failures(chrono_reqs.req_list))
+    _, by_prefix = ChronoReqs.counts_per_period(
+        chrono_reqs.req_list, period, by_path_prefix(["/static/", "/"]))
+    assert sum(map(sum, by_prefix.values())) == len(chrono_reqs.req_list)
@@ -0,0 +1,82 @@
+import json
+from collections import Counter
+
+import pytest
+
+from classifier import BOT, BROWSER, CRAWLER, LABELS, SCANNER, \
+    RequestClassifier, classify_agent
+from main import KNOWN_FRIENDLY_TESTERS, main
+from native_list import ChronoReqs
+
+EPOCH = 1663574481
+IP = "44.44.44.44".rjust(16)
+
+
+@pytest.mark.parametrize("user_agent,label", [
+    ("Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:71.0) Gecko/20100101 Firefox/71.0", BROWSER),
+    ("Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)", CRAWLER),
+    ("Mozilla/5.0 (Linux; Android 7.0;) AppleWebKit/537.36 (KHTML, like Gecko) Mobile Safari/537.36 "
+     "(compatible; PetalBot;+https://webmaster.petalsearch.com/site/petalbot)", CRAWLER),
+    ("Mozilla/5.0 (compatible; Barkrowler/0.9; +https://babbar.tech/crawler)", CRAWLER),
+    ("Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) "
+     "Chrome/94.0.4590.2 Safari/537.36 Chrome-Lighthouse", BOT),
+    ("Go-http-client/1.1", BOT),
+    ("wp_is_mobile", BOT),
+    ("-", BOT),
+    ("Mozilla/5.0 zgrab/0.x", SCANNER),
+])
+def test_classify_agent(user_agent, label):
+    assert classify_agent(user_agent) == label
+
+
+@pytest.mark.parametrize("req,label", [
+    ([EPOCH, IP, ["GET", "/", "HTTP/1.1"], 200, 153, "-", "Mozilla/5.0 (X11; Linux x86_64)"], BROWSER),
+    ([EPOCH, IP, ["GET", "/", "HTTP/1.1"], 200, 153, "-", "curl/7.81.0"], BOT),
+    ([EPOCH, IP, ["GET", "/", "HTTP/1.1"], 200, 153], BOT),
+    ([EPOCH, IP, ["POST", "/wordpress/xmlrpc.php", "HTTP/1.1"], 404, 153, "-",
+      "Mozilla/5.0 (X11; Linux x86_64)"], SCANNER),
+    ([EPOCH, IP, ["GET", "/.env", "HTTP/1.1"], 404, 153, "-",
+      "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)"], SCANNER),
+    ([EPOCH, IP, ["CONNECT", "example.com:443", "HTTP/1.1"], 400, 157, "-", "-"], SCANNER),
+    ([EPOCH, IP, [r"\x16\x03\x01\x00{\x01\x00\x00w\x03\x03"], 400, 157, "-", "-"], SCANNER),
+    ([EPOCH, IP], SCANNER),
+])
+def test_classify(req, label):
+    assert RequestClassifier().classify(req) == label
+
+
+def test_memoizes_distinct_values(chrono_reqs):
+    classifier = RequestClassifier()
+    labels = classifier.classify_all(chrono_reqs.req_list)
+    assert len(labels) == len(chrono_reqs.req_list)
+    user_agents = {req[6] if len(req) > 6 else "-" for req in chrono_reqs.req_list}
+    paths = {req[2][1] for req in chrono_reqs.req_list if len(req[2]) > 2}
+    assert set(classifier.agent_labels) <= user_agents
+    assert set(classifier.scanner_paths) <= paths
+    assert labels == [RequestClassifier().classify(req) for req in chrono_reqs.req_list]
+    assert classifier.classify_all(chrono_reqs.req_list) == labels
+
+
+def test_lazy_records_match(log_text, chrono_reqs):
+    lazy_reqs = ChronoReqs(log_text, KNOWN_FRIENDLY_TESTERS, lazy=True)
+    assert RequestClassifier().classify_all(lazy_reqs.req_list) == \
+        RequestClassifier().classify_all(chrono_reqs.req_list)
+
+
+def test_divide_reqs_by_label(chrono_reqs):
+    label_dict = RequestClassifier().divide_reqs_by_label(chrono_reqs.req_list)
+    assert list(label_dict) == list(LABELS)
+    assert sum(map(len, label_dict.values())) == len(chrono_reqs.req_list)
+    assert all(len(req[2]) == 3 for label in (CRAWLER, BOT, BROWSER)
+               for req in label_dict[label])
+    assert set(map(str, ChronoReqs.find_unusual_meth_path_protos(chrono_reqs.req_list))) <= \
+        set(map(str, label_dict[SCANNER]))
+
+
+def test_labels_query(capsys, chrono_reqs):
+    main(["labels", "access.log"])
+    rows = json.loads(capsys.readouterr().out)
+    assert [x["label"] for x in rows] == list(LABELS)
+    counts = Counter(RequestClassifier().classify_all(chrono_reqs.req_list))
+    assert {x["label"]: x["requests"] for x in rows} == counts
+    assert all(0 < x["ips"] <= x["requests"] for x in rows)
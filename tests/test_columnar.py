@@ -0,0 +1,141 @@
+import datetime
+import sys
+from array import array
+
+import pytest
+
+from columnar import ColumnarReqs, StringTable, ip_to_int, int_to_ip, numpy_or_none
+from main import KNOWN_FRIENDLY_TESTERS
+from native_list import ChronoReqs
+
+
+@pytest.fixture(scope="module")
+def col_reqs(chrono_reqs):
+    return ColumnarReqs.from_req_list(chrono_reqs.req_list, KNOWN_FRIENDLY_TESTERS)
+
+
+@pytest.fixture(params=["numpy", "python"])
+def vectorised(request, monkeypatch):
+    """
+    Filters are checked both vectorised, and falling back to plain Python.
+    """
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setitem(sys.modules, "numpy", None)
+        assert numpy_or_none() is None
+    return request.param == "numpy"
+
+
+def test_string_table():
+    table = StringTable()
+    assert table.intern("/") == 0
+    assert table.intern("/feed/") == 1
+    assert table.intern("/") == 0
+    assert len(table) == 2
+    assert table[1] == "/feed/"
+
+
+def test_ip_conversion():
+    assert ip_to_int("1.2.3.4") == 0x01020304
+    assert int_to_ip(0xFFFFFFFF) == "255.255.255.255"
+
+
+def test_rows_round_trip(chrono_reqs, col_reqs):
+    assert len(col_reqs) == len(chrono_reqs.req_list)
+    assert list(col_reqs.rows()) == chrono_reqs.req_list
+
+
+def test_parses_lines(col_reqs):
+    with open("access.log") as log_file:
+        from_lines = ColumnarReqs(log_file, KNOWN_FRIENDLY_TESTERS)
+    assert from_lines.epochs == col_reqs.epochs
+    assert from_lines.request_ids == col_reqs.request_ids
+
+
+def test_unclosed_request():
+    col_reqs = ColumnarReqs.from_req_list(
+        [[1663574481, "44.44.44.44".rjust(16)]], set())
+    assert col_reqs.row(0) == [1663574481, "44.44.44.44".rjust(16)]
+    assert len(col_reqs.get_failures()) == 0
+
+
+def test_large_sizes():
+    # Sizes past 4 GiB are kept as they are, not clamped.
+    req_list = [[1663574481, "44.44.44.44".rjust(16), ["GET", "/big", "HTTP/1.1"],
+                 200, size] for size in (2 ** 32 - 1, 2 ** 32, 2 ** 40)]
+    col_reqs = ColumnarReqs.from_req_list(req_list, set())
+    assert list(col_reqs.rows()) == req_list
+
+
+def test_memory(chrono_reqs, col_reqs):
+    def deep_size(obj):
+        if isinstance(obj, list):
+            return sys.getsizeof(obj) + sum(map(deep_size, obj))
+        return sys.getsizeof(obj)
+    # Strings are shared between requests' lists, so this overstates a little.
+    list_bytes = deep_size(chrono_reqs.req_list)
+    print("list of lists {} bytes, columnar {} bytes".format(
+        list_bytes, col_reqs.nbytes()))
+    assert col_reqs.nbytes() * 10 < list_bytes
+
+
+def test_filters_match_chrono_reqs(chrono_reqs, col_reqs, vectorised):
+    assert list(col_reqs.rows(col_reqs.get_failures())) == \
+        ChronoReqs.get_failures(chrono_reqs.req_list)
+    assert list(col_reqs.rows(col_reqs.filter_by_status(300, 399))) == \
+        ChronoReqs.filter_by_status(chrono_reqs.req_list, 300, 399)
+    assert col_reqs.filter_by_status(600, 699).tolist() == []
+
+
+@pytest.mark.parametrize("to_row_ids", [list, lambda x: array("I", x),
+                                        lambda x: range(x[0], x[-1] + 1)])
+def test_filters_compose(chrono_reqs, col_reqs, vectorised, to_row_ids):
+    row_ids = to_row_ids(list(range(1000, 9000)))
+    subset = chrono_reqs.req_list[1000:9000]
+    assert list(col_reqs.rows(col_reqs.get_failures(row_ids))) == \
+        ChronoReqs.get_failures(subset)
+    assert list(col_reqs.rows(col_reqs.filter_by_ip("66.249.70.0", row_ids))) == \
+        [req for req in subset if req[1].strip() == "66.249.70.0"]
+    assert list(col_reqs.rows(col_reqs.filter_by_path("/robots.txt", row_ids))) == \
+        [req for req in subset if len(req) > 2 and req[2][1:2] == ["/robots.txt"]]
+    assert col_reqs.get_paths(row_ids) == ChronoReqs.get_paths(subset)
+    bucket_starts, bucketed_rows = col_reqs.requests_per_period(
+        datetime.timedelta(hours=1), row_ids)
+    assert (bucket_starts, [list(col_reqs.rows(x)) for x in bucketed_rows]) == \
+        ChronoReqs.requests_per_period(subset, datetime.timedelta(hours=1))
+
+
+def test_filters_whole_log(chrono_reqs, col_reqs, vectorised):
+    assert list(col_reqs.rows(col_reqs.filter_by_ip("66.249.70.0"))) == \
+        [req for req in chrono_reqs.req_list if req[1].strip() == "66.249.70.0"]
+    assert len(col_reqs.filter_by_path("/xmlrpc.php")) == \
+        ChronoReqs.get_paths(chrono_reqs.req_list)["/xmlrpc.php"]
+    assert col_reqs.filter_by_path("/never/requested").tolist() == []
+    assert ColumnarReqs((), set()).requests_per_period(datetime.timedelta(hours=1)) == \
+        ([], [])
+    assert ColumnarReqs((), set()).get_paths() == {}
+
+
+def test_get_paths(chrono_reqs, col_reqs, vectorised):
+    assert col_reqs.get_paths() == ChronoReqs.get_paths(chrono_reqs.req_list)
+    fails = col_reqs.get_failures()
+    assert col_reqs.get_paths(fails) == ChronoReqs.get_paths(
+        ChronoReqs.get_failures(chrono_reqs.req_list))
+
+
+@pytest.mark.parametrize("period", [
+    datetime.timedelta(minutes=5), datetime.timedelta(hours=2)])
+def test_requests_per_period(chrono_reqs, col_reqs, period, vectorised):
+    expect_starts, expect_buckets = ChronoReqs.requests_per_period(
+        chrono_reqs.req_list, period)
+    bucket_starts, bucketed_rows = col_reqs.requests_per_period(period)
+    assert bucket_starts == expect_starts
+    assert [list(col_reqs.rows(x)) for x in bucketed_rows] == expect_buckets
+    expect_starts, expect_buckets = ChronoReqs.failures_per_period(
+        chrono_reqs.req_list, period)
+    bucket_starts, bucketed_rows = col_reqs.failures_per_period(period)
+    assert bucket_starts == expect_starts
+    assert [len(x) for x in bucketed_rows] == [len(x) for x in expect_buckets]
+    with pytest.raises(ValueError):
+        col_reqs.requests_per_period(datetime.timedelta(0))
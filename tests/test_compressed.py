@@ -0,0 +1,101 @@
+import bz2
+import gzip
+import json
+import lzma
+import os
+import sys
+
+import pytest
+
+from compressed import compression_of, expand_logs, open_log, rotation_key
+from main import KNOWN_FRIENDLY_TESTERS, main
+from native_list import ChronoReqs
+from parallel import parse_file_with, parse_files
+from reqs_by_ip import ReqByIP
+
+
+@pytest.fixture
+def rotated_logs(log_text, tmp_path):
+    """
+    access.log cut into consecutive rotations, oldest the most compressed.
+    """
+    lines = log_text.splitlines(keepends=True)
+    n = len(lines) // 4
+    parts = [lines[:n], lines[n:2 * n], lines[2 * n:3 * n], lines[3 * n:]]
+    writers = {"access.log.3.gz": gzip.open, "access.log.2.bz2": bz2.open,
+               "access.log.1.xz": lzma.open, "access.log": open}
+    for (name, writer), part in zip(writers.items(), parts):
+        with writer(tmp_path / name, "wt") as log_file:
+            log_file.writelines(part)
+    return tmp_path, list(writers)
+
+
+def test_open_by_magic(log_text, rotated_logs, tmp_path):
+    log_dir, names = rotated_logs
+    whole = "".join(open_log(str(log_dir / name)).read() for name in names)
+    assert whole == log_text
+    # Named for the wrong compression, or none.
+    os.rename(log_dir / names[0], tmp_path / "misnamed.bz2")
+    assert compression_of(str(tmp_path / "misnamed.bz2")) is not None
+    assert compression_of("access.log") is None
+
+
+def test_zstd(log_text, tmp_path):
+    zstd = pytest.importorskip("zstandard")
+    with zstd.open(tmp_path / "access.log.1.zst", "wt") as log_file:
+        log_file.write(log_text)
+    assert open_log(str(tmp_path / "access.log.1.zst")).read() == log_text
+
+
+def test_zstd_missing(tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, "compression", None)
+    monkeypatch.setitem(sys.modules, "zstandard", None)
+    (tmp_path / "access.log.zst").write_bytes(b"\x28\xb5\x2f\xfd")
+    with pytest.raises(ImportError, match="zstandard"):
+        open_log(str(tmp_path / "access.log.zst"))
+
+
+@pytest.mark.parametrize("names,expected", [
+    (["access.log", "access.log.1", "access.log.10.gz", "access.log.2.gz"],
+     ["access.log.10.gz", "access.log.2.gz", "access.log.1", "access.log"]),
+    (["access.log-20240103.gz", "access.log", "access.log-20240102"],
+     ["access.log-20240102", "access.log-20240103.gz", "access.log"]),
+    (["b.log.1", "a.log", "a.log.1.zst"], ["a.log.1.zst", "a.log", "b.log.1"]),
+])
+def test_rotation_order(names, expected):
+    assert sorted(names, key=rotation_key) == expected
+
+
+def test_expand_logs(rotated_logs):
+    log_dir, names = rotated_logs
+    assert expand_logs([str(log_dir / "access.log*")]) == [str(log_dir / x) for x in names]
+    assert expand_logs([str(log_dir / "access.log"), str(log_dir / "access.log.1.xz"),
+                        str(log_dir / "access.log")]) == \
+        [str(log_dir / "access.log.1.xz"), str(log_dir / "access.log")]
+    with pytest.raises(FileNotFoundError):
+        expand_logs([str(log_dir / "nothing*")])
+
+
+@pytest.mark.parametrize("cls", [ChronoReqs, ReqByIP])
+@pytest.mark.parametrize("workers", [1, 3])
+def test_parse_files_matches_single_log(cls, workers, rotated_logs):
+    log_dir, _ = rotated_logs
+    single = parse_file_with(cls, "access.log", KNOWN_FRIENDLY_TESTERS)
+    filenames = expand_logs([str(log_dir / "access.log*")])
+    merged = parse_files(cls, filenames, KNOWN_FRIENDLY_TESTERS, workers)
+    assert vars(merged) == vars(single)
+
+
+def test_main_compressed(rotated_logs, capsys):
+    log_dir, names = rotated_logs
+    main([str(log_dir / "access.log*"), "--summary"])
+    summary = json.loads(capsys.readouterr().out)
+    main(["access.log", "--summary"])
+    assert summary == json.loads(capsys.readouterr().out)
+    main([str(log_dir / names[0]), str(log_dir / names[1]), "--workers", "2"])
+    main([str(log_dir / names[0]), "--cache-dir", str(log_dir / "cache")])
+    with pytest.raises(SystemExit):
+        main([str(log_dir / "access.log*"), "--follow", str(log_dir / "state.json")])
+    with pytest.raises(SystemExit):
+        main([str(log_dir / names[0]), "--follow", str(log_dir / "state.json")])
+    assert not os.path.exists(log_dir / "state.json")
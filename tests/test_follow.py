@@ -0,0 +1,104 @@
+import os
+
+import pytest
+
+import main as main_module
+
+from follow import LogFollower
+from main import main
+from native_list import ChronoReqs
+
+LINE = '44.44.44.44 - - [19/Sep/2022:08:01:{:02d} +0000] "GET / HTTP/1.1" 404 153 "-" "-"\n'
+
+
+@pytest.fixture
+def log_paths(tmp_path):
+    return str(tmp_path / "access.log"), str(tmp_path / "state.json")
+
+
+def append(path, *seconds, partial=""):
+    with open(path, "a") as log_file:
+        log_file.write("".join(LINE.format(s) for s in seconds) + partial)
+
+
+def run(log_path, state_path):
+    follower = LogFollower(log_path, state_path)
+    lines = list(follower.iter_new_lines())
+    follower.save()
+    return [int(line.split(":")[3][:2]) for line in lines]
+
+
+def test_only_new_lines(log_paths):
+    log_path, state_path = log_paths
+    append(log_path, 1, 2)
+    assert run(log_path, state_path) == [1, 2]
+    assert run(log_path, state_path) == []
+    # The state was replaced, no temporary file left behind.
+    assert sorted(os.listdir(os.path.dirname(state_path))) == ["access.log", "state.json"]
+    append(log_path, 3, partial=LINE.format(4)[:20])
+    assert run(log_path, state_path) == [3]
+    append(log_path, partial=LINE.format(4)[20:])
+    assert run(log_path, state_path) == [4]
+
+
+def test_rotation(log_paths):
+    log_path, state_path = log_paths
+    append(log_path, 1)
+    assert run(log_path, state_path) == [1]
+    append(log_path, 2)
+    os.rename(log_path, log_path + ".1")
+    append(log_path, 3)
+    assert run(log_path, state_path) == [2, 3]
+    os.remove(log_path + ".1")
+    os.rename(log_path, log_path + ".old")
+    append(log_path, 4)
+    assert run(log_path, state_path) == [4]
+
+
+def test_truncation(log_paths):
+    log_path, state_path = log_paths
+    append(log_path, 1, 2)
+    assert run(log_path, state_path) == [1, 2]
+    open(log_path, "w").close()
+    append(log_path, 3)
+    assert run(log_path, state_path) == [3]
+    # Truncated then grown past where we were.
+    open(log_path, "w").close()
+    append(log_path, 5, 6, 7)
+    assert run(log_path, state_path) == [5, 6, 7]
+
+
+def test_ingest_appends(log_paths):
+    log_path, state_path = log_paths
+    append(log_path, 1, 2)
+    follower = LogFollower(log_path, state_path)
+    chrono_reqs = ChronoReqs(follower.iter_new_lines(), set())
+    append(log_path, 3)
+    chrono_reqs.ingest(follower.iter_new_lines())
+    assert [req[0] % 60 for req in chrono_reqs.req_list] == [1, 2, 3]
+
+
+def test_main_follow(log_paths):
+    log_path, state_path = log_paths
+    with open("access.log") as log_file:
+        open(log_path, "w").write(log_file.read())
+    main([log_path, "--follow", state_path])
+    assert LogFollower(log_path, state_path).offset == os.path.getsize(log_path)
+
+
+def test_main_follow_query(log_paths, monkeypatch, capsys):
+    log_path, state_path = log_paths
+    append(log_path, 1, 2)
+
+    def broken_pipe(*args):
+        raise BrokenPipeError()
+    # Output that fails leaves the lines to be reported next run.
+    with monkeypatch.context() as patch:
+        patch.setattr(main_module, "write_rows", broken_pipe)
+        with pytest.raises(BrokenPipeError):
+            main(["top-ips", log_path, "--follow", state_path])
+    assert not os.path.exists(state_path)
+    main(["top-ips", log_path, "--follow", state_path])
+    assert '"requests": 2' in capsys.readouterr().out
+    main(["top-ips", log_path, "--follow", state_path])
+    assert '"requests"' not in capsys.readouterr().out
@@ -0,0 +1,110 @@
+import time
+from collections import Counter
+
+import pytest
+
+from main import KNOWN_FRIENDLY_TESTERS
+from native_list import ChronoReqs
+from reqs_by_ip import ReqByIP
+
+LINE = '44.44.44.{} - - [19/Sep/2022:08:01:{:02d} +0000] "GET /{} HTTP/1.1" {} 153 "-" "-"'
+UNCLOSED = '44.44.44.9 - - [19/Sep/2022:08:01:30 +0000] "GET /unclosed 200 153'
+
+
+@pytest.fixture(params=[False, True], ids=["eager", "lazy"])
+def chrono_reqs(request, log_text):
+    return ChronoReqs(log_text, KNOWN_FRIENDLY_TESTERS, lazy=request.param)
+
+
+@pytest.fixture(scope="module")
+def req_dict(log_text):
+    return ReqByIP(log_text, KNOWN_FRIENDLY_TESTERS)
+
+
+def brute_force_index(req_list, key):
+    index = {}
+    for row, req in enumerate(req_list):
+        if key(req) is not None:
+            index.setdefault(key(req), []).append(row)
+    return index
+
+
+def test_indexes_built_lazily(chrono_reqs):
+    assert chrono_reqs.indexes == {}
+    ips = chrono_reqs.index("ip")
+    assert set(chrono_reqs.indexes) == {"ip"}
+    assert chrono_reqs.index("ip") is ips
+    assert {k: list(v) for k, v in ips.items()} == brute_force_index(
+        chrono_reqs.req_list, lambda req: req[1].strip())
+    assert {k: list(v) for k, v in chrono_reqs.index("status").items()} == \
+        brute_force_index(chrono_reqs.req_list, lambda req: req[3])
+    paths = chrono_reqs.index("path")
+    assert sum(map(len, paths.values())) == sum(ChronoReqs.get_paths(chrono_reqs.req_list).values())
+
+
+def test_lookups(chrono_reqs):
+    assert chrono_reqs.reqs_from("66.249.70.0") == [
+        req for req in chrono_reqs.req_list if req[1].strip() == "66.249.70.0"]
+    assert chrono_reqs.reqs_with_status(404) == ChronoReqs.filter_by_status(
+        chrono_reqs.req_list, 404, 404)
+    assert chrono_reqs.reqs_for_path("/xmlrpc.php") == [
+        req for req in chrono_reqs.req_list if len(req[2]) > 2 and req[2][1] == "/xmlrpc.php"]
+    assert chrono_reqs.reqs_from("1.2.3.4") == []
+
+
+def test_kept_up_to_date():
+    chrono_reqs = ChronoReqs([LINE.format(1, 1, "a", 200), LINE.format(2, 2, "b", 404)], set())
+    chrono_reqs.index("ip")
+    chrono_reqs.index("status")
+    chrono_reqs.ingest([LINE.format(1, 3, "a", 404)])
+    assert list(chrono_reqs.index("ip")["44.44.44.1"]) == [0, 2]
+    assert list(chrono_reqs.index("status")[404]) == [1, 2]
+    # Out of order requests shift rows, so indexes are rebuilt.
+    chrono_reqs.ingest([LINE.format(3, 0, "c", 500)])
+    assert chrono_reqs.indexes == {}
+    assert list(chrono_reqs.index("ip")["44.44.44.1"]) == [1, 3]
+    chrono_reqs.merge(ChronoReqs([LINE.format(3, 4, "c", 500)], set()))
+    assert chrono_reqs.indexes == {}
+    assert list(chrono_reqs.index("status")[500]) == [0, 4]
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_unclosed_request_line(lazy):
+    chrono_reqs = ChronoReqs([LINE.format(1, 1, "a", 200), UNCLOSED], set(), lazy=lazy)
+    assert len(chrono_reqs.req_list[1]) == 2
+    assert list(chrono_reqs.index("ip")["44.44.44.9"]) == [1]
+    assert {k: list(v) for k, v in chrono_reqs.index("path").items()} == {"/a": [0]}
+    assert {k: list(v) for k, v in chrono_reqs.index("status").items()} == {200: [0]}
+    assert chrono_reqs.reqs_for_path("/unclosed") == []
+
+
+def test_same_as_req_by_ip(chrono_reqs, req_dict):
+    counts = Counter(req[1].strip() for req in chrono_reqs.req_list)
+    assert [counts[ip] for ip in chrono_reqs.most_requests()] == [
+        len(req_dict.by_ip[ip]) for ip in ReqByIP.most_requests(req_dict.by_ip)]
+    assert chrono_reqs.count_failures_by_ip() == ReqByIP.count_failures_from_dict(req_dict.by_ip)
+    by_ip = chrono_reqs.filter_by_status_by_ip(400, 499)
+    expected = ReqByIP.filter_dict_between_status_code(req_dict.by_ip, 400, 499)
+    assert {ip: [[req[0], *req[2:]] for req in reqs] for ip, reqs in by_ip.items()} == expected
+    assert chrono_reqs.filter_by_status_by_ip(600, 700) == {ip: [] for ip in expected}
+
+
+@pytest.mark.parametrize("k", [1, 5, 50])
+def test_most_requests_top_k(chrono_reqs, req_dict, k):
+    counts = Counter(req[1].strip() for req in chrono_reqs.req_list)
+    top = chrono_reqs.most_requests(k)
+    assert len(top) == k
+    assert [counts[ip] for ip in top] == [counts[ip] for ip in chrono_reqs.most_requests()[-k:]]
+    assert ReqByIP.most_requests(req_dict.by_ip, k) == top
+
+
+def test_top_k_faster(chrono_reqs):
+    chrono_reqs.index("ip")
+    t0 = time.perf_counter()
+    for _ in range(20):
+        chrono_reqs.most_requests()
+    t1 = time.perf_counter()
+    for _ in range(20):
+        chrono_reqs.most_requests(10)
+    t2 = time.perf_counter()
+    print("sorting all took {:.04f}, top 10 took {:.04f}".format(t1 - t0, t2 - t1))
@@ -0,0 +1,136 @@
+import json
+from unittest.mock import patch
+
+import pytest
+
+from ingest_stats import IngestStats
+from main import KNOWN_FRIENDLY_TESTERS, main
+from native_list import ChronoReqs
+from regex_parser import COMBINED_PARSER
+from reqs_by_ip import ReqByIP
+
+# access.log has 4 docker debug lines.
+LINES = 16912
+REJECTED = 4
+
+
+@pytest.mark.parametrize("kwargs, stages", [
+    ({}, ["read", "ip_match", "timestamp", "filter", "rest_of_line", "store"]),
+    ({"lazy": True}, ["read", "ip_match", "timestamp", "filter", "lazy_record",
+                      "store"]),
+    ({"line_parser": COMBINED_PARSER}, ["read", "regex", "filter", "store"]),
+])
+def test_chrono_reqs_stats(log_text, kwargs, stages):
+    stats = IngestStats()
+    timed = ChronoReqs(log_text, KNOWN_FRIENDLY_TESTERS, stats=stats, **kwargs)
+    untimed = ChronoReqs(log_text, KNOWN_FRIENDLY_TESTERS, **kwargs)
+    assert timed.req_list == untimed.req_list
+    assert stats.lines == LINES
+    assert stats.rejected == REJECTED
+    assert stats.requests == len(timed.req_list)
+    assert stats.lines == stats.requests + stats.rejected + stats.ignored
+    assert list(stats.stages) == stages
+    assert 0 < sum(stats.stages.values()) <= stats.seconds
+    assert stats.lines_per_sec > 0
+    assert stats.peak_rss_kb > 0
+
+
+@pytest.mark.parametrize("line_parser", [None, COMBINED_PARSER])
+def test_req_by_ip_stats(log_text, line_parser):
+    stats = IngestStats()
+    timed = ReqByIP(log_text, set(), line_parser, stats=stats)
+    assert timed.by_ip == ReqByIP(log_text, set(), line_parser).by_ip
+    assert stats.rejected == REJECTED
+    assert stats.requests == sum(map(len, timed.by_ip.values()))
+
+
+def test_ignored(log_text):
+    stats = IngestStats()
+    reqs = ChronoReqs(log_text, {"66.249.70.0"}, stats=stats)
+    assert stats.ignored == 1066
+    assert stats.requests == len(reqs.req_list) == LINES - REJECTED - 1066
+
+
+def test_callback(log_text):
+    seen = []
+    stats = IngestStats(callback=lambda x: seen.append(x.lines), every=5000)
+    ChronoReqs(log_text, set(), stats=stats)
+    assert seen == [5000, 10000, 15000, LINES]
+
+
+def test_stats_accumulate_over_ingests(log_text):
+    stats = IngestStats()
+    reqs = ChronoReqs(log_text, set(), stats=stats)
+    reqs.ingest(log_text)
+    assert stats.lines == 2 * LINES
+    assert stats.requests == len(reqs.req_list)
+
+
+def test_iter_requests_times_consumer(log_text):
+    stats = IngestStats()
+    reqs = ChronoReqs((), set(), stats=stats)
+    assert sum(1 for _ in reqs.iter_requests(log_text)) == stats.requests
+    assert "consume" in stats.stages and "store" not in stats.stages
+    assert reqs.req_list == []
+    by_ip_stats = IngestStats()
+    req_dict = ReqByIP((), set(), stats=by_ip_stats)
+    assert sum(1 for _ in req_dict.iter_requests(log_text)) == stats.requests
+    assert by_ip_stats.requests == stats.requests
+    assert by_ip_stats.rejected == REJECTED
+    assert "consume" in by_ip_stats.stages and req_dict.by_ip == {}
+
+
+def test_disabled_is_untimed(log_text):
+    with patch("ingest_stats.perf_counter") as perf_counter:
+        ChronoReqs(log_text, set())
+        ReqByIP(log_text, set())
+    perf_counter.assert_not_called()
+
+
+@pytest.mark.parametrize("args", [
+    [],
+    ["--workers", "2"],
+    ["--mmap"],
+    ["--cache-dir", "{cache_dir}"],
+    ["--cache-dir", "{cache_dir}", "--workers", "2"],
+])
+def test_main_stats(capsys, tmp_path, args):
+    args = [x.format(cache_dir=tmp_path) for x in args]
+    # Parsed, then with --cache-dir loaded from the cache.
+    for _ in range(2 if "--cache-dir" in args else 1):
+        main(["top-ips", "access.log", "--stats", *args])
+        captured = capsys.readouterr()
+        stats = json.loads(captured.err)
+        assert stats["requests"] == LINES - REJECTED
+        assert stats["lines"] == LINES
+        assert stats["rejected"] == REJECTED
+        assert stats["ignored"] == 0
+        assert stats["seconds"] > 0
+        assert stats["lines_per_sec"] == LINES / stats["seconds"]
+        assert json.loads(captured.out)
+    if "--cache-dir" not in args:
+        assert {"read", "ip_match", "timestamp", "rest_of_line"} <= set(stats["stages"])
+
+
+def test_main_stats_unmeasured(capsys, tmp_path, log_text):
+    # A cache saved without counts, and a source, can't say how many lines.
+    main(["top-ips", "access.log", "--cache-dir", str(tmp_path)])
+    capsys.readouterr()
+    for args in (["access.log", "--cache-dir", str(tmp_path)],
+                 ["--source", "access.log"]):
+        main(["top-ips", "--stats", *args])
+        stats = json.loads(capsys.readouterr().err)
+        assert stats["requests"] == LINES - REJECTED
+        assert stats["seconds"] > 0
+        assert "lines" not in stats and "lines_per_sec" not in stats
+        assert "stages" not in stats
+    main(["--summary", "--stats", "--source", "access.log"])
+    stats = json.loads(capsys.readouterr().err)
+    assert stats["requests"] == LINES - REJECTED and "lines" not in stats
+
+
+def test_main_summary_stats(capsys):
+    main(["access.log", "--summary", "--stats"])
+    stats = json.loads(capsys.readouterr().err)
+    assert stats["lines"] == LINES
+    assert "consume" in stats["stages"]
@@ -0,0 +1,83 @@
+import ipaddress
+import json
+import time
+
+import pytest
+
+from ip_ranges import IPRangeIndex
+from main import KNOWN_FRIENDLY_TESTERS, main
+from native_list import ChronoReqs
+from parse_cache import source_key
+
+
+@pytest.fixture(scope="module")
+def gbot_json():
+    with open("sample_gbots.json") as f:
+        return json.load(f)
+
+
+@pytest.fixture(scope="module")
+def gbot_index(gbot_json):
+    return IPRangeIndex.from_prefixes(gbot_json)
+
+
+@pytest.mark.parametrize("ip, expected", [
+    ("66.249.64.0", True),
+    ("   66.249.64.31", True),
+    ("34.100.182.112", False),
+    ("2001:4860:4801:10::1", True),
+    ("2001:4860:4801:9::1", False),
+    ("1.2.3.4", False),
+    ("not an ip", False),
+    ("::ffff:zz", False),
+])
+def test_contains(gbot_index, ip, expected):
+    assert (ip in gbot_index) == expected
+
+
+def test_matches_ipaddress(gbot_json, gbot_index):
+    networks = [ipaddress.ip_network(v) for d in gbot_json["prefixes"] for v in d.values()]
+    for ip in ["66.249.{}.{}".format(a, b) for a in range(60, 100) for b in range(0, 256, 7)]:
+        assert (ip in gbot_index) == any(
+            ipaddress.ip_address(ip) in net for net in networks)
+
+
+def test_merges_ranges():
+    index = IPRangeIndex(["10.0.0.0/25", "10.0.0.128/25", "10.0.0.5", "10.1.0.0/16"])
+    assert index.starts[4] == [int(ipaddress.ip_address("10.0.0.0")),
+                               int(ipaddress.ip_address("10.1.0.0"))]
+    assert list(index) == ["10.0.0.0/24", "10.1.0.0/16"]
+    assert "10.0.0.200" in index
+    assert "10.0.1.0" not in index
+    combined = index | {"172.18.0.1"}
+    assert "172.18.0.1" in combined and "10.1.2.3" in combined
+
+
+def test_from_file(tmp_path, gbot_index):
+    assert list(IPRangeIndex.from_file("sample_gbots.json")) == list(gbot_index)
+    text_path = tmp_path / "deny.txt"
+    text_path.write_text("# testers\n172.18.0.1\n\n46.64.34.0/24\n")
+    index = IPRangeIndex.from_file(str(text_path))
+    assert list(index) == ["46.64.34.0/24", "172.18.0.1/32"]
+
+
+def test_ignored_ips(log_text, tmp_path):
+    friendly = IPRangeIndex(KNOWN_FRIENDLY_TESTERS)
+    expected = ChronoReqs(log_text, KNOWN_FRIENDLY_TESTERS)
+    with open("access.log") as log_file:
+        assert ChronoReqs(log_file, friendly).req_list == expected.req_list
+    assert source_key("access.log", friendly) == source_key(
+        "access.log", {"172.18.0.1/32", "46.64.34.27/32"})
+    text_path = tmp_path / "deny.txt"
+    text_path.write_text("0.0.0.0/0\n")
+    main(["access.log", "--ignore-ranges", str(text_path)])
+
+
+def test_filter_out(log_text, gbot_index):
+    chrono_reqs = ChronoReqs(log_text, KNOWN_FRIENDLY_TESTERS)
+    t0 = time.perf_counter()
+    kept = gbot_index.filter_out(chrono_reqs.req_list)
+    t1 = time.perf_counter()
+    print("filter_out took {:.04f}".format(t1 - t0))
+    assert kept == [req for req in chrono_reqs.req_list if req[1] not in gbot_index]
+    assert len(kept) < len(chrono_reqs.req_list)
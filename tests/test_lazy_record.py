@@ -0,0 +1,91 @@
+import datetime
+import pickle
+import tracemalloc
+
+import pytest
+
+from lazy_record import LazyRequest
+from line_parser import iter_lines
+from main import KNOWN_FRIENDLY_TESTERS
+from native_list import ChronoReqs
+
+LINE = '44.44.44.44 - - [19/Sep/2022:08:01:21 +0000] "GET /a HTTP/1.1" 404 153 "-" "UA"'
+
+
+@pytest.fixture(scope="module")
+def eager(log_text):
+    return ChronoReqs(log_text, KNOWN_FRIENDLY_TESTERS)
+
+
+@pytest.fixture(scope="module")
+def lazy(log_text):
+    return ChronoReqs(log_text, KNOWN_FRIENDLY_TESTERS, lazy=True)
+
+
+def lazy_request(line=LINE):
+    ip, epoch, curs = ChronoReqs.find_ip_and_timestamp(line)
+    return LazyRequest(line, epoch, ip.rjust(16), curs)
+
+
+def test_fields_only_parsed_when_accessed():
+    req = lazy_request()
+    assert req._mpp is None and req._optional is None
+    assert req[3] == 404
+    assert req[4] == 153
+    assert req._mpp is None and req._optional is None
+    assert req[2][1] == "/a"
+    assert req[2] is req[2]
+    assert req._optional is None
+    assert req[-1] == "UA"
+    assert len(req) == 7
+
+
+def test_sequence_behaviour():
+    req = lazy_request()
+    eager = ChronoReqs(LINE, set()).req_list[0]
+    assert req == eager and eager == req
+    assert list(req) == eager
+    assert req[1:4] == eager[1:4]
+    assert req[::-2] == eager[::-2]
+    assert repr(req) == repr(eager)
+    assert req != eager[:-1]
+    with pytest.raises(IndexError):
+        req[7]
+    with pytest.raises(TypeError):
+        hash(req)
+    assert pickle.loads(pickle.dumps(req)) == req
+    assert len(lazy_request(LINE.split('"')[0] + '"GET')) == 2
+
+
+def test_same_as_eager(eager, lazy):
+    assert all(isinstance(x, LazyRequest) for x in lazy.req_list)
+    assert lazy.req_list == eager.req_list
+    assert [len(x) for x in lazy.req_list] == [len(x) for x in eager.req_list]
+    assert lazy.times == eager.times
+
+
+def test_helpers_same_as_eager(eager, lazy):
+    assert ChronoReqs.get_failures(lazy.req_list) == ChronoReqs.get_failures(eager.req_list)
+    assert ChronoReqs.get_paths(lazy.req_list) == ChronoReqs.get_paths(eager.req_list)
+    assert ChronoReqs.find_unusual_meth_path_protos(lazy.req_list) == \
+        ChronoReqs.find_unusual_meth_path_protos(eager.req_list)
+    period = datetime.timedelta(hours=1)
+    assert ChronoReqs.status_classes_per_period(lazy.req_list, period) == \
+        ChronoReqs.status_classes_per_period(eager.req_list, period)
+    prefixes = {"/wp": [], "/": []}
+    assert ChronoReqs.divide_reqs_by_path_prefixes(prefixes, lazy.req_list) == \
+        ChronoReqs.divide_reqs_by_path_prefixes({"/wp": [], "/": []}, eager.req_list)
+
+
+def test_fewer_allocations(log_text):
+    lines = list(iter_lines(log_text))
+    allocated = {}
+    for is_lazy in (False, True):
+        parse_line = ChronoReqs((), set(), lazy=is_lazy).parse_line
+        tracemalloc.start()
+        reqs = [parse_line(line) for line in lines]
+        allocated[is_lazy] = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del reqs
+    print(allocated)
+    assert allocated[True] < allocated[False] / 2
@@ -1,6 +1,12 @@
 import pytest
 
-from line_parser import LogLineParser
+import datetime
+import io
+import time
+
+from line_parser import LogLineParser, iter_lines, parse_nginx_time, \
+    convert_timestamp, example_dt, format_epoch, to_epoch, from_epoch, \
+    INTERNAL_DT_FORMAT
 
 
 @pytest.mark.parametrize("bit_after_time, expected_list", [
@@ -26,7 +32,70 @@ def test_append_rest_of_line(bit_after_time, expected_list):
      "144.144.4.4", "150131 190000")
 ])
 def test_find_ip_and_timestamp(ip_dt_str, expect_ip, expect_dt_str):
-    ip, dt_str, curs = LogLineParser.find_ip_and_timestamp(ip_dt_str)
+    ip, epoch, curs = LogLineParser.find_ip_and_timestamp(ip_dt_str)
     assert curs == len(ip_dt_str) + 1
     assert ip == expect_ip
-    assert dt_str == expect_dt_str
+    assert format_epoch(epoch) == expect_dt_str
+
+
+def test_iter_lines():
+    assert list(iter_lines("a\nb\r\n\nc")) == ["a", "b", "", "c"]
+    assert list(iter_lines(io.StringIO("a\nb\n"))) == ["a", "b"]
+    assert list(iter_lines(["a\n", "b"])) == ["a", "b"]
+
+
+def strptime_timestamp(date_str):
+    # How find_ip_and_timestamp used to convert every line.
+    return datetime.datetime.strptime(
+        date_str[1:-1], "%d/%b/%Y:%H:%M:%S %z").astimezone(
+        datetime.timezone.utc).strftime(INTERNAL_DT_FORMAT)
+
+
+@pytest.mark.parametrize("date_str", [
+    "[01/Sep/2022:23:09:56 +0000]",
+    "[31/Dec/2022:23:59:59 -0130]",
+    "[01/Jan/2023:00:00:00 +1400]",
+    "[29/Feb/2024:12:00:00 +0545]",
+])
+def test_parse_nginx_time(date_str):
+    assert format_epoch(parse_nginx_time(date_str)) == \
+        strptime_timestamp(date_str)
+
+
+@pytest.mark.parametrize("date_str", [
+    "[01/Foo/2022:23:09:56 +0000]",
+    "[01/Sep/2022:23:09:56 ~0000]",
+    "[01/Sep/2022:2a:09:56 +0000]",
+])
+def test_parse_nginx_time_rejects(date_str):
+    with pytest.raises(ValueError):
+        parse_nginx_time(date_str)
+
+
+def test_timestamp_benchmark():
+    with open("access.log") as log_file:
+        date_strs = [line[line.find("["):line.find("]") + 1]
+                     for line in log_file if line.find("[") != -1]
+    date_strs = [x for x in date_strs if len(x) == len(example_dt)]
+    t0 = time.perf_counter()
+    expected = [strptime_timestamp(x) for x in date_strs]
+    t1 = time.perf_counter()
+    uncached = [parse_nginx_time(x) for x in date_strs]
+    t2 = time.perf_counter()
+    convert_timestamp.cache_clear()
+    cached = [convert_timestamp(x) for x in date_strs]
+    t3 = time.perf_counter()
+    assert cached == uncached
+    assert [format_epoch(x) for x in cached] == expected
+    print("strptime {:.0f} lines/s, sliced {:.0f} lines/s, cached {:.0f} lines/s".format(
+        len(date_strs) / (t1 - t0), len(date_strs) / (t2 - t1),
+        len(date_strs) / (t3 - t2)))
+
+
+def test_epoch_conversions():
+    naive = datetime.datetime(2022, 9, 19, 8, 1, 21)
+    aware = datetime.datetime(2022, 9, 19, 9, 1, 21, tzinfo=datetime.timezone(
+        datetime.timedelta(hours=1)))
+    assert to_epoch(naive) == to_epoch(aware) == 1663574481
+    assert from_epoch(1663574481) == naive
+    assert format_epoch(1663574481) == "220919 080121"
@@ -0,0 +1,48 @@
+import time
+
+import pytest
+
+from main import KNOWN_FRIENDLY_TESTERS, main
+from mmap_reader import iter_mmap_lines
+from native_list import ChronoReqs
+from parallel import chunk_offsets
+
+
+def test_iter_mmap_lines(tmp_path):
+    log_path = tmp_path / "mixed.log"
+    log_path.write_bytes(
+        b"1.2.3.4 first\n/docker-entrypoint.sh: skipped\n\n5.6.7.8 last")
+    assert list(iter_mmap_lines(str(log_path))) == [
+        "1.2.3.4 first", "5.6.7.8 last"]
+    assert list(iter_mmap_lines(str(log_path), 14, 45)) == []
+    log_path.write_bytes(b"")
+    assert list(iter_mmap_lines(str(log_path))) == []
+
+
+def test_chunks_cover_file():
+    whole = list(iter_mmap_lines("access.log"))
+    chunked = [line for start, end in chunk_offsets("access.log", 5)
+               for line in iter_mmap_lines("access.log", start, end)]
+    assert chunked == whole
+
+
+def test_mmap_benchmark():
+    # Both time reading the file, not just parsing it.
+    t0 = time.perf_counter()
+    with open("access.log") as log_file:
+        from_split = ChronoReqs(log_file.read().split("\n"),
+                                KNOWN_FRIENDLY_TESTERS)
+    t1 = time.perf_counter()
+    from_mmap = ChronoReqs(iter_mmap_lines("access.log"), KNOWN_FRIENDLY_TESTERS)
+    t2 = time.perf_counter()
+    assert from_mmap.req_list == from_split.req_list
+    print("open().read().split() took {:.04f}, mmap took {:.04f}".format(
+        t1 - t0, t2 - t1))
+
+
+@pytest.mark.parametrize("query", ["top-paths", "labels", "suspicious"])
+def test_main_mmap(query, capsys):
+    main([query, "access.log"])
+    expected = capsys.readouterr().out
+    main([query, "access.log", "--mmap"])
+    assert capsys.readouterr().out == expected
@@ -1,14 +1,15 @@
 import datetime
-import json
 import time
 from collections import Counter
-from unittest.mock import Mock, patch
+from functools import partial
+from unittest.mock import Mock
 
 import pytest
 
 from main import KNOWN_FRIENDLY_TESTERS
+from line_parser import format_epoch
 from native_list import ChronoReqs, LogLineParser
-from requests import Response
+from range_providers import PROVIDERS
 
 
 @pytest.mark.parametrize("bit_after_time,expected_list", [
@@ -19,19 +20,27 @@ from requests import Response
     ('"" 400 0 "-" "-"',
      [[], 400, 0, "-", "-"])
 ])
-def test_tokenise_line_variables(bit_after_time,expected_list):
+@pytest.mark.parametrize("lazy", [False, True])
+def test_tokenise_line_variables(bit_after_time,expected_list,lazy):
     fake_instance = Mock(ChronoReqs)
     fake_instance.req_list = []
+    fake_instance.times = []
     fake_instance.ignored_ips = set()
+    fake_instance.line_parser = None
+    fake_instance.lazy = lazy
+    fake_instance.indexes = {}
     fake_instance.find_ip_and_timestamp = LogLineParser.find_ip_and_timestamp
     fake_instance.append_rest_of_line = LogLineParser.append_rest_of_line
+    fake_instance.parse_line = partial(ChronoReqs.parse_line, fake_instance)
+    fake_instance.add_request = partial(ChronoReqs.add_request, fake_instance)
     line = '44.44.44.44 - - [19/Sep/2022:08:01:21 +0000] ' + bit_after_time
     ChronoReqs.tokenise_line(fake_instance, line)
     req = fake_instance.req_list[0]
-    assert req[0] == "220919 080121"
+    assert format_epoch(req[0]) == "220919 080121"
     assert req[1] == "44.44.44.44".rjust(16)
     for i in range(len(expected_list)):
         assert req[2 + i] == expected_list[i]
+    assert len(req) == 2 + len(expected_list)
 
 
 
@@ -54,9 +63,25 @@ def test_chronological_requests():
     print(chrono_reqs.req_list)
 
 
-@pytest.fixture(scope="module")
-def chrono_reqs():
-    return ChronoReqs(open("access.log").read(), KNOWN_FRIENDLY_TESTERS)
+def test_chrono_reqs_from_file_object():
+    with open("access.log") as log_file:
+        from_file = ChronoReqs(log_file, KNOWN_FRIENDLY_TESTERS)
+    with open("access.log") as log_file:
+        from_str = ChronoReqs(log_file.read(), KNOWN_FRIENDLY_TESTERS)
+    assert from_file.req_list == from_str.req_list
+
+
+def test_iter_requests_is_lazy():
+    def lines():
+        yield '44.44.44.44 - - [19/Sep/2022:08:01:21 +0000] "GET / HTTP/1.1" 404 153 "-" "-" "-"\n'
+        yield "/docker-entrypoint.sh: Configuration complete; ready for start up\n"
+        raise AssertionError("read past the first request")
+
+    chrono_reqs = ChronoReqs((), set())
+    req = next(chrono_reqs.iter_requests(lines()))
+    assert req == [1663574481, "44.44.44.44".rjust(16),
+                   ["GET", "/", "HTTP/1.1"], 404, 153, "-", "-", "-"]
+    assert chrono_reqs.req_list == []
 
 
 def test_requests_per_period(chrono_reqs):
@@ -67,6 +92,18 @@ def test_requests_per_period(chrono_reqs):
     print("per period took {:.04f}".format(t1 - t0))
 
 
+def test_requests_per_period_buckets(chrono_reqs):
+    bucket_starts, bucketed_reqs = ChronoReqs.requests_per_period(
+        chrono_reqs.req_list, datetime.timedelta(hours=2))
+    assert bucket_starts[0] == datetime.datetime(2022, 9, 1, 22, 12, 45)
+    assert all(b - a == datetime.timedelta(hours=2)
+               for a, b in zip(bucket_starts, bucket_starts[1:]))
+    assert sum(map(len, bucketed_reqs)) == len(chrono_reqs.req_list)
+    with pytest.raises(ValueError):
+        ChronoReqs.requests_per_period(
+            chrono_reqs.req_list, datetime.timedelta(milliseconds=5))
+
+
 def test_failures_per_5m_period(chrono_reqs):
     t0 = time.time()
     bucket_starts, bucketed_fails = ChronoReqs.failures_per_period(
@@ -118,6 +155,7 @@ def test_find_unusual_meth_path_protos(chrono_reqs):
     # So unusual that I don't understand them. I can refer back to see if I've
     # blocked them later.
     req_list_fltrd = ChronoReqs.find_unusual_meth_path_protos(chrono_reqs.req_list)
+    req_list_fltrd = [[format_epoch(req[0]), *req[1:]] for req in req_list_fltrd]
     assert req_list_fltrd == [[
         '220910 183310', '    106.75.176.0',
         [
@@ -182,15 +220,56 @@ def test_find_unusual_meth_path_protos(chrono_reqs):
         ], 400, 157, '-', '-']]
 
 
-@patch('native_list.requests.get', spec=Response)
-def test_remove_googlebot(mock_get, chrono_reqs):
-    # This can be slow so we're only going to test the first 2000 requests.
+def test_remove_googlebot(chrono_reqs, tmp_path, monkeypatch):
+    # Offline, so we're served from the bundled snapshot of sample_gbots.json.
+    monkeypatch.setattr(PROVIDERS["googlebot"], "url", "http://127.0.0.1:9/")
     sample_size = 2000
-    with open("sample_gbots.json") as f:
-        SAMPLE_GBOTS = json.load(f)
-    mock_get.return_value.json.return_value = SAMPLE_GBOTS
     req_list_fltrd = ChronoReqs.remove_googlebot(
-        chrono_reqs.req_list[:sample_size])
+        chrono_reqs.req_list[:sample_size], str(tmp_path))
     assert(len(req_list_fltrd)) == 1933
 
 
+def jittered_lines(seconds, first_ip=0):
+    return "\n".join(
+        '44.44.44.{} - - [19/Sep/2022:08:01:{:02d} +0000] "GET / HTTP/1.1" 200 1 "-" "-"'.format(i, s)
+        for i, s in enumerate(seconds, first_ip))
+
+
+def test_out_of_order_lines_sorted():
+    chrono_reqs = ChronoReqs(jittered_lines([1, 3, 2, 5, 4, 4, 0]), set())
+    assert [req[0] % 60 for req in chrono_reqs.req_list] == [0, 1, 2, 3, 4, 4, 5]
+    assert chrono_reqs.times == [req[0] for req in chrono_reqs.req_list]
+    # Equal times keep the order they were logged in.
+    assert [req[1].strip() for req in chrono_reqs.req_list][4:6] == [
+        "44.44.44.4", "44.44.44.5"]
+
+
+def test_merge_overlapping():
+    seconds = [1, 3, 2, 5, 4, 4, 0, 9, 6, 7, 8, 6]
+    whole = ChronoReqs(jittered_lines(seconds), set())
+    merged = ChronoReqs(jittered_lines(seconds[:5]), set())
+    merged.merge(ChronoReqs(jittered_lines(seconds[5:], 5), set()))
+    assert merged.req_list == whole.req_list
+    assert merged.times == whole.times
+
+
+def test_between(chrono_reqs):
+    lower = datetime.datetime(2022, 9, 10, 18, 30)
+    upper = datetime.datetime(2022, 9, 10, 18, 35)
+    t0 = time.perf_counter()
+    window = chrono_reqs.between(lower, upper)
+    t1 = time.perf_counter()
+    print("between took {:.06f}".format(t1 - t0))
+    lower_epoch, upper_epoch = 1662834600, 1662834900
+    expected = [req for req in chrono_reqs.req_list
+                if lower_epoch <= req[0] <= upper_epoch]
+    assert len(expected) > 0
+    assert list(window) == expected
+    assert len(window) == len(expected)
+    assert window[0] is expected[0] and window[-1] is expected[-1]
+    assert list(window[1:3]) == expected[1:3]
+    assert window[::2] == expected[::2]
+    with pytest.raises(IndexError):
+        window[len(expected)]
+    assert ChronoReqs.get_paths(window) == ChronoReqs.get_paths(expected)
+    assert len(chrono_reqs.between(upper, lower)) == 0
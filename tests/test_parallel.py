@@ -0,0 +1,49 @@
+import os
+
+import pytest
+
+import parallel
+from main import KNOWN_FRIENDLY_TESTERS, main
+from native_list import ChronoReqs
+from parallel import chunk_offsets, parse_file, parse_file_with
+from reqs_by_ip import ReqByIP
+
+
+@pytest.mark.parametrize("n_chunks", [1, 2, 7, 64])
+def test_chunk_offsets(n_chunks):
+    offsets = chunk_offsets("access.log", n_chunks)
+    assert offsets[0][0] == 0
+    assert offsets[-1][1] == os.path.getsize("access.log")
+    assert len(offsets) == n_chunks
+    with open("access.log", "rb") as log_file:
+        content = log_file.read()
+    for (start, end), (next_start, _) in zip(offsets, offsets[1:]):
+        assert end == next_start
+        assert content[end - 1:end] == b"\n"
+
+
+def test_chunk_offsets_long_lines(tmp_path):
+    log_path = tmp_path / "long.log"
+    log_path.write_text("x" * 100 + "\n" + "y" * 100)
+    assert chunk_offsets(str(log_path), 10) == [(0, 101), (101, 201)]
+    log_path.write_text("")
+    assert chunk_offsets(str(log_path), 4) == [(0, 0)]
+
+
+@pytest.mark.parametrize("cls", [ChronoReqs, ReqByIP])
+def test_parse_file_matches_single_process(cls, monkeypatch):
+    # Make plenty of chunks from our little log.
+    monkeypatch.setattr(parallel, "CHUNK_BYTES", 256 * 1024)
+    single = parse_file_with(cls, "access.log", KNOWN_FRIENDLY_TESTERS)
+    multi = parse_file(cls, "access.log", KNOWN_FRIENDLY_TESTERS, 3)
+    assert vars(multi) == vars(single)
+    if cls is ReqByIP:
+        assert list(multi.by_ip) == list(single.by_ip)
+
+
+@pytest.mark.parametrize("query", ["top-paths", "labels", "suspicious"])
+def test_main_workers(query, capsys):
+    main([query, "access.log"])
+    expected = capsys.readouterr().out
+    main([query, "access.log", "--workers", "2"])
+    assert capsys.readouterr().out == expected
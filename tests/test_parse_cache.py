@@ -0,0 +1,109 @@
+import os
+import time
+
+import pytest
+
+import parse_cache
+from columnar import ColumnarReqs
+from main import KNOWN_FRIENDLY_TESTERS, main
+from native_list import ChronoReqs
+from parse_cache import cache_path, cached_parse, load, load_header, save, \
+    source_key
+from regex_parser import COMBINED_PARSER, RegexLineParser
+from reqs_by_ip import ReqByIP
+
+
+@pytest.fixture
+def log_path(tmp_path):
+    path = tmp_path / "access.log"
+    path.write_bytes(open("access.log", "rb").read())
+    return str(path)
+
+
+def test_save_and_load(chrono_reqs, tmp_path):
+    col_reqs = ColumnarReqs.from_req_list(chrono_reqs.req_list, KNOWN_FRIENDLY_TESTERS)
+    path = str(tmp_path / "reqs.ngxc")
+    key = source_key("access.log", KNOWN_FRIENDLY_TESTERS)
+    save(col_reqs, path, key)
+    t0 = time.perf_counter()
+    loaded = load(path, key)
+    t1 = time.perf_counter()
+    print("loading cache took {:.04f}".format(t1 - t0))
+    assert list(loaded.rows()) == chrono_reqs.req_list
+    assert loaded.ignored_ips == KNOWN_FRIENDLY_TESTERS
+    assert loaded.get_paths() == col_reqs.get_paths()
+    assert load(path, dict(key, size=0)) is None
+    assert load(str(tmp_path / "missing.ngxc")) is None
+    (tmp_path / "junk.ngxc").write_bytes(b"junk")
+    assert load(str(tmp_path / "junk.ngxc")) is None
+    content = open(path, "rb").read()
+    corrupt_path = str(tmp_path / "corrupt.ngxc")
+    (tmp_path / "corrupt.ngxc").write_bytes(content[:len(content) // 2])
+    assert load(corrupt_path) is None
+    for corrupt_header in (content[:20], content[:16] + b"\xff" * 100 + content[116:]):
+        (tmp_path / "corrupt.ngxc").write_bytes(corrupt_header)
+        assert load(corrupt_path) is None
+        assert load_header(corrupt_path) is None
+
+
+def test_large_sizes(tmp_path):
+    req_list = [[1663574481, "44.44.44.44".rjust(16), ["GET", "/big", "HTTP/1.1"],
+                 200, 2 ** 32 + 1]]
+    path = str(tmp_path / "reqs.ngxc")
+    save(ColumnarReqs.from_req_list(req_list, set()), path,
+         source_key("access.log", set()))
+    assert list(load(path).rows()) == req_list
+
+
+def test_source_key(log_path, monkeypatch):
+    key = source_key(log_path, set())
+    assert key == source_key(log_path, set())
+    assert key != source_key(log_path, {"1.2.3.4"})
+    assert key != source_key(log_path, set(), COMBINED_PARSER)
+    monkeypatch.setattr(parse_cache, "HASH_BYTES", 1024)
+    small_hash_key = source_key(log_path, set())
+    with open(log_path, "r+b") as log_file:
+        log_file.seek(-10, os.SEEK_END)
+        log_file.write(b"X")
+    os.utime(log_path, ns=(0, key["mtime_ns"]))
+    assert source_key(log_path, set())["sha1"] != small_hash_key["sha1"]
+
+
+@pytest.mark.parametrize("cls", [ChronoReqs, ReqByIP])
+def test_cached_parse(cls, log_path, tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / "cache")
+    expected = cls(open(log_path).read(), KNOWN_FRIENDLY_TESTERS)
+    parsed = cached_parse(cls, log_path, KNOWN_FRIENDLY_TESTERS, cache_dir)
+    assert os.path.exists(cache_path(cache_dir, log_path))
+    assert vars(parsed) == vars(expected)
+
+    def no_parsing(*args):
+        raise AssertionError("should have used the cache")
+    with monkeypatch.context() as patch:
+        patch.setattr(parse_cache, "parse_file_with", no_parsing)
+        loaded = cached_parse(cls, log_path, KNOWN_FRIENDLY_TESTERS, cache_dir)
+    assert vars(loaded) == vars(expected)
+    if cls is ReqByIP:
+        assert list(loaded.by_ip) == list(expected.by_ip)
+    with open(log_path, "a") as log_file:
+        log_file.write('44.44.44.44 - - [19/Sep/2022:22:01:21 +0000] "GET / HTTP/1.1" 404 153 "-" "-"\n')
+    reparsed = cached_parse(cls, log_path, KNOWN_FRIENDLY_TESTERS, cache_dir)
+    assert vars(reparsed) != vars(expected)
+
+
+def test_main_cache_dir(tmp_path):
+    main(["access.log", "--cache-dir", str(tmp_path)])
+    main(["access.log", "--cache-dir", str(tmp_path)])
+    assert len(os.listdir(tmp_path)) == 1
+
+
+def test_line_parser_invalidates(log_path, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    cached_parse(ChronoReqs, log_path, set(), cache_dir)
+    short_parser = RegexLineParser.from_log_format(
+        '$remote_addr - $remote_user [$time_local] "$request" $status '
+        '$body_bytes_sent')
+    expected = ChronoReqs(open(log_path).read(), set(), short_parser)
+    parsed = cached_parse(ChronoReqs, log_path, set(), cache_dir,
+                          line_parser=short_parser)
+    assert parsed.req_list == expected.req_list
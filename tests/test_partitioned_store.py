@@ -0,0 +1,137 @@
+import datetime
+import os
+from unittest.mock import patch
+
+import pytest
+
+import partitioned_store
+from native_list import ChronoReqs
+from parse_cache import load_header
+from partitioned_store import PartitionQuery, PartitionedStore, in_bloom, main, \
+    make_bloom, time_query
+
+LOWER = datetime.datetime(2022, 9, 5, 10, 30)
+UPPER = datetime.datetime(2022, 9, 7, 2, 15, 30)
+DAY = datetime.timedelta(days=1)
+
+
+@pytest.fixture(scope="module", params=["hour", "day"])
+def store(request, chrono_reqs, tmp_path_factory):
+    store = PartitionedStore(str(tmp_path_factory.mktemp("store")), request.param)
+    store.add(chrono_reqs.req_list)
+    return store
+
+
+def test_partitions(store, chrono_reqs):
+    partitions = store.partitions()
+    assert list(partitions) == sorted(partitions)
+    assert all(names == [name] for name, names in partitions.items())
+    segments = store.segments()
+    assert list(segments) == list(partitions)
+    assert sum(x["rows"] for x in segments.values()) == len(chrono_reqs.req_list)
+    for meta in segments.values():
+        assert meta["start"] <= meta["min_epoch"] <= meta["max_epoch"] < \
+            meta["start"] + store.step
+    assert store.load().req_list == chrono_reqs.req_list
+
+
+def test_between(store, chrono_reqs):
+    assert store.between(LOWER, UPPER).req_list == list(chrono_reqs.between(LOWER, UPPER))
+
+
+def test_failures_per_period(store, chrono_reqs):
+    assert store.failures_per_period(DAY) == \
+        ChronoReqs.failures_per_period(chrono_reqs.req_list, DAY)
+    assert store.failures_per_period(DAY, LOWER, UPPER, counts_only=True) == \
+        ChronoReqs.failures_per_period(
+            chrono_reqs.between(LOWER, UPPER), DAY, counts_only=True)
+
+
+def test_get_paths(store, chrono_reqs):
+    assert store.get_paths() == ChronoReqs.get_paths(chrono_reqs.req_list)
+    assert store.get_paths(LOWER, UPPER) == \
+        ChronoReqs.get_paths(chrono_reqs.between(LOWER, UPPER))
+
+
+def test_ip_and_path(store, chrono_reqs):
+    assert store.load(PartitionQuery(ip="66.249.70.0")).req_list == \
+        chrono_reqs.reqs_from("66.249.70.0")
+    assert store.load(PartitionQuery(path="/robots.txt")).req_list == \
+        chrono_reqs.reqs_for_path("/robots.txt")
+    assert store.load(PartitionQuery(path="/never/requested")).req_list == []
+
+
+def test_pruning(store):
+    segments = store.segments()
+    query = time_query(LOWER, UPPER, statuses=(400, 499))
+    wanted = [name for name, meta in segments.items() if query.could_match(meta)]
+    assert 0 < len(wanted) < len(segments)
+    with patch.object(partitioned_store, "load", wraps=partitioned_store.load) as load:
+        store.failures_per_period(DAY, LOWER, UPPER)
+    assert sorted(x.args[0] for x in load.call_args_list) == \
+        [store.partition_path(x) for x in wanted]
+
+
+def test_workers(store, chrono_reqs):
+    assert store.between(LOWER, UPPER, workers=2).req_list == \
+        list(chrono_reqs.between(LOWER, UPPER))
+    assert store.get_paths(workers=2) == ChronoReqs.get_paths(chrono_reqs.req_list)
+
+
+def test_bloom():
+    paths = [f"/p{i}" for i in range(1000)]
+    bloom = make_bloom(paths)
+    assert all(in_bloom(x, bloom) for x in paths)
+    assert sum(in_bloom(f"/q{i}", bloom) for i in range(1000)) < 30
+    assert not in_bloom("/", make_bloom([]))
+
+
+def test_adds_make_segments(chrono_reqs, tmp_path):
+    store = PartitionedStore(str(tmp_path))
+    req_list = chrono_reqs.req_list
+    store.add(req_list[1::2])
+    mtimes = {x: os.stat(store.partition_path(x)).st_mtime_ns for x in store.segments()}
+    with patch.object(partitioned_store, "FLUSH_ROWS", 1000):
+        store.add(req_list[::2])
+    # Existing segments are never rewritten.
+    assert all(os.stat(store.partition_path(x)).st_mtime_ns == mtime
+               for x, mtime in mtimes.items())
+    partitions = store.partitions()
+    assert max(map(len, partitions.values())) > 2
+    for query_store in (store, PartitionedStore(str(tmp_path))):
+        assert [x[0] for x in query_store.load().req_list] == chrono_reqs.times
+        assert sorted(map(str, query_store.load().req_list)) == sorted(map(str, req_list))
+        assert query_store.get_paths() == ChronoReqs.get_paths(req_list)
+    store.compact()
+    assert list(store.partitions()) == list(partitions)
+    assert all(names == [name] for name, names in store.partitions().items())
+    assert [x[0] for x in store.load().req_list] == chrono_reqs.times
+    assert sorted(map(str, store.load(PartitionQuery(ip="66.249.70.0")).req_list)) == \
+        sorted(map(str, chrono_reqs.reqs_from("66.249.70.0")))
+
+
+def test_granularity_is_kept(tmp_path):
+    PartitionedStore(str(tmp_path), "day")
+    assert PartitionedStore(str(tmp_path)).granularity == "day"
+    with pytest.raises(ValueError):
+        PartitionedStore(str(tmp_path), "hour")
+    assert os.listdir(tmp_path) == ["store.json"]
+    with patch.object(partitioned_store, "STORE_VERSION", 1):
+        with pytest.raises(ValueError):
+            PartitionedStore(str(tmp_path))
+
+
+def test_main(chrono_reqs, tmp_path):
+    main([str(tmp_path), "access.log", "--granularity", "day"])
+    store = PartitionedStore(str(tmp_path))
+    assert len(store.partitions()) == 19
+    assert store.load().req_list == chrono_reqs.req_list
+    assert load_header(store.partition_path("220901"))["meta"]["min_epoch"] == \
+        chrono_reqs.times[0]
+    assert load_header(str(tmp_path / "store.json")) is None
+    assert load_header(str(tmp_path / "missing.ngxc")) is None
+    main([str(tmp_path), "access.log"])
+    assert len(store.segments()) == 2 * 19
+    main([str(tmp_path), "--compact"])
+    assert len(PartitionedStore(str(tmp_path)).segments()) == 19
+    assert store.load().req_list == sorted(chrono_reqs.req_list * 2, key=lambda x: x[0])
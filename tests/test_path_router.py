@@ -0,0 +1,82 @@
+import random
+import time
+
+import pytest
+
+from native_list import ChronoReqs
+from path_router import PatternRouter, PrefixRouter, pattern_router, prefix_router
+
+
+def first_prefix(prefixes, path):
+    return next((x for x in prefixes if path.startswith(x)), None)
+
+
+def first_pattern(patterns, path):
+    import re
+    return next((x for x in patterns if re.match(x, path)), None)
+
+
+@pytest.mark.parametrize("prefixes", [
+    ["/old/", "/new/", "/blog/", "/feed/", "/static/", "/wordpress/", "/wp/", "/"],
+    # Broader prefixes first must still win.
+    ["/", "/wp/", "/wp"],
+    ["/wp/xmlrpc", "/wp", "/wp/"],
+    ["", "/a"],
+    [],
+])
+def test_prefix_router_first_match(prefixes, chrono_reqs):
+    router = PrefixRouter(prefixes)
+    for path in {req[2][1] for req in chrono_reqs.req_list if len(req[2]) > 2}:
+        assert router.match(path) == first_prefix(prefixes, path)
+
+
+def test_pattern_router_first_match(chrono_reqs):
+    patterns = [r".*\.php$", r"/wp", r"/(?P<dir>static|feed)/", r"/\.env", r"/"]
+    router = PatternRouter(patterns)
+    assert router.combined is not None
+    for path in {req[2][1] for req in chrono_reqs.req_list if len(req[2]) > 2}:
+        assert router.match(path) == first_pattern(patterns, path)
+
+
+@pytest.mark.parametrize("patterns", [
+    [r"/(a)\1", r"/a"],
+    [r"/(?P<x>a)(?P=x)", r"/a"],
+    [r"/(?P<_0>b)", r"/a"],
+])
+def test_pattern_router_fallback(patterns):
+    router = PatternRouter(patterns)
+    assert router.combined is None
+    assert router.match("/aa") == first_pattern(patterns, "/aa")
+    assert router.match("/b") == first_pattern(patterns, "/b")
+    assert router.match("/c") is None
+
+
+def test_routers_cached():
+    assert prefix_router(("/a", "/b")) is prefix_router(("/a", "/b"))
+    assert pattern_router(("/a",)) is pattern_router(("/a",))
+
+
+def test_divide_reqs_by_patterns(chrono_reqs):
+    pattern_dict = {x: [] for x in [r".*xmlrpc\.php", r"/static/"]}
+    unmatched = ChronoReqs.divide_reqs_by_patterns(pattern_dict, chrono_reqs.req_list)
+    assert len(pattern_dict[r".*xmlrpc\.php"]) == len(
+        ChronoReqs.get_reqs_matching(r".*xmlrpc\.php", chrono_reqs.req_list))
+    assert sum(map(len, pattern_dict.values())) + len(unmatched) == len(
+        [req for req in chrono_reqs.req_list if len(req[2]) > 2])
+
+
+def test_many_prefixes_benchmark(chrono_reqs):
+    rng = random.Random(0)
+    paths = list({req[2][1] for req in chrono_reqs.req_list if len(req[2]) > 2})
+    prefixes = list(dict.fromkeys(x[:rng.randint(2, 12)] for x in rng.sample(paths, 300)))
+    t0 = time.perf_counter()
+    expected = [first_prefix(prefixes, req[2][1]) for req in chrono_reqs.req_list
+                if len(req[2]) > 2]
+    t1 = time.perf_counter()
+    prefix_dict = {x: [] for x in prefixes}
+    unmatched = ChronoReqs.divide_reqs_by_path_prefixes(prefix_dict, chrono_reqs.req_list)
+    t2 = time.perf_counter()
+    print("startswith loop took {:.04f}, trie took {:.04f}".format(t1 - t0, t2 - t1))
+    assert len(unmatched) == expected.count(None)
+    assert {k: len(v) for k, v in prefix_dict.items()} == {
+        k: expected.count(k) for k in prefixes}
@@ -0,0 +1,107 @@
+import argparse
+import csv
+import datetime
+import io
+import json
+import subprocess
+import sys
+from collections import Counter
+
+import pytest
+
+from main import main
+from native_list import ChronoReqs
+from queries import QUERIES, parse_period
+
+
+def run_query(capsys, *args):
+    main(list(args))
+    return json.loads(capsys.readouterr().out)
+
+
+def test_top_ips(capsys, chrono_reqs):
+    rows = run_query(capsys, "top-ips", "access.log", "--top", "5")
+    counts = Counter(req[1].strip() for req in chrono_reqs.req_list)
+    assert [x["requests"] for x in rows] == [count for _, count in counts.most_common(5)]
+    for row in rows:
+        assert row["requests"] == counts[row["ip"]]
+        assert row["failures"] == chrono_reqs.count_failures_by_ip()[row["ip"]]
+
+
+def test_top_paths(capsys, chrono_reqs):
+    rows = run_query(capsys, "top-paths", "access.log")
+    assert len(rows) == 20
+    paths = ChronoReqs.get_paths(chrono_reqs.req_list)
+    assert [(x["path"], x["requests"]) for x in rows[:3]] == paths.most_common(3)
+    assert rows[0]["failures"] == len(ChronoReqs.get_failures(chrono_reqs.reqs_for_path(rows[0]["path"])))
+
+
+def test_failures_per_period(capsys, chrono_reqs):
+    rows = run_query(capsys, "failures-per-period", "access.log", "--period", "1d")
+    assert sum(x["failures"] for x in rows) == len(ChronoReqs.get_failures(chrono_reqs.req_list))
+    starts = [datetime.datetime.fromisoformat(x["start"]) for x in rows]
+    assert all(b - a == datetime.timedelta(days=1) for a, b in zip(starts, starts[1:]))
+
+
+def test_suspicious(capsys, chrono_reqs):
+    rows = run_query(capsys, "suspicious", "access.log", "--top", "100")
+    unusual = Counter(req[1].strip() for req in chrono_reqs.req_list if len(req[2]) > 3)
+    assert {x["ip"]: x["unusual"] for x in rows if x["unusual"]} == dict(unusual)
+    assert [x["unusual"] for x in rows] == sorted((x["unusual"] for x in rows), reverse=True)
+    flagged = [x for x in rows if x["reason"]]
+    assert flagged and all(x["deny"].startswith(f"deny {x['ip']};") for x in flagged)
+
+
+def test_suspicious_unclosed_request_line(capsys, tmp_path):
+    log_path = tmp_path / "access.log"
+    log_path.write_text(
+        '44.44.44.1 - - [19/Sep/2022:08:01:21 +0000] "GET /unclosed 200 153\n'
+        '44.44.44.2 - - [19/Sep/2022:08:01:22 +0000] "GET / HTTP/1.1 x" 400 153 "-" "-"\n')
+    rows = run_query(capsys, "suspicious", str(log_path))
+    assert [(x["ip"], x["requests"], x["failures"], x["unusual"]) for x in rows] == [
+        ("44.44.44.2", 1, 1, 1)]
+
+
+def test_csv(capsys):
+    main(["top-ips", "access.log", "--format", "csv", "--top", "3"])
+    rows = list(csv.reader(io.StringIO(capsys.readouterr().out)))
+    assert rows[0] == list(QUERIES["top-ips"].fields)
+    assert len(rows) == 4
+
+
+@pytest.mark.parametrize("period,seconds", [("90", 90), ("90s", 90), ("15m", 900),
+                                            ("1h", 3600), ("2d", 172800)])
+def test_parse_period(period, seconds):
+    assert parse_period(period) == datetime.timedelta(seconds=seconds)
+
+
+@pytest.mark.parametrize("period", ["", "0", "1w", "h", "-1h"])
+def test_bad_period(period):
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_period(period)
+
+
+def test_query_inputs(capsys, tmp_path):
+    expected = run_query(capsys, "top-ips", "access.log")
+    assert run_query(capsys, "top-ips", "--source", "access.log") == expected
+    assert run_query(capsys, "top-ips", "access.log", "--cache-dir", str(tmp_path)) == expected
+    assert run_query(capsys, "top-ips", "access.log", "--workers", "2") == expected
+    assert run_query(capsys, "top-ips", "access.log", "--log-format", "combined",
+                     "--follow", str(tmp_path / "state.json"))
+
+
+def test_script_starts_light():
+    # Heavy modules aren't imported unless the arguments need them.
+    heavy = "{'asyncio', 'concurrent.futures', 'requests', 'ipaddress', 'bz2', 'lzma', 'mmap'}"
+    already = subprocess.run(
+        [sys.executable, "-c", f"import sys; print(sorted({heavy} & set(sys.modules)))"],
+        capture_output=True, text=True, check=True).stdout.strip()
+    out = subprocess.run(
+        [sys.executable, "-c", "import sys, main; main.main(sys.argv[1:]); "
+                               f"print(sorted({heavy} & set(sys.modules)))",
+         "top-ips", "access.log", "--top", "1"],
+        capture_output=True, text=True, check=True).stdout.splitlines()
+    assert json.loads(out[0])[0]["requests"] > 1000
+    assert out[1] == already
+    assert subprocess.run(["../nginx_digester/main.py", "top-paths", "access.log", "--format", "csv"],
+                          capture_output=True, text=True).stdout.startswith("path,requests,failures")
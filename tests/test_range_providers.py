@@ -0,0 +1,124 @@
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+import range_providers
+from range_providers import PROVIDERS, RangeProvider, aws_ranges
+
+RANGES = {"prefixes": [{"ipv4Prefix": "66.249.64.0/27"},
+                       {"ipv6Prefix": "2001:4860:4801:10::/64"}]}
+
+
+class FakeRangesHandler(BaseHTTPRequestHandler):
+    etag = '"v1"'
+    body = json.dumps(RANGES).encode()
+    requests_seen = []
+
+    def do_GET(self):
+        self.requests_seen.append(self.headers.get("If-None-Match"))
+        if self.path == "/broken":
+            self.send_response(500)
+            self.end_headers()
+        elif self.headers.get("If-None-Match") == self.etag:
+            self.send_response(304)
+            self.end_headers()
+        else:
+            self.send_response(200)
+            self.send_header("ETag", self.etag)
+            self.send_header("Content-Length", str(len(self.body)))
+            self.end_headers()
+            self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    FakeRangesHandler.requests_seen = []
+    server = HTTPServer(("127.0.0.1", 0), FakeRangesHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:{}".format(server.server_port)
+    server.shutdown()
+    server.server_close()
+
+
+def test_fetches_once_per_ttl(server_url, tmp_path):
+    provider = RangeProvider("fake", server_url + "/ranges.json")
+    index = provider.get(str(tmp_path))
+    assert "66.249.64.1" in index and "2001:4860:4801:10::1" in index
+    assert "1.2.3.4" not in index
+    provider.get(str(tmp_path))
+    assert FakeRangesHandler.requests_seen == [None]
+
+
+def test_revalidates_with_etag(server_url, tmp_path):
+    provider = RangeProvider("fake", server_url + "/ranges.json", ttl=0)
+    provider.get(str(tmp_path))
+    index = provider.get(str(tmp_path))
+    assert "66.249.64.1" in index
+    assert FakeRangesHandler.requests_seen == [None, '"v1"']
+    with open(tmp_path / "fake.meta.json") as meta_file:
+        assert json.load(meta_file)["etag"] == '"v1"'
+
+
+def test_falls_back_to_stale_copy(server_url, tmp_path):
+    RangeProvider("fake", server_url + "/ranges.json").get(str(tmp_path))
+    broken = RangeProvider("fake", server_url + "/broken", ttl=0)
+    assert "66.249.64.1" in broken.get(str(tmp_path))
+
+
+def test_falls_back_to_snapshot(server_url, tmp_path):
+    snapshot = tmp_path / "snapshot.json"
+    snapshot.write_text(json.dumps({"prefixes": [{"ipv4Prefix": "10.0.0.0/8"}]}))
+    provider = RangeProvider("fake", server_url + "/broken", snapshot=str(snapshot))
+    assert "10.1.2.3" in provider.get(str(tmp_path / "cache"))
+    without_snapshot = RangeProvider("fake", server_url + "/broken")
+    with pytest.raises(Exception):
+        without_snapshot.get(str(tmp_path / "cache"))
+
+
+def test_failures_wait_to_retry(server_url, tmp_path):
+    RangeProvider("fake", server_url + "/ranges.json").get(str(tmp_path / "stale"))
+    snapshot = tmp_path / "snapshot.json"
+    snapshot.write_text(json.dumps({"prefixes": [{"ipv4Prefix": "10.0.0.0/8"}]}))
+    for cache_dir, ip in (("stale", "66.249.64.1"), ("none", "10.1.2.3")):
+        broken = RangeProvider("fake", server_url + "/broken", snapshot=str(snapshot),
+                               ttl=0)
+        FakeRangesHandler.requests_seen = []
+        assert ip in broken.get(str(tmp_path / cache_dir))
+        assert ip in broken.get(str(tmp_path / cache_dir))
+        assert len(FakeRangesHandler.requests_seen) == 1
+        broken.retry_after = 0
+        assert ip in broken.get(str(tmp_path / cache_dir))
+        assert len(FakeRangesHandler.requests_seen) == 2
+
+
+def test_unusable_cache_dir(server_url, tmp_path):
+    (tmp_path / "file").write_text("")
+    snapshot = tmp_path / "snapshot.json"
+    snapshot.write_text(json.dumps({"prefixes": [{"ipv4Prefix": "10.0.0.0/8"}]}))
+    provider = RangeProvider("fake", server_url + "/ranges.json", snapshot=str(snapshot))
+    # Neither can be created, the first's parent being a file too.
+    for cache_dir in (str(tmp_path / "file" / "cache"), "/dev/null/cache"):
+        assert "10.1.2.3" in provider.get(cache_dir)
+        with pytest.raises(OSError):
+            RangeProvider("fake", server_url + "/ranges.json").get(cache_dir)
+    assert FakeRangesHandler.requests_seen == []
+
+
+def test_googlebot_snapshot_bundled(tmp_path, monkeypatch):
+    monkeypatch.setattr(range_providers, "DEFAULT_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(PROVIDERS["googlebot"], "url", "http://127.0.0.1:9/")
+    assert "66.249.64.1" in PROVIDERS["googlebot"].get()
+    assert not os.path.exists(tmp_path / "googlebot.json")
+
+
+def test_aws_ranges():
+    index = aws_ranges({"prefixes": [{"ip_prefix": "3.5.140.0/22"}],
+                        "ipv6_prefixes": [{"ipv6_prefix": "2600:1f00::/24"}]})
+    assert "3.5.141.1" in index and "2600:1f00::1" in index
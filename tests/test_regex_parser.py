@@ -0,0 +1,131 @@
+import time
+
+import pytest
+
+from line_parser import LogLineParser, format_epoch
+from main import KNOWN_FRIENDLY_TESTERS, main
+from native_list import ChronoReqs
+from parallel import parse_file
+from regex_parser import COMBINED_PARSER, RegexLineParser
+from reqs_by_ip import ReqByIP
+
+COMBINED_FORMAT = ('$remote_addr - $remote_user [$time_local] "$request" '
+                   '$status $body_bytes_sent "$http_referer" "$http_user_agent"')
+MAIN_FORMAT = COMBINED_FORMAT + ' "$http_x_forwarded_for"'
+
+
+def find_parse(line):
+    # The original, multi pass, parse.
+    finds = LogLineParser.find_ip_and_timestamp(line)
+    if finds is None:
+        return
+    req = [finds[1]]
+    LogLineParser.append_rest_of_line(req, line, finds[2])
+    return finds[0], req
+
+
+@pytest.fixture(scope="module")
+def log_lines():
+    with open("access.log") as log_file:
+        return log_file.read().split("\n")
+
+
+@pytest.mark.parametrize("line, expected", [
+    ('44.44.44.44 - - [19/Sep/2022:08:01:21 +0000] "GET / HTTP/1.1" 404 153 "-" "Mozilla/5.0 (compatible; CensysInspect/1.1; +https://about.censys.io/)" "-"',
+     ("44.44.44.44", ["220919 080121", ["GET", "/", "HTTP/1.1"], 404, 153, "-",
+                      "Mozilla/5.0 (compatible; CensysInspect/1.1; +https://about.censys.io/)", "-"])),
+    (r'44.44.44.44 - - [19/Sep/2022:08:01:21 +0500] "YOYO\x22 DA RUAN\x22 YANKA" 400 157 "-" "-"',
+     ("44.44.44.44", ["220919 030121", [r"YOYO\x22", "DA", r"RUAN\x22", "YANKA"], 400, 157, "-", "-"])),
+    ('44.44.44.44 - - [19/Sep/2022:08:01:21 +0000] "" 400 0',
+     ("44.44.44.44", ["220919 080121", [], 400, 0])),
+    ('44.44.44.44 - - [19/Sep/2022:08:01:21 +0000] "GET /',
+     ("44.44.44.44", ["220919 080121"])),
+    ("/docker-entrypoint.sh: Configuration complete; ready for start up", None),
+    ("2022/09/19 08:01:21 [notice] 1#1: start worker processes", None),
+])
+def test_combined_parser(line, expected):
+    ip_req = COMBINED_PARSER.parse(line)
+    if expected is None:
+        assert ip_req is None
+    else:
+        assert (ip_req[0], [format_epoch(ip_req[1][0]), *ip_req[1][1:]]) == expected
+    assert ip_req == find_parse(line)
+
+
+def test_combined_parser_matches_log_line_parser(log_lines):
+    for line in log_lines:
+        assert COMBINED_PARSER.parse(line) == find_parse(line)
+
+
+def test_from_log_format(log_lines):
+    parser = RegexLineParser.from_log_format(COMBINED_FORMAT)
+    n_parsed = 0
+    for line in log_lines:
+        expected = find_parse(line)
+        if expected is not None:
+            assert parser.parse(line) == expected
+            n_parsed += 1
+    assert n_parsed == 16908
+    # Unlike find_ip_and_timestamp, this can handle a remote_user.
+    assert parser.parse('99.73.65.0 - 8hYTSUFk [06/Sep/2022:23:50:36 +0000] '
+                        '"GET / HTTP/1.1" 422 398 "-" "-"')[0] == "99.73.65.0"
+    # Our log was written without x_forwarded_for.
+    parser = RegexLineParser.from_log_format(MAIN_FORMAT)
+    assert not any(parser.parse(line) for line in log_lines)
+
+
+def test_from_log_format_custom():
+    parser = RegexLineParser.from_log_format(
+        '$remote_addr [$time_local] $request_time "$request" $status '
+        '${body_bytes_sent} "$http_user_agent" $remote_addr')
+    assert parser.optional_vars == ("http_user_agent",)
+    ip, req = parser.parse(
+        '1.2.3.4 [19/Sep/2022:08:01:21 +0000] 0.001 "GET /a HTTP/1.1" 200 5 "curl/7.0" 1.2.3.4')
+    assert ip == "1.2.3.4"
+    assert req[1:] == [["GET", "/a", "HTTP/1.1"], 200, 5, "curl/7.0"]
+    with pytest.raises(ValueError):
+        RegexLineParser.from_log_format('$remote_addr "$request" $status')
+
+
+@pytest.mark.parametrize("cls", [ChronoReqs, ReqByIP])
+def test_line_parser_option(log_text, cls):
+    with open("access.log") as log_file:
+        with_regex = cls(log_file, KNOWN_FRIENDLY_TESTERS, COMBINED_PARSER)
+    without = cls(log_text, KNOWN_FRIENDLY_TESTERS)
+    assert vars(with_regex).keys() == vars(without).keys()
+    assert getattr(with_regex, "req_list", None) == getattr(without, "req_list", None)
+    assert getattr(with_regex, "by_ip", None) == getattr(without, "by_ip", None)
+    in_parallel = parse_file(cls, "access.log", KNOWN_FRIENDLY_TESTERS, 2,
+                             COMBINED_PARSER)
+    assert getattr(in_parallel, "req_list", None) == getattr(without, "req_list", None)
+    assert getattr(in_parallel, "by_ip", None) == getattr(without, "by_ip", None)
+
+
+@pytest.mark.parametrize("query", ["top-paths", "labels", "suspicious"])
+def test_main_log_format(query, log_lines, tmp_path, capsys):
+    # Leave out the lines with a remote_user, which only from_log_format
+    # parses.
+    parser = RegexLineParser.from_log_format(COMBINED_FORMAT)
+    log_path = str(tmp_path / "access.log")
+    with open(log_path, "w") as log_file:
+        log_file.write("\n".join(
+            x for x in log_lines if parser.parse(x) == find_parse(x)))
+    main([query, log_path])
+    expected = capsys.readouterr().out
+    main([query, log_path, "--log-format", "combined"])
+    assert capsys.readouterr().out == expected
+    main([query, log_path, "--log-format", COMBINED_FORMAT])
+    assert capsys.readouterr().out == expected
+
+
+@pytest.mark.parametrize("name, parse", [
+    ("find/split", find_parse),
+    ("combined regex", COMBINED_PARSER.parse),
+    ("log_format regex", RegexLineParser.from_log_format(COMBINED_FORMAT).parse),
+])
+def test_parser_benchmark(name, parse, log_lines):
+    t0 = time.perf_counter()
+    for line in log_lines:
+        parse(line)
+    t1 = time.perf_counter()
+    print("{} took {:.0f}ns per line".format(name, 1e9 * (t1 - t0) / len(log_lines)))
@@ -1,10 +1,12 @@
 import datetime
 import time
+from functools import partial
 from unittest.mock import Mock
 
 import pytest
 
 from main import KNOWN_FRIENDLY_TESTERS
+from line_parser import format_epoch
 from reqs_by_ip import ReqByIP, LogLineParser
 
 
@@ -20,13 +22,16 @@ def test_index_line_by_ip_variables(bit_after_time, expected_list):
     fake_instance = Mock(ReqByIP)
     fake_instance.by_ip = {}
     fake_instance.ignored_ips = set()
+    fake_instance.line_parser = None
     fake_instance.find_ip_and_timestamp = LogLineParser.find_ip_and_timestamp
     fake_instance.append_rest_of_line = LogLineParser.append_rest_of_line
+    fake_instance.parse_line = partial(ReqByIP.parse_line, fake_instance)
     line = '44.44.44.44 - - [19/Sep/2022:08:01:21 +0000] ' + bit_after_time
     ReqByIP.index_line_by_ip(fake_instance, line)
     assert fake_instance.by_ip.keys() == {"44.44.44.44"}
     reqs = fake_instance.by_ip["44.44.44.44"]
     req = reqs[0]
+    req = [format_epoch(req[0]), *req[1:]]
     expected_list = ["220919 080121"] + expected_list
     for i in range(len(expected_list)):
         assert req[i] == expected_list[i]
@@ -51,16 +56,24 @@ def test_requests_by_ip():
             assert len(line) == 7
 
 
-def test_requests_by_ip_at_scale():
+def test_iter_requests_by_ip(log_text):
+    with open("access.log") as log_file:
+        ip_reqs = list(ReqByIP((), KNOWN_FRIENDLY_TESTERS).iter_requests(log_file))
+    req_dict = ReqByIP(log_text, KNOWN_FRIENDLY_TESTERS)
+    assert len(ip_reqs) == sum(len(reqs) for reqs in req_dict.by_ip.values())
+    assert ip_reqs[0] == ("18.184.180.0", req_dict.by_ip["18.184.180.0"][0])
+
+
+def test_requests_by_ip_at_scale(log_text):
     # 16,912 lines
-    req_dict = ReqByIP(open("access.log").read(), KNOWN_FRIENDLY_TESTERS)
+    req_dict = ReqByIP(log_text, KNOWN_FRIENDLY_TESTERS)
     ips_by_reqs = ReqByIP.most_requests(req_dict.by_ip)
     fails_per_ip = ReqByIP.count_failures_from_dict(req_dict.by_ip)
 
 
-def test_filter_dict_between_status_code():
+def test_filter_dict_between_status_code(log_text):
     # This shows how slow time slicing the IP indexed dict is.
-    req_dict = ReqByIP(open("access.log").read(), KNOWN_FRIENDLY_TESTERS)
+    req_dict = ReqByIP(log_text, KNOWN_FRIENDLY_TESTERS)
     period = datetime.timedelta(hours=2)
     date_cursor = datetime.datetime(2022, 9, 1, 21, 0)
     failure_dict = ReqByIP.filter_dict_between_status_code(req_dict.by_ip, 400, 499)
@@ -72,6 +85,10 @@ def test_filter_dict_between_status_code():
         date_cursor += period
     t1 = time.time()
     print("filter_between_times took {:.04f}".format(t1 - t0))
+    assert sum(failures_by_period.values()) == sum(
+        len(reqs) for reqs in ReqByIP.filter_between_times(
+            failure_dict, datetime.datetime(2022, 9, 1, 21, 0),
+            datetime.datetime(2022, 9, 2, 11, 0)).values())
 
 
 
@@ -0,0 +1,47 @@
+from collections import Counter
+
+import pytest
+
+from main import KNOWN_FRIENDLY_TESTERS
+from native_list import ChronoReqs
+from synthetic_log import LogProfile, generate_lines, main, write_log
+
+
+@pytest.fixture(scope="module")
+def profile():
+    return LogProfile.from_log("access.log")
+
+
+@pytest.fixture(scope="module")
+def sample(log_text):
+    return ChronoReqs(log_text, set())
+
+
+def test_deterministic(profile):
+    assert list(generate_lines(1000, profile, seed=3)) == list(generate_lines(1000, profile, seed=3))
+    assert list(generate_lines(1000, profile, seed=3)) != list(generate_lines(1000, profile, seed=4))
+
+
+def test_resembles_sample(profile, sample):
+    reqs = ChronoReqs(generate_lines(50000, profile), set())
+    # A few lines of the sample aren't requests, and these are copied too.
+    assert len(sample.req_list) / 16912 - 0.01 < len(reqs.req_list) / 50000 <= 1
+    assert reqs.times == sorted(reqs.times)
+    assert 40 < len(reqs.req_list) / (reqs.times[-1] - reqs.times[0]) < 60
+    for field in (3, 6):
+        expected = Counter(x[field] for x in sample.req_list if len(x) > field)
+        generated = Counter(x[field] for x in reqs.req_list if len(x) > field)
+        for value, count in expected.most_common(3):
+            assert abs(generated[value] / 50000 - count / 16912) < 0.02
+    distinct_ips = len({x[1] for x in reqs.req_list})
+    assert distinct_ips > 50000 * profile.new_ip_rate
+    # Bots keep their user agents.
+    googlebot = [x for x in reqs.req_list if x[1].strip() == "66.249.70.0"]
+    assert googlebot and all("Googlebot" in x[6] for x in googlebot if len(x) > 6)
+
+
+def test_main(tmp_path):
+    main([str(tmp_path / "synthetic.log"), "--lines", "2e3", "--seed", "1"])
+    write_log(str(tmp_path / "again.log"), 2000, seed=1)
+    assert (tmp_path / "synthetic.log").read_text() == (tmp_path / "again.log").read_text()
+    assert len(ChronoReqs(open(tmp_path / "synthetic.log"), KNOWN_FRIENDLY_TESTERS).req_list) > 1900